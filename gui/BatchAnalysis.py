@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Analyses all LagBox logs of a directory at once and writes one summary table with a row per log.
+# Results are cached by path, modification time and size of each log, so a re-run only processes new or changed files.
+#
+# usage: python BatchAnalysis.py [log directory (default: ../log)] [--plot] [--workers N] [--output file]
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import LatencyStats
+import LogFile
+
+
+class Constants:
+    LOG_DIRECTORY = '../log'
+    SUMMARY_FILE_NAME = 'summary.csv'
+    CACHE_FILE_NAME = '.analysis_cache.json'
+    CSV_DELIMITER = ';'
+
+    # Name of the logs created by openLogFile in fileLog.c: mode_device_pollingRatems_number.csv
+    LOG_FILE_NAME_PATTERN = re.compile(r'^(?P<mode>[^_]+)_(?P<device>.+)_(?P<pollingRate>-?\d+)ms_'
+                                       r'(?P<number>\d+)\.csv$')
+
+    SUMMARY_COLUMNS = ['file', 'device', 'button', 'pollingRate'] + LatencyStats.Constants.SUMMARY_FIELDS + \
+                      ['pollingPeriod', 'pollingWait', 'fixedLatency']  # Estimated by PollingAnalysis (in ms)
+
+
+# Get the paths of all LagBox logs in a directory, sorted by name
+def find_logs(directory):
+    paths = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and Constants.LOG_FILE_NAME_PATTERN.match(entry.name):
+            paths.append(entry.path)
+    return sorted(paths)
+
+
+# Extract device name and polling rate from the file name of a log
+def parse_file_name(file_path):
+    match = Constants.LOG_FILE_NAME_PATTERN.match(os.path.basename(file_path))
+    if match is None:
+        return {'device': '', 'pollingRate': ''}
+    return {'device': match.group('device'), 'pollingRate': int(match.group('pollingRate'))}
+
+
+# Parse a single log, calculate its stats and optionally create its plot. Runs in a worker process.
+def analyse_log(file_path, plot):
+    log = LogFile.load_log(file_path)
+    latencies = log.latencies_ms()
+
+    row = {'file': os.path.basename(file_path)}
+    row.update(parse_file_name(file_path))
+    row['device'] = log.metadata.get('Device', row['device'])
+    row['button'] = log.metadata.get('Button', '')
+    row.update(LatencyStats.summarize(latencies))
+
+    import PollingAnalysis  # Imports this module for parse_file_name
+    polling = PollingAnalysis.analyse(log)
+    row.update({'pollingPeriod': '', 'pollingWait': '', 'fixedLatency': ''})
+    if polling is not None:
+        row.update({'pollingPeriod': polling['period'] / 1000, 'pollingWait': polling['meanWait'] / 1000,
+                    'fixedLatency': polling['fixedMean'] / 1000})
+
+    if plot and len(latencies) > 0:
+        import DataPlotter  # Only needed (and only importable with matplotlib) when plots should be created
+        DataPlotter.DataPlotter().generate_plot(file_path, latencies)
+
+    return row
+
+
+def init_worker():
+    # Workers have no display, so plots need to be rendered without a GUI backend
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+
+
+def load_cache(cache_path):
+    try:
+        with open(cache_path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache_path, cache):
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(cache, file)
+    os.replace(temp_path, cache_path)
+
+
+# A cached result can be used if the log has not changed since and a plot exists if one is requested
+def is_cache_valid(entry, file_stat, plot):
+    if entry is None:
+        return False
+    if entry['mtime'] != file_stat.st_mtime or entry['size'] != file_stat.st_size:
+        return False
+    if 'pollingPeriod' not in entry['row']:
+        return False  # Cached before the polling analysis was added
+    return entry['plotted'] or not plot
+
+
+def write_summary(output_path, rows):
+    with open(output_path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=Constants.SUMMARY_COLUMNS, delimiter=Constants.CSV_DELIMITER,
+                                extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# Analyse all logs of a directory in a process pool and write the summary table. Returns the rows of the table.
+def run_batch(directory=Constants.LOG_DIRECTORY, output_path=None, plot=False, workers=None):
+    if output_path is None:
+        output_path = os.path.join(directory, Constants.SUMMARY_FILE_NAME)
+
+    cache_path = os.path.join(directory, Constants.CACHE_FILE_NAME)
+    cache = load_cache(cache_path)
+
+    paths = find_logs(directory)
+    file_stats = {path: os.stat(path) for path in paths}
+    outdated_paths = [path for path in paths if not is_cache_valid(cache.get(path), file_stats[path], plot)]
+    print('Found', len(paths), 'logs,', len(outdated_paths), 'need to be analysed')
+
+    if len(outdated_paths) > 0:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            futures = {path: executor.submit(analyse_log, path, plot) for path in outdated_paths}
+            for path, future in futures.items():
+                try:
+                    row = future.result()
+                except (OSError, ValueError) as error:
+                    print('Could not analyse', path + ':', error)
+                    continue
+                cache[path] = {'mtime': file_stats[path].st_mtime, 'size': file_stats[path].st_size,
+                               'plotted': plot, 'row': row}
+
+    # Logs that were deleted in the meantime do not need to be cached any more
+    cache = {path: entry for path, entry in cache.items() if path in file_stats}
+    save_cache(cache_path, cache)
+
+    rows = [cache[path]['row'] for path in paths if path in cache]
+    write_summary(output_path, rows)
+    print('Summary of', len(rows), 'logs saved to', output_path)
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyse all LagBox logs of a directory')
+    parser.add_argument('directory', nargs='?', default=Constants.LOG_DIRECTORY)
+    parser.add_argument('--plot', action='store_true', help='create a plot for every log')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--output', default=None, help='path of the summary table')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        sys.exit('Directory missing: ' + args.directory)
+
+    run_batch(args.directory, args.output, args.plot, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Runs a campaign of measurements without the GUI, e.g. overnight on a LagBox without a display. The campaign is an
+# .ini file with the defaults of all jobs in the [campaign] section and one section per job:
+#
+#   [campaign]
+#   tool = c  (or python, see MeasurementWorkflow.Constants.MEASUREMENT_TOOLS; gpio = rpi|simulator for python)
+#   iterations = 1000
+#   tmin = 100
+#   tmax = 10000
+#   early_stop = 0  (target half-width of the confidence intervals in ms, 0 to always run all iterations)
+#   plot = yes
+#   upload = no  (with authors, email and public like on the last pages of the GUI)
+#   attempts = 2  (how often a failed job is tried before it is given up)
+#
+#   [Logitech G203 left button]
+#   device = Logitech G203 Prime  (name like in /proc/bus/input/devices, or: event = event3)
+#   button = 272
+#   type = Mouse  (optional if the type is auto-detected)
+#   name = G203  (optional, name in the log, default is the section name)
+#   ean = 5099206089556  (optional)
+#
+# Every value of [campaign] can be overridden in a job. The jobs run one after another, with the same steps as the GUI:
+# device discovery, bInterval and speed probing, the measurement itself, metadata, plot and upload.
+#
+# The state of the campaign is written to <campaign>.summary.json after every step. It lists every job with its
+# status, log, statistics and error, so it doubles as the machine-readable summary. When the runner is started again
+# (e.g. after a power failure), jobs that are done are skipped and all others are run again. Ctrl+C or SIGTERM stops
+# the running measurement after its current sample, keeps its log and ends the campaign; the job is run again on the
+# next start.
+#
+# usage: python CampaignRunner.py campaign.ini [--summary path] [--restart]
+
+import argparse
+import configparser
+import json
+import os
+import signal
+import sys
+import time
+
+import DeviceInventory
+import LatencyStats
+import LogFile
+import MeasurementWorkflow
+import ResultsIndex
+import Tracing
+import UsbDescriptors
+
+
+class Constants:
+    DEFAULTS_SECTION = 'campaign'
+    DEFAULTS = {
+        'tool': 'c',
+        'gpio': 'rpi',
+        'iterations': str(MeasurementWorkflow.Constants.NUM_TEST_ITERATIONS),
+        'tmin': str(MeasurementWorkflow.Constants.MIN_DELAY),
+        'tmax': str(MeasurementWorkflow.Constants.MAX_DELAY),
+        'early_stop': '0',
+        'early_stop_min_samples': '200',
+        'plot': 'yes',
+        'upload': 'no',
+        'authors': '',
+        'email': '',
+        'public': 'no',
+        'attempts': '2'
+    }
+    SUMMARY_SUFFIX = '.summary.json'
+
+    STATUS_RUNNING = 'running'  # Left in the summary if the runner crashed during the job
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'  # Tried again on the next start until it failed 'attempts' times
+    STATUS_STOPPED = 'stopped'  # Stopped by Ctrl+C or SIGTERM, tried again on the next start
+
+
+class CampaignError(Exception):
+    pass
+
+
+class Job:
+
+    def __init__(self, name, section):
+        self.name = name
+        self.section = section  # configparser section, falls back to the [campaign] section
+
+    # Settings of the job, stored in the summary to notice when the campaign file has been changed
+    def get_settings(self):
+        return {key: self.section[key] for key in sorted(self.section.keys())}
+
+    def get_int(self, key):
+        try:
+            return self.section.getint(key)
+        except ValueError:
+            raise CampaignError(key + ' of ' + self.name + ' is not a number')
+
+
+def load_campaign(file_path):
+    config = configparser.ConfigParser(default_section=Constants.DEFAULTS_SECTION)
+    config.read_dict({Constants.DEFAULTS_SECTION: Constants.DEFAULTS})
+    if len(config.read(file_path)) == 0:
+        raise CampaignError('Campaign file missing: ' + file_path)
+
+    jobs = [Job(name, config[name]) for name in config.sections()]
+    if len(jobs) == 0:
+        raise CampaignError('No jobs in ' + file_path)
+    for job in jobs:
+        if 'button' not in job.section or ('device' not in job.section and 'event' not in job.section):
+            raise CampaignError('Job ' + job.name + ' needs a button and a device or event')
+        if job.section['tool'] not in MeasurementWorkflow.Constants.MEASUREMENT_TOOLS:
+            raise CampaignError('Unknown tool of ' + job.name + ': ' + job.section['tool'])
+    return jobs
+
+
+def load_summary(file_path):
+    try:
+        with open(file_path, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {'jobs': {}}
+    except (OSError, ValueError) as e:
+        raise CampaignError('Could not read the summary ' + file_path + ': ' + str(e))
+
+
+def save_summary(file_path, summary):
+    summary['updated'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    counts = {}
+    for result in summary['jobs'].values():
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    summary['counts'] = counts
+
+    content = json.dumps(summary, indent=1).encode('utf-8')
+    LogFile.write_atomically(file_path, lambda file: file.write(content))
+
+
+# A job is run (again) unless it is done with the same settings and its log still exists, or it failed too often
+def needs_run(job, result):
+    if result is None or result.get('settings') != job.get_settings():
+        return True
+    if result['status'] == Constants.STATUS_DONE:
+        return result.get('log') is None or not os.path.exists(result['log'])
+    if result['status'] == Constants.STATUS_FAILED:
+        return result.get('attempts', 0) < job.get_int('attempts')
+    return True
+
+
+class CampaignRunner:
+
+    def __init__(self, jobs, summary_path, summary):
+        self.jobs = jobs
+        self.summary_path = summary_path
+        self.summary = summary
+        self.device_inventory = DeviceInventory.DeviceInventory()
+        self.usb_descriptor_reader = UsbDescriptors.UsbDescriptorReader()
+        self.upload_service = None
+        self.measurement = None  # Measurement that is currently running
+        self.stop_requested = False
+
+    def update(self, job, **values):
+        self.summary['jobs'].setdefault(job.name, {}).update(values)
+        save_summary(self.summary_path, self.summary)
+
+    # Stop the running measurement after its current sample and do not start any further jobs
+    def stop(self, signal_number=None, frame=None):
+        self.stop_requested = True
+        if self.measurement is not None:
+            self.measurement.stop()
+
+    # A stop between creating the measurement and starting its tool could not be sent to the tool yet
+    def on_measurement_started(self):
+        if self.stop_requested:
+            self.measurement.stop()
+
+    def find_device(self, job):
+        try:
+            with Tracing.tracer.span('device_scan'):
+                devices = self.device_inventory.scan()
+        except OSError as e:
+            raise CampaignError('Could not read input devices: ' + str(e))
+
+        device_id = job.section.get('event')
+        if device_id is not None and device_id.isdigit():
+            device_id = 'event' + device_id
+        device = MeasurementWorkflow.find_device(devices, job.section.get('device'), device_id)
+        if device is None:
+            raise CampaignError('Device not found: ' + (job.section.get('device') or device_id))
+        return device
+
+    def get_device_type(self, job, device):
+        device_type = MeasurementWorkflow.get_device_type_id(job.section.get('type', device.device_type))
+        if device_type is None:
+            raise CampaignError('Type of ' + job.name + ' could not be detected, please set type')
+        return device_type
+
+    def get_stop_rule(self, job):
+        target = job.section.getfloat('early_stop')
+        if target <= 0:
+            return None
+        return LatencyStats.PrecisionStopRule(target, job.get_int('early_stop_min_samples'))
+
+    # Measure the device of the job and add all information to its log. Returns the path of the log
+    def measure(self, job):
+        device = self.find_device(job)
+        device_type = self.get_device_type(job, device)
+        with Tracing.tracer.span('binterval'):
+            b_interval = self.usb_descriptor_reader.get_binterval(device.vendor_id, device.product_id,
+                                                                  device.sysfs_path)
+
+        command = MeasurementWorkflow.build_command(job.section['tool'], device.device_id, job.get_int('button'),
+                                                    device_type, job.section.get('name', job.name),
+                                                    job.get_int('iterations'), job.get_int('tmin'),
+                                                    job.get_int('tmax'), job.section['gpio'])
+        self.measurement = MeasurementWorkflow.Measurement(command, self.get_stop_rule(job),
+                                                           on_stop_requested=lambda reason: print('Stopping early:',
+                                                                                                  reason),
+                                                           start_new_session=True,
+                                                           on_started=self.on_measurement_started)
+        if self.stop_requested:
+            raise CampaignError('Stopped by the user')
+        try:
+            log_path = self.measurement.run()
+        finally:
+            self.measurement = None
+        Tracing.tracer.set_log_path(log_path)
+
+        changes = MeasurementWorkflow.create_device_metadata(device.vendor_id, device.product_id, b_interval,
+                                                             device_type, job.section.get('ean', ''),
+                                                             device.device_speed)
+        if job.section.getboolean('upload'):
+            changes.update(MeasurementWorkflow.create_personal_metadata(job.section['authors'], job.section['email'],
+                                                                        job.section.getboolean('public'),
+                                                                        job.section.get('notes', '')))
+        try:
+            with Tracing.tracer.span('metadata'):
+                LogFile.update_metadata(log_path, changes)
+        except (OSError, ValueError) as e:
+            raise CampaignError('Could not update the metadata of ' + log_path + ': ' + str(e))
+        return log_path
+
+    # Statistics of the log for the summary (in ms)
+    def analyse(self, log_path):
+        log = LogFile.load_log(log_path)
+        latencies = log.latencies_ms()
+        result = {'stats': LatencyStats.summarize(latencies),
+                  'stoppedEarly': log.metadata.get('stoppedEarly', '0') != '0'}
+        if len(latencies) > 1:
+            result['intervals'] = LatencyStats.get_bootstrap_intervals(log_path, latencies)
+        return result, latencies
+
+    # Render the plot in all publication formats. Returns the path of the PNG or None if the plot could not be created
+    def render_plot(self, log_path, latencies):
+        import PlotEngine
+
+        for extension in PlotEngine.Constants.PUBLICATION_EXTENSIONS:
+            if PlotEngine.render_cached(MeasurementWorkflow.get_plot_path(log_path, extension), latencies) is None:
+                return None
+        return MeasurementWorkflow.get_plot_path(log_path)
+
+    def enqueue_upload(self, job, log_path):
+        import UploadService
+
+        if self.upload_service is None:
+            self.upload_service = UploadService.UploadService()
+        self.upload_service.enqueue(log_path, job.section['authors'], job.section['email'],
+                                    job.section.getboolean('public'))
+
+    def run_job(self, job):
+        Tracing.tracer.reset()  # Every job gets its own trace
+        result = self.summary['jobs'].get(job.name, {})
+        self.update(job, status=Constants.STATUS_RUNNING, settings=job.get_settings(),
+                    attempts=result.get('attempts', 0) + 1 if result.get('settings') == job.get_settings() else 1,
+                    started=time.strftime('%Y-%m-%dT%H:%M:%S'), finished=None, log=None, error=None)
+        try:
+            log_path = self.measure(job)
+            self.update(job, log=os.path.abspath(log_path))
+            with Tracing.tracer.span('analysis'):
+                analysis, latencies = self.analyse(log_path)
+            if self.stop_requested:
+                # The tool stopped at Ctrl+C, not because the results were precise enough
+                self.update(job, status=Constants.STATUS_STOPPED, error='Stopped by the user', **analysis)
+                return
+            with Tracing.tracer.span('index'):
+                ResultsIndex.index_log(log_path)
+            if job.section.getboolean('plot'):
+                with Tracing.tracer.span('plot'):
+                    analysis['plot'] = self.render_plot(log_path, latencies)
+            if job.section.getboolean('upload'):
+                with Tracing.tracer.span('upload'):
+                    self.enqueue_upload(job, log_path)
+        except (CampaignError, MeasurementWorkflow.MeasurementError, OSError, ValueError) as e:
+            status = Constants.STATUS_STOPPED if self.stop_requested else Constants.STATUS_FAILED
+            self.update(job, status=status, error=str(e), finished=time.strftime('%Y-%m-%dT%H:%M:%S'))
+            return
+        self.update(job, status=Constants.STATUS_DONE, finished=time.strftime('%Y-%m-%dT%H:%M:%S'), **analysis)
+
+    # Run all jobs that are not done yet. Returns True if all jobs are done
+    def run(self):
+        for job in self.jobs:
+            if self.stop_requested:
+                break
+            result = self.summary['jobs'].get(job.name)
+            if not needs_run(job, result):
+                print('Skipping', job.name + ':', result['status'])
+                continue
+
+            print('Measuring', job.name)
+            self.run_job(job)
+            result = self.summary['jobs'][job.name]
+            print(job.name + ':', result['status'], result.get('error') or result.get('log'))
+
+        if self.upload_service is not None and not self.stop_requested:
+            num_uploaded, num_remaining = self.upload_service.upload_pending_entries()
+            print(num_uploaded, 'measurements uploaded,', num_remaining, 'remaining in the upload queue')
+            self.summary['uploadsRemaining'] = num_remaining
+            save_summary(self.summary_path, self.summary)
+
+        return all(self.summary['jobs'].get(job.name, {}).get('status') == Constants.STATUS_DONE for job in self.jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a campaign of LagBox measurements without the GUI')
+    parser.add_argument('campaign', help='.ini file with the defaults in [campaign] and one section per job')
+    parser.add_argument('--summary', help='path of the summary (default: <campaign>' + Constants.SUMMARY_SUFFIX + ')')
+    parser.add_argument('--restart', action='store_true', help='ignore the summary and run all jobs again')
+    args = parser.parse_args()
+
+    summary_path = args.summary or os.path.splitext(args.campaign)[0] + Constants.SUMMARY_SUFFIX
+    try:
+        jobs = load_campaign(args.campaign)
+        summary = {'jobs': {}} if args.restart else load_summary(summary_path)
+    except CampaignError as e:
+        sys.exit(str(e))
+    summary['campaign'] = os.path.abspath(args.campaign)
+
+    runner = CampaignRunner(jobs, summary_path, summary)
+    signal.signal(signal.SIGINT, runner.stop)
+    signal.signal(signal.SIGTERM, runner.stop)
+    try:
+        is_complete = runner.run()
+    finally:
+        if runner.upload_service is not None:
+            runner.upload_service.shutdown()  # Uploads that are not finished yet stay in the queue
+
+    print('Summary saved to', summary_path)
+    sys.exit(0 if is_complete else 1)
+
+
+if __name__ == '__main__':
+    main()
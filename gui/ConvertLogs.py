@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Creates the binary companion (.lbx, see LogFile.py) of all LagBox logs of a directory that do not have an up-to-date
+# companion yet. Afterwards, DataPlotter and BatchAnalysis load these logs without parsing the .csv files.
+#
+# usage: python ConvertLogs.py [log directory (default: ../log)] [--workers N]
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import BatchAnalysis
+import LogFile
+
+
+# Create the companion of a single log. Runs in a worker process. Returns False if the companion was up to date
+def convert_log(file_path):
+    if LogFile.read_companion(file_path) is not None:
+        return False
+    LogFile.write_companion(LogFile.read_log(file_path))
+    return True
+
+
+def convert_logs(directory, workers=None):
+    paths = BatchAnalysis.find_logs(directory)
+    num_converted = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {path: executor.submit(convert_log, path) for path in paths}
+        for path, future in futures.items():
+            try:
+                if future.result():
+                    num_converted += 1
+            except (OSError, ValueError) as error:
+                print('Could not convert', path + ':', error)
+
+    print('Found', len(paths), 'logs,', num_converted, 'converted')
+    return num_converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create binary companions for all LagBox logs of a directory')
+    parser.add_argument('directory', nargs='?', default=BatchAnalysis.Constants.LOG_DIRECTORY)
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        sys.exit('Directory missing: ' + args.directory)
+
+    convert_logs(args.directory, args.workers)
+
+
+if __name__ == '__main__':
+    main()
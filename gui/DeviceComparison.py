@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compares the latencies of many devices at once: a ranking by median, one figure with the ECDFs of all devices and
+# their box plots, and pairwise tests of every two devices:
+#   Mann-Whitney U  with Cliff's delta (P(a > b) - P(a < b)) as effect size and a normal approximation with tie
+#                   correction for the p-value
+#   Kolmogorov-Smirnov  with the largest distance D of the ECDFs and its asymptotic p-value
+# The p-values are adjusted for the number of pairs with the method of Holm.
+#
+# Both tests only need the sorted latencies of the two devices: the ranks of one device in the other are found with
+# searchsorted on the distinct values, without sorting the pooled samples again. The sorted latencies of every log
+# are cached in .comparison_cache next to the logs, and so are the results of every pair (keyed by hashes of the
+# latencies). Adding a device to a comparison of N devices only reads one log and tests N new pairs.
+#
+# usage: python DeviceComparison.py [logs ...] [--type Mouse] [--hz 1000] [--device name] [--output prefix]
+#        Without logs, all logs of ../log that match the filters (also --max and --min of ResultsIndex.py) are
+#        compared
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+
+import LatencyStats  # Hash of the latencies
+import LogFile
+
+
+class Constants:
+    LOG_DIRECTORY = '../log'
+    CACHE_DIRECTORY_NAME = '.comparison_cache'
+    ARRAY_INDEX_FILE_NAME = 'arrays.json'  # Path, size and modification time of the logs with the hash of their data
+    PAIR_CACHE_FILE_NAME = 'pairs.json'
+    CACHE_VERSION = 1  # Part of the pair keys. Needs to be increased when the tests are changed
+
+    OUTPUT_PREFIX = '../log/comparison'
+    PAIRS_SUFFIX = '_pairs.csv'  # One row per pair with all results
+    MATRIX_SUFFIX = '_matrix.csv'  # N x N matrix of Cliff's delta
+    PLOT_SUFFIX = '.png'
+    CSV_DELIMITER = ';'
+    ALPHA = 0.05  # Significance level for the marks in the matrix (after the adjustment of Holm)
+    KS_TERMS = 100  # Number of terms of the series of the Kolmogorov distribution
+
+    PLOT_WIDTH = 12
+    PLOT_ROW_HEIGHT = 0.3  # Height of a device in the box plot in inches
+    PLOT_MIN_HEIGHT = 4
+    PLOT_OUTPUT_DPI = 150
+    ECDF_POINTS = 500  # Number of quantiles per device drawn in the ECDF overlay
+
+
+# The sorted latencies of a log in ms and their distinct values with their number of occurrences
+class Sample:
+
+    def __init__(self, path, label, data_hash, latencies):
+        import numpy as np
+
+        self.path = path
+        self.label = label
+        self.hash = data_hash
+        self.latencies = latencies
+        self.values, self.counts = np.unique(latencies, return_counts=True)
+
+    def __len__(self):
+        return len(self.latencies)
+
+
+# Sorted latencies of the logs, stored as .npy files named after the hash of the latencies
+class SortedArrayCache:
+
+    def __init__(self, cache_directory):
+        self.cache_directory = cache_directory
+        self.index_path = os.path.join(cache_directory, Constants.ARRAY_INDEX_FILE_NAME)
+        try:
+            with open(self.index_path, 'r') as file:
+                self.index = json.load(file)
+        except (OSError, ValueError):
+            self.index = {}
+        self.is_changed = False
+
+    def load(self, file_path):
+        import numpy as np
+
+        file_path = os.path.abspath(file_path)
+        file_stat = os.stat(file_path)
+        entry = self.index.get(file_path)
+        if entry is not None and entry['mtime'] == file_stat.st_mtime and entry['size'] == file_stat.st_size:
+            try:
+                latencies = np.load(os.path.join(self.cache_directory, entry['hash'] + '.npy'), mmap_mode='r')
+                return Sample(file_path, entry['label'], entry['hash'], latencies)
+            except (OSError, ValueError):
+                pass  # Removed from the cache, read the log again
+
+        log = LogFile.load_log(file_path)
+        latencies = np.sort(log.latencies_ms())
+        data_hash = LatencyStats.hash_latencies(latencies)
+        label = log.metadata.get('Device') or os.path.splitext(os.path.basename(file_path))[0]
+
+        os.makedirs(self.cache_directory, exist_ok=True)
+        LogFile.write_atomically(os.path.join(self.cache_directory, data_hash + '.npy'),
+                                 lambda file: np.save(file, latencies))
+        self.index[file_path] = {'mtime': file_stat.st_mtime, 'size': file_stat.st_size, 'hash': data_hash,
+                                 'label': label}
+        self.is_changed = True
+        return Sample(file_path, label, data_hash, latencies)
+
+    def save(self):
+        if self.is_changed:
+            content = json.dumps(self.index).encode('utf-8')
+            LogFile.write_atomically(self.index_path, lambda file: file.write(content))
+            self.is_changed = False
+
+
+# Results of the pairs, stored for the pair ordered by the hashes of their latencies. The results of the reversed pair
+# are derived from them
+class PairCache:
+
+    def __init__(self, cache_directory):
+        self.path = os.path.join(cache_directory, Constants.PAIR_CACHE_FILE_NAME)
+        try:
+            with open(self.path, 'r') as file:
+                self.pairs = json.load(file)
+        except (OSError, ValueError):
+            self.pairs = {}
+        self.is_changed = False
+        self.num_computed = 0
+
+    def get(self, a, b):
+        if a.hash > b.hash:
+            return mirror(self.get(b, a))
+
+        key = '%s:%s:v%d' % (a.hash, b.hash, Constants.CACHE_VERSION)
+        result = self.pairs.get(key)
+        if result is None:
+            result = compare_pair(a, b)
+            self.pairs[key] = result
+            self.is_changed = True
+            self.num_computed += 1
+        return result
+
+    def save(self):
+        if self.is_changed:
+            content = json.dumps(self.pairs).encode('utf-8')
+            LogFile.write_atomically(self.path, lambda file: file.write(content))
+            self.is_changed = False
+
+
+# Number of occurrences of every distinct value of both samples, aligned to the union of their distinct values
+def pool_counts(a, b):
+    import numpy as np
+
+    values = np.union1d(a.values, b.values)
+    counts_a = np.zeros(len(values))
+    counts_b = np.zeros(len(values))
+    counts_a[np.searchsorted(values, a.values)] = a.counts
+    counts_b[np.searchsorted(values, b.values)] = b.counts
+    return values, counts_a, counts_b
+
+
+def normal_p_value(z):
+    return math.erfc(abs(z) / math.sqrt(2))  # Two-sided
+
+
+# Asymptotic p-value of the Kolmogorov-Smirnov statistic (with the correction for small samples of Stephens)
+def kolmogorov_p_value(d, n, m):
+    effective_n = n * m / (n + m)
+    x = (math.sqrt(effective_n) + 0.12 + 0.11 / math.sqrt(effective_n)) * d
+    if x < 0.2:
+        return 1.0
+    p = 2 * sum((-1) ** (k - 1) * math.exp(-2 * k * k * x * x) for k in range(1, Constants.KS_TERMS + 1))
+    return min(1.0, max(0.0, p))
+
+
+# Mann-Whitney U and Kolmogorov-Smirnov test of two samples. Positive differences and deltas mean that a is slower
+def compare_pair(a, b):
+    import numpy as np
+
+    n, m = len(a), len(b)
+    values, counts_a, counts_b = pool_counts(a, b)
+
+    # U of a: for every value of a, the number of values of b below it plus half the number of equal ones
+    below_b = np.cumsum(counts_b) - counts_b
+    u = float(np.sum(counts_a * (below_b + counts_b / 2)))
+
+    pooled = counts_a + counts_b
+    tie_term = float(np.sum(pooled ** 3 - pooled))
+    variance = n * m / 12 * ((n + m + 1) - tie_term / ((n + m) * (n + m - 1)))
+    difference = u - n * m / 2
+    if variance > 0:
+        z = (difference - math.copysign(0.5, difference) if difference != 0 else 0.0) / math.sqrt(variance)
+    else:
+        z = 0.0
+
+    d = float(np.max(np.abs(np.cumsum(counts_a) / n - np.cumsum(counts_b) / m)))
+
+    return {
+        'medianDifference': float(np.median(a.latencies) - np.median(b.latencies)),
+        'u': u,
+        'z': z,
+        'pMannWhitney': normal_p_value(z),
+        'cliffsDelta': 2 * u / (n * m) - 1,
+        'ksD': d,
+        'pKolmogorovSmirnov': kolmogorov_p_value(d, n, m)
+    }
+
+
+def mirror(result):
+    mirrored = dict(result)
+    for name in ['medianDifference', 'z', 'cliffsDelta']:
+        mirrored[name] = -result[name]
+    mirrored['u'] = None  # Needs the sizes of the samples, set by compare_samples
+    return mirrored
+
+
+# Adjusted p-values of Holm for a list of p-values
+def holm(p_values):
+    import numpy as np
+
+    p_values = np.asarray(p_values, dtype=np.float64)
+    order = np.argsort(p_values)
+    adjusted = np.empty(len(p_values))
+    adjusted[order] = np.minimum(1, np.maximum.accumulate((len(p_values) - np.arange(len(p_values))) *
+                                                        p_values[order]))
+    return adjusted
+
+
+# Labels need to be unique in the matrix. Devices measured several times get a number
+def make_labels_unique(samples):
+    seen = {}
+    for sample in samples:
+        seen[sample.label] = seen.get(sample.label, 0) + 1
+        if seen[sample.label] > 1:
+            sample.label += ' #' + str(seen[sample.label])
+
+
+def load_samples(paths, cache_directory):
+    array_cache = SortedArrayCache(cache_directory)
+    samples = []
+    for path in paths:
+        try:
+            sample = array_cache.load(path)
+        except (OSError, ValueError) as e:
+            print('Could not read', path + ':', e)
+            continue
+        if len(sample) > 1:
+            samples.append(sample)
+        else:
+            print('Not enough measurements in', path)
+    array_cache.save()
+    make_labels_unique(samples)
+    return samples
+
+
+# Test all pairs of samples. Returns a list of (index of a, index of b, result) for all pairs with a < b
+def compare_samples(samples, cache_directory):
+    pair_cache = PairCache(cache_directory)
+    pairs = []
+    for i in range(len(samples)):
+        for j in range(i + 1, len(samples)):
+            result = dict(pair_cache.get(samples[i], samples[j]))
+            if result['u'] is None:
+                result['u'] = len(samples[i]) * len(samples[j]) * (result['cliffsDelta'] + 1) / 2
+            pairs.append((i, j, result))
+    pair_cache.save()
+
+    for name in ['pMannWhitney', 'pKolmogorovSmirnov']:
+        for (_, _, result), adjusted in zip(pairs, holm([result[name] for _, _, result in pairs])):
+            result[name + 'Holm'] = float(adjusted)
+    print(len(pairs), 'pairs,', pair_cache.num_computed, 'of them tested, the others were cached')
+    return pairs
+
+
+def get_summary(sample):
+    import numpy as np
+
+    q1, median, q3, p5, p95 = np.percentile(sample.latencies, [25, 50, 75, 5, 95])
+    return {'label': sample.label, 'n': len(sample), 'mean': float(np.mean(sample.latencies)),
+            'median': float(median), 'q1': float(q1), 'q3': float(q3), 'p5': float(p5), 'p95': float(p95)}
+
+
+def write_pairs(output_path, samples, pairs):
+    columns = ['a', 'b', 'nA', 'nB', 'medianDifference', 'u', 'z', 'pMannWhitney', 'pMannWhitneyHolm',
+               'cliffsDelta', 'ksD', 'pKolmogorovSmirnov', 'pKolmogorovSmirnovHolm']
+    with open(output_path, 'w', newline='') as file:
+        writer = csv.writer(file, delimiter=Constants.CSV_DELIMITER)
+        writer.writerow(columns)
+        for i, j, result in pairs:
+            writer.writerow([samples[i].label, samples[j].label, len(samples[i]), len(samples[j])] +
+                            ['%.6g' % result[name] for name in columns[4:]])
+
+
+# Cliff's delta of the device in the row against the device in the column, marked with * if both tests are significant
+def write_matrix(output_path, samples, pairs):
+    matrix = [[''] * len(samples) for _ in samples]
+    for i, j, result in pairs:
+        mark = '*' if max(result['pMannWhitneyHolm'], result['pKolmogorovSmirnovHolm']) < Constants.ALPHA else ''
+        matrix[i][j] = '%+.3f%s' % (result['cliffsDelta'], mark)
+        matrix[j][i] = '%+.3f%s' % (-result['cliffsDelta'], mark)
+
+    with open(output_path, 'w', newline='') as file:
+        writer = csv.writer(file, delimiter=Constants.CSV_DELIMITER)
+        writer.writerow([''] + [sample.label for sample in samples])
+        for sample, row in zip(samples, matrix):
+            writer.writerow([sample.label] + row)
+
+
+# ECDFs of all devices in one plot and their box plots (whiskers at p5 and p95), ordered by the median.
+# Both are drawn from a few quantiles of every device, so the time does not depend on the number of measurements
+def render(output_path, samples, summaries):
+    import numpy as np
+
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib import pyplot as plt
+    except ImportError:
+        print('Pyplot not installed')
+        return False
+
+    height = max(Constants.PLOT_MIN_HEIGHT, Constants.PLOT_ROW_HEIGHT * len(samples))
+    figure, (ecdf_axes, box_axes) = plt.subplots(1, 2, figsize=[Constants.PLOT_WIDTH, height])
+
+    probabilities = np.linspace(0, 1, Constants.ECDF_POINTS)
+    colors = plt.get_cmap('viridis')(np.linspace(0, 1, len(samples)))
+    for color, sample, summary in zip(colors, samples, summaries):
+        ecdf_axes.step(np.quantile(sample.latencies, probabilities), probabilities, where='post', color=color,
+                       linewidth=1, label=summary['label'])
+    ecdf_axes.set_xlabel('latency (ms)')
+    ecdf_axes.set_ylabel('proportion of measurements')
+    if len(samples) <= 12:
+        ecdf_axes.legend(fontsize='small')
+
+    box_stats = [{'label': summary['label'], 'med': summary['median'], 'q1': summary['q1'], 'q3': summary['q3'],
+                  'whislo': summary['p5'], 'whishi': summary['p95'], 'mean': summary['mean'], 'fliers': []}
+                 for summary in summaries]
+    try:
+        box_axes.bxp(box_stats, orientation='horizontal', showmeans=True, patch_artist=True)
+    except TypeError:
+        box_axes.bxp(box_stats, vert=False, showmeans=True, patch_artist=True)  # Matplotlib < 3.10
+    box_axes.invert_yaxis()  # Fastest device on top
+    box_axes.set_xlabel('latency (ms)')
+
+    figure.tight_layout()
+    figure.savefig(output_path, dpi=Constants.PLOT_OUTPUT_DPI)
+    plt.close('all')
+    return True
+
+
+def print_ranking(summaries):
+    print('%4s %-40s %8s %10s %10s %10s' % ('rank', 'device', 'n', 'median', 'mean', 'p95'))
+    for rank, summary in enumerate(summaries, 1):
+        print('%4d %-40s %8d %10.3f %10.3f %10.3f' % (rank, summary['label'][:40], summary['n'], summary['median'],
+                                                       summary['mean'], summary['p95']))
+
+
+# Compare the logs and write the pairs, the matrix and the figure with the given prefix. Returns the pairs
+def compare_logs(paths, output_prefix=Constants.OUTPUT_PREFIX, cache_directory=None, plot=True):
+    if cache_directory is None:
+        cache_directory = os.path.join(os.path.dirname(os.path.abspath(output_prefix)),
+                                       Constants.CACHE_DIRECTORY_NAME)
+
+    samples = load_samples(paths, cache_directory)
+    if len(samples) < 2:
+        raise ValueError('At least two logs with measurements are needed for a comparison')
+
+    summaries = [get_summary(sample) for sample in samples]
+    order = sorted(range(len(samples)), key=lambda i: summaries[i]['median'])
+    samples = [samples[i] for i in order]
+    summaries = [summaries[i] for i in order]
+    print_ranking(summaries)
+
+    pairs = compare_samples(samples, cache_directory)
+    write_pairs(output_prefix + Constants.PAIRS_SUFFIX, samples, pairs)
+    write_matrix(output_prefix + Constants.MATRIX_SUFFIX, samples, pairs)
+    print('Pairwise tests saved to', output_prefix + Constants.PAIRS_SUFFIX, 'and',
+          output_prefix + Constants.MATRIX_SUFFIX)
+
+    if plot and render(output_prefix + Constants.PLOT_SUFFIX, samples, summaries):
+        print('Plot saved to', output_prefix + Constants.PLOT_SUFFIX)
+    return pairs
+
+
+# Paths of the logs in the log directory that match the filters, found with the ResultsIndex
+def query_logs(directory, device_type=None, hz=None, device=None, maxima=None, minima=None):
+    import ResultsIndex
+
+    index = ResultsIndex.ResultsIndex(os.path.join(directory, os.path.basename(ResultsIndex.Constants.INDEX_PATH)))
+    try:
+        index.import_directory(directory)
+        equal = {}
+        if device_type is not None:
+            equal['deviceType'] = ResultsIndex.get_device_type_id(device_type)
+        if hz is not None:
+            equal['pollingInterval'] = 1000 / hz
+        runs = index.query(equal, maxima, minima, device, selected_columns=['path'])
+    finally:
+        index.close()
+    return [run['path'] for run in runs if os.path.dirname(run['path']) == os.path.abspath(directory)]
+
+
+def main():
+    import ResultsIndex  # Device types of the filters
+
+    parser = argparse.ArgumentParser(description='Compare the latencies of several devices')
+    parser.add_argument('logs', nargs='*', help='logs to compare (default: all logs of --directory matching the '
+                                                'filters)')
+    parser.add_argument('--directory', default=Constants.LOG_DIRECTORY)
+    parser.add_argument('--type', type=str.capitalize, choices=ResultsIndex.Constants.DEVICE_TYPE_CHOICES,
+                        help='only devices of this type (Gamepad, Mouse, Keyboard)')
+    parser.add_argument('--hz', type=float, help='only devices with this polling rate in Hz')
+    parser.add_argument('--device', help='only devices with this text in their name')
+    parser.add_argument('--max', nargs=2, action='append', default=[], metavar=('COLUMN', 'VALUE'),
+                        help='upper bound of a column of the index, e.g. --max median 5 (repeatable)')
+    parser.add_argument('--min', nargs=2, action='append', default=[], metavar=('COLUMN', 'VALUE'),
+                        help='lower bound of a column of the index, e.g. --min n 1000 (repeatable)')
+    parser.add_argument('--output', default=Constants.OUTPUT_PREFIX, help='prefix of the output files')
+    parser.add_argument('--no-plot', action='store_true')
+    args = parser.parse_args()
+
+    paths = args.logs
+    if len(paths) == 0:
+        if not os.path.isdir(args.directory):
+            sys.exit('Directory missing: ' + args.directory)
+        try:
+            paths = query_logs(args.directory, args.type, args.hz, args.device,
+                               {name: float(value) for name, value in args.max},
+                               {name: float(value) for name, value in args.min})
+        except ValueError as e:
+            sys.exit(str(e))
+
+    try:
+        compare_logs(paths, args.output, plot=not args.no_plot)
+    except ValueError as e:
+        sys.exit(str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Detection of the input devices connected to the LagBox.
+# The device list is read from /proc/bus/input/devices and completed with information from sysfs, without starting
+# any subprocesses. Information from sysfs is cached, so a rescan after a hotplug event only reads data of new devices.
+
+import os
+
+
+class Constants:
+    PROC_INPUT_DEVICES = '/proc/bus/input/devices'
+    SYSFS_ROOT = '/sys'
+    INPUT_DEVICE_DIRECTORY = '/dev/input'  # Watched for hotplug events
+
+
+# An object representation of all relevant data about connected USB device
+class Device:
+
+    def __init__(self, vendor_id, product_id, name, device_id, device_type, device_speed, phys='', sysfs_path='',
+                 handlers=None):
+        self.vendor_id = vendor_id
+        self.product_id = product_id
+        self.name = name
+        self.device_id = device_id  # Name of the event node (eventXX)
+        self.device_type = device_type  # Auto-detected device type or None
+        self.device_speed = device_speed  # Speed of the USB connection (e.g. '12M')
+        self.phys = phys  # Physical path (e.g. usb-3f980000.usb-1.2/input0)
+        self.sysfs_path = sysfs_path  # Path of the input device in sysfs (without the leading /sys)
+        self.handlers = handlers if handlers is not None else []  # All handlers of the device (e.g. mouse0, event3)
+
+
+# Split the content of /proc/bus/input/devices into one dict per device. Every line has the form "X: Key=Value"
+# and multiple values of the same line (e.g. "I: Bus=0003 Vendor=046d ...") are stored separately.
+def parse_input_devices(text):
+    entries = []
+    entry = {}
+
+    for line in text.splitlines():
+        if len(line.strip()) == 0:
+            if len(entry) > 0:
+                entries.append(entry)
+            entry = {}
+            continue
+
+        prefix, _, content = line.partition(': ')
+        if prefix == 'I':
+            for part in content.split():
+                key, _, value = part.partition('=')
+                entry[key] = value
+        elif prefix == 'B':
+            key, _, value = content.partition('=')
+            entry['B:' + key] = value
+        else:
+            key, _, value = content.partition('=')
+            entry[key] = value
+
+    if len(entry) > 0:
+        entries.append(entry)
+
+    return entries
+
+
+# Auto-detect the type of the device by searching for the corresponding keywords in the device handlers
+def detect_device_type(handlers):
+    if 'kbd' in handlers:
+        return 'Keyboard (auto-detected)'
+    if any(handler.startswith('mouse') for handler in handlers):
+        return 'Mouse (auto-detected)'
+    if any(handler.startswith('js') for handler in handlers):
+        return 'Gamepad (auto-detected)'
+    return None
+
+
+class DeviceInventory:
+
+    def __init__(self, proc_input_devices=Constants.PROC_INPUT_DEVICES, sysfs_root=Constants.SYSFS_ROOT):
+        self.proc_input_devices = proc_input_devices
+        self.sysfs_root = sysfs_root
+        self.devices = {}  # All known devices by their sysfs path
+        self.speeds = {}  # Speed of all known USB devices by the sysfs path of the USB device
+
+    # Read a single line from a sysfs attribute. Returns None if it does not exist
+    def read_sysfs_attribute(self, path):
+        try:
+            with open(os.path.join(self.sysfs_root, path.lstrip('/')), 'r') as file:
+                return file.readline().strip()
+        except OSError:
+            return None
+
+    # Find the USB device an input device belongs to by walking up its sysfs path
+    # (e.g. .../usb1/1-1/1-1.2/1-1.2:1.0/0003:046D:C077.0001/input/input3 belongs to .../usb1/1-1/1-1.2)
+    def find_usb_device_path(self, sysfs_path):
+        path = sysfs_path
+        while path not in ('', '/'):
+            if os.path.exists(os.path.join(self.sysfs_root, path.lstrip('/'), 'speed')):
+                return path
+            path = os.path.dirname(path)
+        return None
+
+    # Speed of the USB connection of an input device (e.g. '12M'). Cached per USB device
+    def get_device_speed(self, sysfs_path):
+        usb_device_path = self.find_usb_device_path(sysfs_path)
+        if usb_device_path is None:
+            return ''
+
+        if usb_device_path not in self.speeds:
+            speed = self.read_sysfs_attribute(os.path.join(usb_device_path, 'speed'))
+            self.speeds[usb_device_path] = speed + 'M' if speed else ''
+        return self.speeds[usb_device_path]
+
+    def create_device(self, entry):
+        handlers = entry.get('Handlers', '').split()
+        device_id = next((handler for handler in handlers if handler.startswith('event')), None)
+
+        return Device(entry.get('Vendor', ''), entry.get('Product', ''), entry.get('Name', '').strip('"'), device_id,
+                      detect_device_type(handlers), self.get_device_speed(entry.get('Sysfs', '')),
+                      entry.get('Phys', ''), entry.get('Sysfs', ''), handlers)
+
+    # Read the list of input devices. Devices that are already known are taken from the cache, only new devices are
+    # looked up in sysfs. Returns all USB input devices that have an event handler.
+    def scan(self):
+        with open(self.proc_input_devices, 'r') as file:
+            entries = parse_input_devices(file.read())
+
+        devices = {}
+        for entry in entries:
+            sysfs_path = entry.get('Sysfs', '')
+            device = self.devices.get(sysfs_path)
+            if device is None or device.handlers != entry.get('Handlers', '').split():
+                device = self.create_device(entry)
+            devices[sysfs_path] = device
+
+        # Forget the speed of USB devices that have been disconnected
+        self.speeds = {path: speed for path, speed in self.speeds.items()
+                       if any(sysfs_path.startswith(path + '/') for sysfs_path in devices)}
+        self.devices = devices
+
+        return self.get_usb_devices()
+
+    # All USB devices with an event handler. Under /proc/bus/input/devices a device sometimes appears multiple times
+    # (e.g. a mouse with additional keyboard interface). Only the first entry of every name is kept.
+    def get_usb_devices(self):
+        usb_devices = []
+        names = set()
+
+        for device in self.devices.values():
+            if 'usb' not in device.phys or device.device_id is None or device.name in names:
+                continue
+            names.add(device.name)
+            usb_devices.append(device)
+
+        return usb_devices
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Waits for the first button press on one or more input devices (/dev/input/eventXX).
+# The event nodes are watched with epoll (selectors), so no CPU time is used while waiting. A wait can be cancelled
+# from another thread through a pipe that is watched together with the event nodes.
+
+import os
+import selectors
+import struct
+import threading
+
+
+class Constants:
+    INPUT_DEVICE_DIRECTORY = '/dev/input'
+
+    # struct input_event of linux/input.h: struct timeval time, __u16 type, __u16 code, __s32 value
+    EVENT_FORMAT = 'llHHi'
+    EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+    EVENTS_PER_READ = 64
+
+    EV_KEY = 0x01
+    KEY_DOWN = 1  # value of an EV_KEY event when the button is pressed (0 = released, 2 = autorepeat)
+
+
+# Extract the code of the first key-down event from the raw data read from an event node. Returns None if there is none
+def find_key_press(data):
+    for offset in range(0, len(data) - Constants.EVENT_SIZE + 1, Constants.EVENT_SIZE):
+        _, _, event_type, code, value = struct.unpack_from(Constants.EVENT_FORMAT, data, offset)
+        if event_type == Constants.EV_KEY and value == Constants.KEY_DOWN:
+            return code
+    return None
+
+
+class KeyScanner:
+
+    def __init__(self, device_paths):
+        self.device_paths = device_paths  # Event nodes to watch (e.g. /dev/input/event3)
+        self.cancel_read, self.cancel_write = os.pipe()
+        self.lock = threading.Lock()  # cancel and close can be called from different threads
+
+    # Stop a running wait_for_key_press. Can be called from any thread, also after close
+    def cancel(self):
+        with self.lock:
+            if self.cancel_write is not None:
+                os.write(self.cancel_write, b'\0')
+
+    def close(self):
+        with self.lock:
+            if self.cancel_write is not None:
+                os.close(self.cancel_read)
+                os.close(self.cancel_write)
+                self.cancel_read = self.cancel_write = None
+
+    # Block until a button is pressed on one of the devices. Returns the path of the device and the code of the button,
+    # or None if the wait was cancelled, timed out or none of the devices can be read
+    def wait_for_key_press(self, timeout=None):
+        selector = selectors.DefaultSelector()
+        selector.register(self.cancel_read, selectors.EVENT_READ, None)
+
+        file_descriptors = []
+        try:
+            for path in self.device_paths:
+                try:
+                    file_descriptor = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+                except OSError as e:
+                    print('Could not open', path + ':', e)
+                    continue
+                file_descriptors.append(file_descriptor)
+                selector.register(file_descriptor, selectors.EVENT_READ, path)
+
+            while len(selector.get_map()) > 1:  # At least one device left besides the cancel pipe
+                ready = selector.select(timeout)
+                if len(ready) == 0:
+                    return None  # Timeout
+
+                for key, _ in ready:
+                    if key.data is None:
+                        return None  # Cancelled
+
+                    try:
+                        data = os.read(key.fd, Constants.EVENT_SIZE * Constants.EVENTS_PER_READ)
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        data = b''  # The device has been unplugged
+                    if len(data) == 0:
+                        selector.unregister(key.fd)
+                        continue
+
+                    code = find_key_press(data)
+                    if code is not None:
+                        return key.data, code
+
+            return None
+        finally:
+            selector.close()
+            for file_descriptor in file_descriptors:
+                os.close(file_descriptor)
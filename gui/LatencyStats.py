@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Statistics about the latencies of a LagBox measurement
+#
+# numpy is only imported by the functions that need it, so the GUI can use OnlineStats without loading numpy at startup
+
+
+import bisect
+import hashlib
+import json
+import math
+import os
+from collections import deque
+
+import LogFile
+
+
+class Constants:
+    PERCENTILES = [1, 5, 25, 75, 95, 99]  # Percentiles reported in addition to the median
+    SUMMARY_FIELDS = ['n', 'mean', 'median', 'std', 'min', 'max'] + ['p' + str(p) for p in PERCENTILES]
+
+    BOOTSTRAP_RESAMPLES = 10000
+    BOOTSTRAP_CONFIDENCE = 0.95
+    BOOTSTRAP_QUANTILES = {'median': 50, 'p95': 95, 'p99': 99}  # Percentiles that get a confidence interval
+    BOOTSTRAP_CACHE_FILE_NAME = '.bootstrap_cache.json'
+
+    STOP_RULE_Z = 1.96  # Quantile of the normal distribution for the 95% confidence intervals of PrecisionStopRule
+    STOP_RULE_PERCENTILE = 95
+    STOP_RULE_CHECK_INTERVAL = 25  # The stopping rule is only checked every this many measurements
+
+    HISTOGRAM_BINS = 60
+    HISTOGRAM_RECENT = 100  # Number of latest measurements that get their own histogram (shows a drift)
+    HISTOGRAM_WARM_UP = 20  # Number of measurements before the bins are chosen for the first time
+    HISTOGRAM_TAIL = 0.005  # Fraction of the measurements at each end that may be left outside of the bins
+    HISTOGRAM_OUTSIDE_FRACTION = 0.02  # The bins are chosen again when more measurements than this are outside
+    HISTOGRAM_MARGIN = 0.05  # Space left of the lowest and right of the highest bin, as a fraction of the range
+    HISTOGRAM_MIN_BIN_WIDTH = 0.01  # in ms
+
+
+# Calculate the summary statistics of a list of latencies. Returns a dict with the keys of SUMMARY_FIELDS
+def summarize(latencies):
+    import numpy as np
+
+    latencies = np.asarray(latencies, dtype=np.float64)
+    if len(latencies) == 0:
+        return {'n': 0}
+
+    summary = {
+        'n': len(latencies),
+        'mean': float(np.mean(latencies)),
+        'median': float(np.median(latencies)),
+        'std': float(np.std(latencies)),
+        'min': float(np.min(latencies)),
+        'max': float(np.max(latencies))
+    }
+
+    for percentile, value in zip(Constants.PERCENTILES, np.percentile(latencies, Constants.PERCENTILES)):
+        summary['p' + str(percentile)] = float(value)
+
+    return summary
+
+
+# Bootstrap distribution of a percentile (calculated like numpy.percentile) of the sorted latencies.
+# Drawing n indices uniformly and taking the k-th smallest is the same as taking the k-th smallest of n uniform values,
+# which is Beta(k, n - k + 1) distributed, and the next one lies a Beta(1, n - k) distributed fraction of the rest above
+# it. So every resample only needs two random numbers instead of n indices, and the distribution is still exact.
+def bootstrap_percentile(random, sorted_latencies, percentile, resamples):
+    import numpy as np
+
+    n = len(sorted_latencies)
+    position = (n - 1) * percentile / 100
+    k = int(position) + 1  # Rank of the lower of the two order statistics that are interpolated
+    fraction = position - (k - 1)
+
+    lower = random.beta(k, n - k + 1, resamples)
+    values = sorted_latencies[np.minimum((lower * n).astype(np.int64), n - 1)]
+    if fraction > 0 and k < n:
+        upper = lower + (1 - lower) * random.beta(1, n - k, resamples)
+        values = values + fraction * (sorted_latencies[np.minimum((upper * n).astype(np.int64), n - 1)] - values)
+    return values
+
+
+# Confidence interval of the mean from the Cornish-Fisher expansion of its sampling distribution: the normal interval
+# with the standard error std / sqrt(n), corrected for the skewness of the latencies. The mean has no shortcut like the
+# order statistics, and resampling it would need n random indices per resample
+def mean_interval(latencies, confidence):
+    from statistics import NormalDist
+    import numpy as np
+
+    n = len(latencies)
+    mean = float(np.mean(latencies))
+    std = float(np.std(latencies))
+    skewness = float(np.mean((latencies - mean) ** 3)) / std ** 3 if std > 0 else 0.0
+    interval = []
+    for probability in [(1 - confidence) / 2, (1 + confidence) / 2]:
+        z = NormalDist().inv_cdf(probability)
+        interval.append(mean + std / n ** 0.5 * (z + skewness / (6 * n ** 0.5) * (z * z - 1)))
+    return interval
+
+
+# Confidence intervals of the mean (see mean_interval) and percentile bootstrap confidence intervals of the percentiles
+# of BOOTSTRAP_QUANTILES. Returns a dict like {'mean': [low, high], 'median': [low, high], ...}. The random numbers are
+# seeded with the latencies, so the same log always gets the same intervals
+def bootstrap_intervals(latencies, resamples=Constants.BOOTSTRAP_RESAMPLES, confidence=Constants.BOOTSTRAP_CONFIDENCE):
+    import numpy as np
+
+    latencies = np.asarray(latencies, dtype=np.float64)
+    if len(latencies) < 2:
+        return {}
+
+    random = np.random.default_rng(int(hash_latencies(latencies)[:16], 16))
+    bounds = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+
+    intervals = {'mean': mean_interval(latencies, confidence)}
+    sorted_latencies = np.sort(latencies)
+    for name, percentile in Constants.BOOTSTRAP_QUANTILES.items():
+        distribution = bootstrap_percentile(random, sorted_latencies, percentile, resamples)
+        intervals[name] = [float(value) for value in np.percentile(distribution, bounds)]
+    return intervals
+
+
+def hash_latencies(latencies):
+    import numpy as np
+
+    return hashlib.sha1(np.ascontiguousarray(latencies, dtype=np.float64).tobytes()).hexdigest()
+
+
+# Confidence intervals of a log, cached in BOOTSTRAP_CACHE_FILE_NAME next to it. The cache entries are keyed by the
+# latencies themselves, so they stay valid when only the metadata in the header of the log changes
+def get_bootstrap_intervals(file_path, latencies, resamples=Constants.BOOTSTRAP_RESAMPLES,
+                            confidence=Constants.BOOTSTRAP_CONFIDENCE):
+    cache_path = os.path.join(os.path.dirname(os.path.abspath(file_path)), Constants.BOOTSTRAP_CACHE_FILE_NAME)
+    key = os.path.basename(file_path)
+    data_hash = hash_latencies(latencies)
+
+    try:
+        with open(cache_path, 'r') as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        cache = {}
+
+    entry = cache.get(key)
+    if isinstance(entry, dict) and entry.get('hash') == data_hash and entry.get('resamples') == resamples and \
+            entry.get('confidence') == confidence:
+        return entry['intervals']
+
+    intervals = bootstrap_intervals(latencies, resamples, confidence)
+    cache[key] = {'hash': data_hash, 'resamples': resamples, 'confidence': confidence, 'intervals': intervals}
+
+    try:
+        content = json.dumps(cache).encode('utf-8')
+        LogFile.write_atomically(cache_path, lambda file: file.write(content))
+    except OSError as e:
+        print('Could not cache the confidence intervals:', e)
+
+    return intervals
+
+
+# Online estimation of a single quantile with the P² algorithm (Jain & Chlamtac, 1985).
+# Only five markers are stored, so every new value is processed in constant time and memory.
+class P2Quantile:
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []  # Heights of the five markers (the first five values until they are initialized)
+        self.positions = [1, 2, 3, 4, 5]  # Actual positions of the markers
+        self.desired_positions = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]  # Increment of the desired positions per value
+
+    def add(self, x):
+        heights = self.heights
+
+        if len(heights) < 5:
+            heights.append(x)
+            heights.sort()
+            return
+
+        # Find the cell k the new value falls into and update the extreme values if necessary
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            self.positions[i] += 1
+        for i in range(5):
+            self.desired_positions[i] += self.increments[i]
+
+        # Move the three middle markers towards their desired positions
+        for i in range(1, 4):
+            difference = self.desired_positions[i] - self.positions[i]
+            if (difference >= 1 and self.positions[i + 1] - self.positions[i] > 1) or \
+                    (difference <= -1 and self.positions[i - 1] - self.positions[i] < -1):
+                direction = 1 if difference > 0 else -1
+                height = self.parabolic(i, direction)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = self.linear(i, direction)
+                heights[i] = height
+                self.positions[i] += direction
+
+    def parabolic(self, i, d):
+        q = self.heights
+        n = self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * ((n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                                                   (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def linear(self, i, d):
+        q = self.heights
+        n = self.positions
+        return q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+
+    def value(self):
+        if len(self.heights) == 0:
+            return float('nan')
+        if len(self.heights) < 5:
+            # Not enough values for the markers yet, so the quantile is interpolated from the sorted values
+            position = self.p * (len(self.heights) - 1)
+            lower = int(position)
+            upper = min(lower + 1, len(self.heights) - 1)
+            return self.heights[lower] + (position - lower) * (self.heights[upper] - self.heights[lower])
+        return self.heights[2]
+
+
+# Statistics that are updated with every single measurement while a measurement is running.
+# Mean and variance are calculated with Welford's method, quantiles are approximated with P².
+class OnlineStats:
+
+    QUANTILES = {'median': 0.5, 'p95': 0.95, 'p99': 0.99}
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared differences from the current mean
+        self.minimum = float('inf')
+        self.maximum = float('-inf')
+        self.quantiles = {name: P2Quantile(p) for name, p in self.QUANTILES.items()}
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+        if x < self.minimum:
+            self.minimum = x
+        if x > self.maximum:
+            self.maximum = x
+
+        for quantile in self.quantiles.values():
+            quantile.add(x)
+
+    # Population variance, like numpy.var
+    def variance(self):
+        return self.m2 / self.n if self.n > 0 else float('nan')
+
+    # Same keys as summarize(), as far as they are tracked online
+    def summary(self):
+        if self.n == 0:
+            return {'n': 0}
+
+        summary = {
+            'n': self.n,
+            'mean': self.mean,
+            'std': self.variance() ** 0.5,
+            'min': self.minimum,
+            'max': self.maximum
+        }
+        for name, quantile in self.quantiles.items():
+            summary[name] = quantile.value()
+
+        return summary
+
+
+# Histogram of a running measurement with a fixed number of bins. Every measurement is counted in constant time.
+# The bins are chosen again from the quantiles of all measurements so far after the warm-up, whenever the number of
+# measurements has doubled (to adapt the resolution) and when too many measurements are outside of the bins (a drift
+# or a second mode). This happens only a few times per measurement, so counting stays constant time on average.
+# The last HISTOGRAM_RECENT measurements are also counted separately.
+# The measurements are kept in a numpy array for re-binning, the counts are lists: incrementing a list item is several
+# times faster than incrementing a numpy array item.
+class StreamingHistogram:
+
+    def __init__(self, num_bins=Constants.HISTOGRAM_BINS, recent_length=Constants.HISTOGRAM_RECENT):
+        import numpy as np
+
+        self.num_bins = num_bins
+        self.recent_length = recent_length
+        self.values = np.empty(1024)  # All measurements so far, grown by doubling
+        self.n = 0
+        self.low = 0.0  # Left edge of the first bin in ms
+        self.width = 0.0  # Width of the bins in ms, 0 until the bins are chosen
+        self.counts = [0] * num_bins
+        self.recent_counts = [0] * num_bins
+        self.recent_bins = deque()  # Bins of the last recent_length measurements (also outside of the bins)
+        self.below = 0  # Number of measurements left and right of the bins
+        self.above = 0
+        self.next_rebin = Constants.HISTOGRAM_WARM_UP
+        self.num_rebins = 0
+
+    def get_bin(self, x):
+        return math.floor((x - self.low) / self.width)
+
+    def add(self, x):
+        if self.n == len(self.values):
+            self.values.resize(2 * self.n, refcheck=False)
+        self.values[self.n] = x
+        self.n += 1
+
+        if self.width == 0:
+            if self.n >= self.next_rebin:
+                self.rebin()
+            return
+
+        i = self.get_bin(x)
+        if i < 0:
+            self.below += 1
+        elif i >= self.num_bins:
+            self.above += 1
+        else:
+            self.counts[i] += 1
+            self.recent_counts[i] += 1
+
+        self.recent_bins.append(i)
+        if len(self.recent_bins) > self.recent_length:
+            i = self.recent_bins.popleft()
+            if 0 <= i < self.num_bins:
+                self.recent_counts[i] -= 1
+
+        if self.n >= self.next_rebin or self.below + self.above > Constants.HISTOGRAM_OUTSIDE_FRACTION * self.n:
+            self.rebin()
+
+    # Choose the bins so that all but HISTOGRAM_TAIL of the measurements at each end are inside and count again
+    def rebin(self):
+        import numpy as np
+
+        values = self.values[:self.n]
+        low, high = np.quantile(values, [Constants.HISTOGRAM_TAIL, 1 - Constants.HISTOGRAM_TAIL]).tolist()
+        margin = (high - low) * Constants.HISTOGRAM_MARGIN
+        self.width = max((high - low + 2 * margin) / self.num_bins, Constants.HISTOGRAM_MIN_BIN_WIDTH)
+        self.low = (low + high) / 2 - self.width * self.num_bins / 2
+
+        # Same arithmetic as get_bin, so a measurement always falls into the same bin
+        bins = np.floor((values - self.low) / self.width).astype(np.int64)
+        self.below = int(np.count_nonzero(bins < 0))
+        self.above = int(np.count_nonzero(bins >= self.num_bins))
+        self.counts = np.bincount(bins[(bins >= 0) & (bins < self.num_bins)], minlength=self.num_bins).tolist()
+        recent_bins = bins[-self.recent_length:]
+        self.recent_counts = np.bincount(recent_bins[(recent_bins >= 0) & (recent_bins < self.num_bins)],
+                                         minlength=self.num_bins).tolist()
+        self.recent_bins = deque(recent_bins.tolist())
+
+        self.next_rebin = 2 * self.n
+        self.num_rebins += 1
+
+    # Copy of the current state for drawing it in another thread. None during the warm-up
+    def snapshot(self):
+        if self.width == 0:
+            return None
+        return {'n': self.n, 'low': self.low, 'width': self.width, 'counts': list(self.counts),
+                'recent': list(self.recent_counts), 'below': self.below, 'above': self.above}
+
+
+# Sequential stopping rule for a running measurement: the measurement can stop as soon as the 95% confidence intervals
+# of the mean and of the 95th percentile are both narrower than +-target, but not before min_samples. The interval of
+# the mean is the normal one, that of the percentile is distribution-free (from the order statistics around it).
+# Every look at the data gives the measurement another chance to stop on a lucky streak, so the rule is only checked
+# every STOP_RULE_CHECK_INTERVAL measurements, and min_samples should not be too small.
+class PrecisionStopRule:
+
+    def __init__(self, target, min_samples):
+        self.target = target  # Maximum half-width of the confidence intervals in ms
+        self.min_samples = min_samples
+        self.stats = OnlineStats()
+        self.sorted_latencies = []
+
+    def add(self, x):
+        self.stats.add(x)
+        bisect.insort(self.sorted_latencies, x)
+
+    # Half-widths of the confidence intervals in ms (infinite while there are too few measurements)
+    def half_widths(self):
+        n = self.stats.n
+        if n < 2:
+            return {'mean': float('inf'), 'p95': float('inf')}
+
+        p = Constants.STOP_RULE_PERCENTILE / 100
+        spread = Constants.STOP_RULE_Z * (n * p * (1 - p)) ** 0.5
+        lower = int(n * p - spread)
+        upper = int(n * p + spread) + 1
+        if lower < 0 or upper >= n:
+            percentile_half_width = float('inf')
+        else:
+            percentile_half_width = (self.sorted_latencies[upper] - self.sorted_latencies[lower]) / 2
+
+        return {'mean': Constants.STOP_RULE_Z * (self.stats.m2 / (n - 1) / n) ** 0.5, 'p95': percentile_half_width}
+
+    # Returns the reason for stopping (for the log) or None if the measurement should go on
+    def check(self):
+        n = self.stats.n
+        if n < self.min_samples or n % Constants.STOP_RULE_CHECK_INTERVAL != 0:
+            return None
+
+        half_widths = self.half_widths()
+        if max(half_widths.values()) > self.target:
+            return None
+        return 'precision reached after %d measurements: mean +-%.3fms, p95 +-%.3fms (target +-%.3fms)' % (
+            n, half_widths['mean'], half_widths['p95'], self.target)
+
+
+# Compare the summary of the streamed measurements with the latencies read from the log afterwards.
+# Returns a list of descriptions of all differences (empty if both are consistent).
+def check_consistency(summary, latencies, tolerance=0.001):
+    import numpy as np
+
+    latencies = np.asarray(latencies, dtype=np.float64)
+    differences = []
+
+    if summary['n'] != len(latencies):
+        differences.append('number of measurements: ' + str(summary['n']) + ' streamed, ' +
+                           str(len(latencies)) + ' in log')
+        return differences
+    if len(latencies) == 0:
+        return differences
+
+    for name, value in [('mean', np.mean(latencies)), ('min', np.min(latencies)), ('max', np.max(latencies))]:
+        if abs(summary[name] - value) > tolerance:
+            differences.append(name + ': ' + str(summary[name]) + 'ms streamed, ' + str(value) + 'ms in log')
+
+    return differences
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Histogram and ECDF of a running measurement, drawn with QPainter on page three of latency_gui.py.
+# The widget only draws snapshots of a LatencyStats.StreamingHistogram, which is fed in the thread of the measurement.
+# Snapshots arrive at most once per frame (see ProgressProtocol.ProgressReader) and drawing takes time proportional
+# to the number of bins, not the number of measurements.
+#
+# Bars: all measurements so far. Orange line: the latest measurements (a drift shows as a shift against the bars).
+# Dark line: ECDF of all measurements (from 0 at the bottom to 1 at the top).
+
+from PyQt5.QtCore import Qt, QPointF, QRectF
+from PyQt5.QtGui import QPainter, QPen, QColor, QPolygonF, QFont
+from PyQt5.QtWidgets import QWidget
+
+
+class Constants:
+    BAR_COLOR = '#9ecae1'
+    RECENT_COLOR = '#e6550d'
+    ECDF_COLOR = '#08519c'
+    TEXT_COLOR = '#404040'
+    FONT_SIZE = 11  # in px
+    NUM_TICKS = 5  # Labels on the x axis
+    MARGIN_TOP = 16  # Space for the number of measurements and the legend in px
+    MARGIN_BOTTOM = 16  # Space for the labels of the x axis in px
+    MARGIN_SIDE = 4
+    TICK_LABEL_WIDTH = 60  # in px
+    LEGEND_SPACING = 10  # in px
+    WAITING_TEXT = 'Histogram appears after the first measurements'
+
+
+class HistogramWidget(QWidget):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.snapshot = None  # Latest LatencyStats.StreamingHistogram.snapshot()
+
+    def clear(self):
+        self.snapshot = None
+        self.update()
+
+    def set_snapshot(self, snapshot):
+        self.snapshot = snapshot
+        self.update()  # Repaints are merged by Qt, so several snapshots per frame are drawn only once
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        font = QFont()
+        font.setPixelSize(Constants.FONT_SIZE)
+        painter.setFont(font)
+        painter.setPen(QColor(Constants.TEXT_COLOR))
+
+        if self.snapshot is None:
+            painter.drawText(self.rect(), Qt.AlignCenter, Constants.WAITING_TEXT)
+            painter.end()
+            return
+
+        area = QRectF(Constants.MARGIN_SIDE, Constants.MARGIN_TOP, self.width() - 2 * Constants.MARGIN_SIDE,
+                      self.height() - Constants.MARGIN_TOP - Constants.MARGIN_BOTTOM)
+        self.draw_labels(painter, area)
+        painter.setRenderHint(QPainter.Antialiasing)
+        self.draw_histogram(painter, area)
+        painter.end()
+
+    def draw_histogram(self, painter, area):
+        counts = self.snapshot['counts']
+        recent = self.snapshot['recent']
+        bin_width = area.width() / len(counts)
+
+        # Both histograms as proportions, so the few latest measurements are comparable to all of them
+        total = max(1, sum(counts))
+        recent_total = max(1, sum(recent))
+        scale = area.height() / max(max(counts) / total, max(recent) / recent_total, 1e-9)
+
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(Constants.BAR_COLOR))
+        for i, count in enumerate(counts):
+            if count > 0:
+                height = count / total * scale
+                painter.drawRect(QRectF(area.left() + i * bin_width, area.bottom() - height, bin_width, height))
+
+        outline = QPolygonF()
+        for i, count in enumerate(recent):
+            y = area.bottom() - count / recent_total * scale
+            outline.append(QPointF(area.left() + i * bin_width, y))
+            outline.append(QPointF(area.left() + (i + 1) * bin_width, y))
+        pen = QPen(QColor(Constants.RECENT_COLOR))
+        pen.setWidthF(1.5)
+        painter.setPen(pen)
+        painter.drawPolyline(outline)
+
+        # ECDF at the right edges of the bins, starting with the measurements left of the bins
+        cumulative = self.snapshot['below']
+        ecdf = QPolygonF([QPointF(area.left(), area.bottom() - cumulative / self.snapshot['n'] * area.height())])
+        for i, count in enumerate(counts):
+            cumulative += count
+            ecdf.append(QPointF(area.left() + (i + 1) * bin_width,
+                                area.bottom() - cumulative / self.snapshot['n'] * area.height()))
+        pen = QPen(QColor(Constants.ECDF_COLOR))
+        pen.setWidthF(1.5)
+        painter.setPen(pen)
+        painter.drawPolyline(ecdf)
+
+    def draw_labels(self, painter, area):
+        snapshot = self.snapshot
+        high = snapshot['low'] + snapshot['width'] * len(snapshot['counts'])
+        for k in range(Constants.NUM_TICKS):
+            x = area.left() + area.width() * k / (Constants.NUM_TICKS - 1)
+            value = snapshot['low'] + (high - snapshot['low']) * k / (Constants.NUM_TICKS - 1)
+            left = min(max(x - Constants.TICK_LABEL_WIDTH / 2, area.left()), area.right() - Constants.TICK_LABEL_WIDTH)
+            painter.drawText(QRectF(left, area.bottom(), Constants.TICK_LABEL_WIDTH, Constants.MARGIN_BOTTOM),
+                             Qt.AlignCenter, '%.1f' % value)
+
+        text = 'n = %d' % snapshot['n']
+        if snapshot['below'] + snapshot['above'] > 0:
+            text += '  (%d < %.1f ms, %d > %.1f ms)' % (snapshot['below'], snapshot['low'], snapshot['above'], high)
+        painter.drawText(QRectF(area.left(), 0, area.width(), Constants.MARGIN_TOP), Qt.AlignLeft | Qt.AlignVCenter,
+                         text)
+
+        # Legend at the top right, drawn from right to left
+        legend = QRectF(area.left(), 0, area.width(), Constants.MARGIN_TOP)
+        for label, color in [('ECDF', Constants.ECDF_COLOR), ('latest', Constants.RECENT_COLOR),
+                             ('all', Constants.BAR_COLOR)]:
+            painter.setPen(QColor(color))
+            bounds = painter.boundingRect(legend, Qt.AlignRight | Qt.AlignVCenter, label)
+            painter.drawText(legend, Qt.AlignRight | Qt.AlignVCenter, label)
+            legend.setRight(bounds.left() - Constants.LEGEND_SPACING)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Reading and writing of the .csv logs created by the LagBox (see logAutoModeData in fileLog.c)
+#
+# A log consists of a block of metadata lines ("#key:;value"), an empty line, the header of the measurements
+# ("counter;latency;delayTime") and one row per measurement. Latencies are stored in microseconds.
+#
+# Optionally, a binary companion file (.lbx) is stored next to a log. It contains the same data in a compact columnar
+# layout that is loaded with numpy.memmap instead of being parsed:
+#   magic (8 bytes) | length of the JSON header (uint32) | JSON header | columns
+# The JSON header holds the metadata, the number of rows, dtype and offset of every column (relative to the first
+# column, which starts at the next multiple of 8 bytes) and size and modification time of the .csv log it was created
+# from. A companion is only used as long as the .csv log has not changed.
+#
+# numpy is only imported by the functions that need it, so updating the metadata does not require loading numpy
+
+import json
+import os
+import shutil
+import struct
+import tempfile
+
+
+class Constants:
+    CSV_DELIMITER = ';'
+    COMMENT_CHAR = '#'
+    METADATA_SEPARATOR = ':;'  # Separates key and value of a metadata line
+    MEASUREMENT_HEADER = 'counter;latency;delayTime'
+    CHUNK_SIZE = 1048576  # Number of characters that are decoded at once. Limits the memory used while parsing
+
+    COMPANION_EXTENSION = '.lbx'
+    COMPANION_MAGIC = b'LAGBOX\x00\x01'
+    COMPANION_PREFIX_FORMAT = '<8sI'  # Magic and length of the JSON header
+    COMPANION_ALIGNMENT = 8
+    COMPANION_COLUMNS = ['counter', 'latency', 'delayTime']
+
+
+# All data of a single LagBox log
+class LagBoxLog:
+
+    def __init__(self, file_path, metadata, counter, latency, delay_time):
+        self.file_path = file_path
+        self.metadata = metadata  # Dict of all "#key:;value" lines of the header
+        self.counter = counter  # Index of the measurement (numpy integer array)
+        self.latency = latency  # Measured latency in microseconds (numpy integer array)
+        self.delay_time = delay_time  # Delay before triggering the button in microseconds (numpy integer array)
+
+    def __len__(self):
+        return len(self.latency)
+
+    # Latencies in milliseconds, as displayed in the plots and statistics
+    def latencies_ms(self):
+        return self.latency / 1000
+
+
+# Split a metadata line ("#key:;value") into key and value. Returns None for all other comment lines
+def parse_metadata_line(line):
+    line = line.rstrip('\r\n')
+    if not line.startswith(Constants.COMMENT_CHAR) or Constants.METADATA_SEPARATOR not in line:
+        return None
+
+    key, value = line[1:].split(Constants.METADATA_SEPARATOR, 1)
+    return key, value
+
+
+# Decode a list of measurement rows into a (rows x columns) int64 array
+def decode_rows(rows, num_columns=3):
+    import numpy as np
+
+    text = ''.join(rows).replace('\r', '').replace('\n', Constants.CSV_DELIMITER).strip(Constants.CSV_DELIMITER)
+    if len(text) == 0:
+        return np.empty((0, num_columns), dtype=np.int64)
+
+    values = np.fromstring(text, dtype=np.int64, sep=Constants.CSV_DELIMITER)
+    if len(values) % num_columns != 0:
+        raise ValueError('Measurement rows do not contain ' + str(num_columns) + ' values each')
+
+    return values.reshape(-1, num_columns)
+
+
+# Read the metadata block of an opened log file. Stops after the header of the measurements.
+# Returns the metadata dict and whether the header of the measurements was found.
+def read_metadata(file):
+    metadata = {}
+
+    for line in file:
+        if line.startswith(Constants.COMMENT_CHAR):
+            key_value = parse_metadata_line(line)
+            if key_value is not None:
+                metadata[key_value[0]] = key_value[1]
+        elif line.rstrip('\r\n') == Constants.MEASUREMENT_HEADER:
+            return metadata, True
+
+    return metadata, False
+
+
+# Read the measurement rows of an opened log file in blocks of roughly chunk_size characters.
+# Every block ends with a complete row.
+def read_row_chunks(file, chunk_size=Constants.CHUNK_SIZE):
+    remainder = ''
+    while True:
+        block = file.read(chunk_size)
+        if len(block) == 0:
+            if len(remainder) > 0:
+                yield remainder
+            return
+
+        block = remainder + block
+        end = block.rfind('\n') + 1
+        remainder = block[end:]
+        if end > 0:
+            yield block[:end]
+
+
+# Read a LagBox log. The measurements are decoded in blocks of chunk_size characters, so apart from the resulting
+# arrays only a single block of text is held in memory at any time.
+def read_log(file_path, chunk_size=Constants.CHUNK_SIZE):
+    import numpy as np
+
+    with open(file_path, 'r') as file:
+        metadata, header_found = read_metadata(file)
+
+        # The number of iterations in the header is a good guess for the size of the arrays
+        try:
+            capacity = max(int(metadata.get('iterations', 0)), 1)
+        except ValueError:
+            capacity = 1
+        data = np.empty((capacity, 3), dtype=np.int64)
+        length = 0
+
+        for rows in (read_row_chunks(file, chunk_size) if header_found else []):
+            chunk = decode_rows([rows])
+
+            if length + len(chunk) > len(data):
+                data = np.resize(data, (max(len(data) * 2, length + len(chunk)), 3))
+            data[length:length + len(chunk)] = chunk
+            length += len(chunk)
+
+    data = data[:length]
+    return LagBoxLog(file_path, metadata, data[:, 0].copy(), data[:, 1].copy(), data[:, 2].copy())
+
+
+# Set the values of metadata lines ("#key:;value") of a log. changes is a dict of keys and their new values.
+# Keys that do not exist yet are added at the end of the metadata block.
+# Only the header is rewritten, the measurements are copied unchanged. The new file is written next to the log and
+# then replaces it atomically, so an interrupted update never leaves a corrupted log behind.
+def update_metadata(file_path, changes):
+    changes = {key: str(value).replace('\r', ' ').replace('\n', ' ') for key, value in changes.items()}
+    header_found = False
+    header_lines = []
+
+    with open(file_path, 'rb') as file:
+        for line in file:
+            text = line.decode('utf-8')
+            if text.rstrip('\r\n') == Constants.MEASUREMENT_HEADER:
+                header_found = True
+                measurement_header = line
+                break
+            header_lines.append(text)
+
+        if not header_found:
+            raise ValueError('No measurements found in ' + file_path)
+
+        new_lines = []
+        last_metadata_index = -1
+        for text in header_lines:
+            key_value = parse_metadata_line(text)
+            if key_value is not None:
+                if key_value[0] in changes:
+                    text = Constants.COMMENT_CHAR + key_value[0] + Constants.METADATA_SEPARATOR + \
+                           changes.pop(key_value[0]) + '\n'
+                last_metadata_index = len(new_lines)
+            new_lines.append(text)
+
+        # Add all keys that were not found after the last metadata line
+        for key, value in changes.items():
+            last_metadata_index += 1
+            new_lines.insert(last_metadata_index,
+                             Constants.COMMENT_CHAR + key + Constants.METADATA_SEPARATOR + value + '\n')
+
+        # Keep the binary companion up to date, so it does not have to be created again from the .csv log
+        companion = read_companion(file_path)
+
+        def write_log(temp_file):
+            temp_file.write(''.join(new_lines).encode('utf-8'))
+            temp_file.write(measurement_header)
+            shutil.copyfileobj(file, temp_file)  # The measurements are copied without parsing them
+
+        write_atomically(file_path, write_log)
+
+    if companion is not None:
+        for text in new_lines:
+            key_value = parse_metadata_line(text)
+            if key_value is not None:
+                companion.metadata[key_value[0]] = key_value[1]
+        write_companion(companion)
+
+
+# Write a file by writing to a temporary file in the same directory first (with write_content(temp_file)) and then
+# replacing the original file atomically
+def write_atomically(file_path, write_content):
+    directory = os.path.dirname(os.path.abspath(file_path))
+    temp_file_descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(temp_file_descriptor, 'wb') as temp_file:
+            write_content(temp_file)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def get_companion_path(file_path):
+    return os.path.splitext(file_path)[0] + Constants.COMPANION_EXTENSION
+
+
+def align(offset):
+    return (offset + Constants.COMPANION_ALIGNMENT - 1) // Constants.COMPANION_ALIGNMENT * Constants.COMPANION_ALIGNMENT
+
+
+# Size and modification time of the .csv log, used to detect if a companion is outdated
+def get_source_stat(file_path):
+    file_stat = os.stat(file_path)
+    return {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns}
+
+
+# Write the binary companion of a log. Columns are stored as int32 if all values fit, otherwise as int64.
+# The counter is not stored at all if it is just 0, 1, 2, ...
+def write_companion(log):
+    import numpy as np
+
+    columns = []
+    arrays = []
+    offset = 0
+    for name, values in zip(Constants.COMPANION_COLUMNS, [log.counter, log.latency, log.delay_time]):
+        values = np.asarray(values)
+        if name == 'counter' and np.array_equal(values, np.arange(len(values))):
+            columns.append({'name': name, 'implicit': True})
+            continue
+
+        fits_int32 = len(values) == 0 or (values.min() >= np.iinfo(np.int32).min and
+                                          values.max() <= np.iinfo(np.int32).max)
+        dtype = '<i4' if fits_int32 else '<i8'
+        columns.append({'name': name, 'dtype': dtype, 'offset': offset})
+        arrays.append(values.astype(dtype))
+        offset = align(offset + arrays[-1].nbytes)
+
+    header = json.dumps({
+        'metadata': log.metadata,
+        'rows': len(log.latency),
+        'columns': columns,
+        'source': get_source_stat(log.file_path)
+    }).encode('utf-8')
+    prefix = struct.pack(Constants.COMPANION_PREFIX_FORMAT, Constants.COMPANION_MAGIC, len(header))
+
+    def write_content(file):
+        file.write(prefix + header)
+        file.write(bytes(align(len(prefix) + len(header)) - len(prefix) - len(header)))
+        for array in arrays:
+            file.write(array.tobytes())
+            file.write(bytes(align(array.nbytes) - array.nbytes))
+
+    write_atomically(get_companion_path(log.file_path), write_content)
+
+
+# Load the binary companion of a log with numpy.memmap. Returns None if there is no companion or it is outdated,
+# truncated or otherwise broken, so the .csv log is read instead
+def read_companion(file_path):
+    import numpy as np
+
+    companion_path = get_companion_path(file_path)
+    prefix_size = struct.calcsize(Constants.COMPANION_PREFIX_FORMAT)
+    try:
+        with open(companion_path, 'rb') as file:
+            magic, header_length = struct.unpack(Constants.COMPANION_PREFIX_FORMAT, file.read(prefix_size))
+            if magic != Constants.COMPANION_MAGIC:
+                return None
+            header = json.loads(file.read(header_length).decode('utf-8'))
+
+        # The companion can also be used if only the companion and not the .csv log exists
+        if os.path.exists(file_path) and header['source'] != get_source_stat(file_path):
+            return None
+
+        rows = header['rows']
+        data_start = align(prefix_size + header_length)
+        columns = {}
+        for column in header['columns']:
+            if column.get('implicit', False):
+                columns[column['name']] = np.arange(rows)
+            elif rows == 0:
+                columns[column['name']] = np.empty(0, dtype=column['dtype'])
+            else:
+                # Raises ValueError if the companion is shorter than the header says (e.g. a truncated copy)
+                columns[column['name']] = np.memmap(companion_path, dtype=column['dtype'], mode='r',
+                                                    offset=data_start + column['offset'], shape=(rows,))
+
+        return LagBoxLog(file_path, header['metadata'], columns['counter'], columns['latency'], columns['delayTime'])
+    except (OSError, ValueError, KeyError, TypeError, struct.error):
+        return None
+
+
+# Load a log from its binary companion if there is an up-to-date one, otherwise from the .csv log.
+# A missing or outdated companion is created after reading the .csv log (unless create_companion=False), so the next
+# load is fast. The log is still returned if the companion cannot be written, e.g. in a read-only directory.
+def load_log(file_path, create_companion=True):
+    log = read_companion(file_path)
+    if log is not None:
+        return log
+
+    log = read_log(file_path)
+    if create_companion:
+        try:
+            write_companion(log)
+        except OSError:
+            pass
+    return log
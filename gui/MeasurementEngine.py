@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Auto mode of the LagBox implemented in Python, as an alternative to ../bin/inputLatencyMeasureTool -m 3.
+# The button of the input device is triggered via the optocoupler and the latency is taken from the timestamp the
+# kernel assigns to the input event, instead of polling the device and reading the wall clock afterwards:
+#   - the event node is switched to CLOCK_MONOTONIC (EVIOCSCLOCKID), so event timestamps can be compared with the
+#     trigger time and are not affected by changes of the system time
+#   - the process sleeps in epoll until the event arrives, so there is no polling interval
+# Three timestamps are recorded per sample: trigger (before the pin is set), kernel event and wake-up of this process.
+#
+# Accepts the same arguments as the C tool and writes the same log file and JSON progress records (see
+# ProgressProtocol.py), so it can be run by LagBoxMeasurement in the GUI. The timestamps of all samples are saved in an
+# additional file next to the log (<log>.timestamps.csv).
+#
+# usage: python MeasurementEngine.py -m 3 -b 272 -event 3 [-tmin 100] [-tmax 10000] [-n 1000] [-name NAME] [-json 1]
+#                                    [-gpio rpi] [-pin 7] [-triggers PATH]
+
+import argparse
+import fcntl
+import gc
+import json
+import mmap
+import os
+import random
+import re
+import select
+import signal
+import struct
+import sys
+import time
+
+import KeyScanner
+import LogFile
+import Simulator
+
+
+class Constants:
+    MODE_AUTO = 3
+    LOG_DIRECTORY = '../log'
+    LOG_MODE_NAME = 'AUTO'
+    FORBIDDEN_CHARS = '/; \t.:'  # Replaced by '_' in the file name (like replaceForbiddenChars in fileLog.c)
+    TIMESTAMPS_EXTENSION = '.timestamps.csv'
+    TIMESTAMPS_HEADER = 'counter;triggerTime;eventTime;wakeTime'  # in ns (CLOCK_MONOTONIC)
+
+    BOOT_CMDLINE = '/boot/cmdline.txt'
+    POLLING_RATE_PATTERN = re.compile(r'usbhid\.mousepoll=(\d+)')
+
+    GPIO_PIN_ID = 7  # BCM number of the pin the optocoupler is connected to (wiringPi pin 11, like PIN_AUTO_MODE)
+    GPIO_BACKEND = 'rpi'
+
+    # Floor of the measurement (see benchmark_calibration.py). Recorded in the header of every log that is measured with
+    # the GPIO backend of the calibration
+    CALIBRATION_FILE = '../log/calibration.json'
+
+    EVENT_TIMEOUT = 2.0  # Maximum time between trigger and input event in s
+    RELEASE_TIMEOUT = 2.0  # Maximum time for releasing the button after the pin has been cleared in s
+    SETTLE_TIME = 0.00001  # Pause after an iteration in s (like usleep(10) in autoMode)
+
+    # Spacing of the triggers of parallel measurements (see TriggerTable), in ns
+    FRAME_LENGTH = 1000000  # Length of a USB (full speed) frame
+    SPIN_TIME = 500000  # The last part of the wait for a trigger time is spent spinning, because sleep() can overshoot
+    MAX_TRIGGER_LATENESS = 100000  # A trigger time that was missed by more than this is chosen again
+    NUM_RECENT_TRIGGERS = 16  # Trigger times kept in the shared table
+
+    # ioctls of linux/input.h
+    EVIOCSCLOCKID = 0x400445a0  # _IOW('E', 0xa0, int)
+    KEY_MAX = 0x2ff
+    EVIOCGKEY = 0x80604518  # _IOC(_IOC_READ, 'E', 0x18, (KEY_MAX + 1) / 8)
+    EVENT_READ_SIZE = KeyScanner.Constants.EVENT_SIZE * KeyScanner.Constants.EVENTS_PER_READ
+    KEY_UP = 0
+
+
+# Drives the optocoupler via RPi.GPIO
+class RPiGpioBackend:
+
+    def __init__(self, pin):
+        import RPi.GPIO as GPIO  # Only available on the Raspberry Pi
+
+        self.gpio = GPIO
+        self.pin = pin
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(pin, GPIO.OUT)
+        GPIO.output(pin, GPIO.LOW)
+
+    def set_output(self, high):
+        self.gpio.output(self.pin, self.gpio.HIGH if high else self.gpio.LOW)
+
+    def close(self):
+        self.gpio.output(self.pin, self.gpio.LOW)
+
+
+# All ways of triggering the button, selected with -gpio. A backend is created with the pin number and needs
+# set_output(high) and close()
+GPIO_BACKENDS = {
+    'rpi': RPiGpioBackend,
+    'simulator': Simulator.SimulatedGpioBackend  # Needs a running Simulator.py
+}
+
+
+def get_monotonic_time():
+    return time.clock_gettime_ns(time.CLOCK_MONOTONIC)
+
+
+# Time for a trigger that is requested at now: now, unless another trigger is less than frame_length away. Then the
+# trigger is moved to frame_length after the other one (and further, if that collides with yet another trigger)
+def find_trigger_time(now, other_times, frame_length=Constants.FRAME_LENGTH):
+    trigger_time = now
+    for other_time in sorted(other_times):
+        if abs(trigger_time - other_time) < frame_length:
+            trigger_time = other_time + frame_length
+    return trigger_time
+
+
+# Keeps the triggers of measurements that run at the same time (see MeasurementScheduler.py) more than a USB frame
+# apart. The processes share a table with the latest trigger times in a file (in /dev/shm, created by the scheduler),
+# which is locked while a trigger time is chosen. A trigger happens as soon as its random delay is over and is only
+# moved if another measurement triggers within a frame of it, so the trigger times stay independent of the polling of
+# the device.
+class TriggerTable:
+
+    HEADER = struct.Struct('<q')  # Index of the next entry
+    ENTRY = struct.Struct('<q')  # Trigger time in ns (CLOCK_MONOTONIC)
+    SIZE = HEADER.size + ENTRY.size * Constants.NUM_RECENT_TRIGGERS
+
+    def __init__(self, path):
+        self.file_descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.file_descriptor).st_size < TriggerTable.SIZE:
+            os.ftruncate(self.file_descriptor, TriggerTable.SIZE)
+        self.table = mmap.mmap(self.file_descriptor, TriggerTable.SIZE)
+
+    # Create an empty table for a new group of parallel measurements. Returns its path
+    @staticmethod
+    def create():
+        import tempfile
+
+        directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        file_descriptor, path = tempfile.mkstemp(prefix='lagbox-triggers-', dir=directory)
+        try:
+            os.ftruncate(file_descriptor, TriggerTable.SIZE)
+        finally:
+            os.close(file_descriptor)
+        return path
+
+    # Choose the trigger time and enter it into the table
+    def reserve(self):
+        fcntl.flock(self.file_descriptor, fcntl.LOCK_EX)
+        try:
+            next_index = TriggerTable.HEADER.unpack_from(self.table, 0)[0]
+            other_times = [TriggerTable.ENTRY.unpack_from(self.table, TriggerTable.HEADER.size +
+                                                          i * TriggerTable.ENTRY.size)[0]
+                           for i in range(Constants.NUM_RECENT_TRIGGERS)]
+            trigger_time = find_trigger_time(get_monotonic_time(), other_times)
+            TriggerTable.ENTRY.pack_into(self.table, TriggerTable.HEADER.size + TriggerTable.ENTRY.size *
+                                         (next_index % Constants.NUM_RECENT_TRIGGERS), trigger_time)
+            TriggerTable.HEADER.pack_into(self.table, 0, next_index + 1)
+        finally:
+            fcntl.flock(self.file_descriptor, fcntl.LOCK_UN)
+        return trigger_time
+
+    # Sleep until the trigger time. Returns the time waited in ns
+    def wait(self):
+        start = get_monotonic_time()
+        while True:
+            trigger_time = self.reserve()
+            now = get_monotonic_time()
+            if trigger_time - now > Constants.SPIN_TIME:
+                time.sleep((trigger_time - now - Constants.SPIN_TIME) / 1000000000)
+            while get_monotonic_time() < trigger_time:
+                pass
+
+            # If the process was not scheduled in time, the trigger could come too close to another one
+            if get_monotonic_time() - trigger_time <= Constants.MAX_TRIGGER_LATENESS:
+                return get_monotonic_time() - start
+
+    def close(self):
+        self.table.close()
+        os.close(self.file_descriptor)
+
+
+# An event node (/dev/input/eventXX) whose event timestamps use CLOCK_MONOTONIC
+class InputDevice:
+
+    def __init__(self, path):
+        self.path = path
+        self.file_descriptor = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        fcntl.ioctl(self.file_descriptor, Constants.EVIOCSCLOCKID, struct.pack('i', time.CLOCK_MONOTONIC))
+        self.epoll = select.epoll()
+        self.epoll.register(self.file_descriptor, select.EPOLLIN)
+
+    # Name of the device as reported by the kernel (like EVIOCGNAME in joystickControl.c)
+    def get_name(self):
+        try:
+            with open('/sys/class/input/' + os.path.basename(self.path) + '/device/name', 'r') as file:
+                return file.readline().strip()
+        except OSError:
+            return os.path.basename(self.path)
+
+    def is_pressed(self, code):
+        state = bytearray((Constants.KEY_MAX + 1) // 8)
+        fcntl.ioctl(self.file_descriptor, Constants.EVIOCGKEY, state)
+        return (state[code // 8] >> (code % 8)) & 1 == 1
+
+    # Discard all events that have not been read yet
+    def flush(self):
+        try:
+            while len(os.read(self.file_descriptor, Constants.EVENT_READ_SIZE)) > 0:
+                pass
+        except BlockingIOError:
+            pass
+
+    # Wait until the button with the given code changes to value (1 = pressed, 0 = released).
+    # Returns the kernel timestamp of the event and the time this process woke up (both in ns), or None on a timeout
+    def wait_for_key(self, code, value, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or len(self.epoll.poll(remaining)) == 0:
+                return None
+            wake_time = get_monotonic_time()
+
+            try:
+                data = os.read(self.file_descriptor, Constants.EVENT_READ_SIZE)
+            except BlockingIOError:
+                continue
+
+            for offset in range(0, len(data) - KeyScanner.Constants.EVENT_SIZE + 1, KeyScanner.Constants.EVENT_SIZE):
+                seconds, microseconds, event_type, event_code, event_value = struct.unpack_from(
+                    KeyScanner.Constants.EVENT_FORMAT, data, offset)
+                if event_type == KeyScanner.Constants.EV_KEY and event_code == code and event_value == value:
+                    return seconds * 1000000000 + microseconds * 1000, wake_time
+
+    def close(self):
+        self.epoll.close()
+        os.close(self.file_descriptor)
+
+
+class Sample:
+
+    def __init__(self, counter, delay_time, trigger_time, event_time, wake_time):
+        self.counter = counter
+        self.delay_time = delay_time  # Random delay before the trigger in µs
+        self.trigger_time = trigger_time  # Timestamps in ns (CLOCK_MONOTONIC)
+        self.event_time = event_time
+        self.wake_time = wake_time
+
+    # Latency from the trigger to the input event in the kernel in µs
+    def get_latency(self):
+        return (self.event_time - self.trigger_time) // 1000
+
+
+# Evenly distributed delays between min_delay and max_delay in random order (like createDelayList in the C tool)
+def create_delay_list(min_delay, max_delay, length):
+    delays = [min_delay + (max_delay - min_delay) // length * i for i in range(length)]
+    random.shuffle(delays)
+    return delays
+
+
+# Write one JSON progress record per line. stdout is flushed, so the GUI receives every record immediately
+def print_record(record):
+    sys.stdout.write(json.dumps(record) + '\n')
+    sys.stdout.flush()
+
+
+class MeasurementEngine:
+
+    def __init__(self, gpio, input_device, button_code, trigger_table=None):
+        self.gpio = gpio
+        self.input_device = input_device
+        self.button_code = button_code
+        self.trigger_table = trigger_table  # TriggerTable if other measurements run at the same time
+        self.stop_requested = False  # Set by request_stop (SIGUSR1). The run ends after the current sample
+
+    def request_stop(self):
+        self.stop_requested = True
+
+    # Wait until the button is released after the pin has been cleared
+    def wait_for_release(self):
+        if not self.input_device.is_pressed(self.button_code):
+            return True
+        return self.input_device.wait_for_key(self.button_code, Constants.KEY_UP, Constants.RELEASE_TIMEOUT) \
+            is not None
+
+    def measure_sample(self, counter, delay_time):
+        self.gpio.set_output(False)
+        if not self.wait_for_release():
+            raise TimeoutError('Button was not released')
+
+        time.sleep(delay_time / 1000000)  # Make sure we are not synced with the polling of the device
+        if self.trigger_table is not None:
+            # A trigger moved away from that of another measurement waits longer, which is added to the delay
+            delay_time += self.trigger_table.wait() // 1000
+        self.input_device.flush()
+
+        trigger_time = get_monotonic_time()
+        self.gpio.set_output(True)
+        result = self.input_device.wait_for_key(self.button_code, KeyScanner.Constants.KEY_DOWN,
+                                                Constants.EVENT_TIMEOUT)
+        if result is None:
+            raise TimeoutError('No input event within ' + str(Constants.EVENT_TIMEOUT) + ' s')
+
+        return Sample(counter, delay_time, trigger_time, result[0], result[1])
+
+    # Run all iterations. on_sample is called after every sample
+    def run(self, delays, on_sample):
+        samples = []
+        # The garbage collector could pause the process between trigger and wake-up
+        gc.disable()
+        try:
+            for counter, delay_time in enumerate(delays):
+                if self.stop_requested:
+                    break
+                samples.append(self.measure_sample(counter, delay_time))
+                on_sample(samples[-1])
+                time.sleep(Constants.SETTLE_TIME)
+        finally:
+            self.gpio.set_output(False)
+            gc.enable()
+        return samples
+
+
+# Polling rate set for usbhid in /boot/cmdline.txt (like getPollingRate in fileLog.c). 0 if it is not set
+def get_polling_rate():
+    try:
+        with open(Constants.BOOT_CMDLINE, 'r') as file:
+            match = Constants.POLLING_RATE_PATTERN.search(file.read())
+    except OSError:
+        return 0
+    return int(match.group(1)) if match is not None else 0
+
+
+def filter_name(name):
+    for char in Constants.FORBIDDEN_CHARS:
+        name = name.replace(char, '_')
+    return name
+
+
+def get_log_path(file_name):
+    os.makedirs(Constants.LOG_DIRECTORY, exist_ok=True)
+    number = 1
+    while True:
+        path = os.path.join(Constants.LOG_DIRECTORY, '%s_%s_%dms_%d.csv' % (Constants.LOG_MODE_NAME, file_name,
+                                                                            get_polling_rate(), number))
+        if not os.path.exists(path):
+            return path
+        number += 1
+
+
+# Write the log in the same format as logAutoModeData in fileLog.c and the timestamps of all samples next to it
+def write_log(path, metadata, samples):
+    with open(path, 'w') as file:
+        for key, value in metadata.items():
+            file.write(LogFile.Constants.COMMENT_CHAR + key + LogFile.Constants.METADATA_SEPARATOR + str(value) + '\n')
+        file.write('\n' + LogFile.Constants.MEASUREMENT_HEADER + '\n')
+        for sample in samples:
+            file.write('%d;%d;%d\n' % (sample.counter, sample.get_latency(), sample.delay_time))
+
+    with open(os.path.splitext(path)[0] + Constants.TIMESTAMPS_EXTENSION, 'w') as file:
+        file.write(Constants.TIMESTAMPS_HEADER + '\n')
+        for sample in samples:
+            file.write('%d;%d;%d;%d\n' % (sample.counter, sample.trigger_time, sample.event_time, sample.wake_time))
+
+
+# The header of a new log (like writeFileHeader in fileLog.c). The empty fields are filled in by the GUI later
+def create_metadata(device_name, button_code, min_delay, max_delay, iterations, gpio_backend, stopped_early=False):
+    metadata = {'Device': device_name, 'Button': button_code, 'minDelay': min_delay, 'maxDelay': max_delay,
+                'iterations': iterations, 'stoppedEarly': int(stopped_early), 'stopReason': ''}
+    for key in ['author', 'vendorId', 'productId', 'date', 'bInterval', 'deviceType', 'email', 'public', 'notes',
+                'EAN', 'deviceSpeed']:
+        metadata[key] = ''
+    metadata['timestamps'] = 'kernel'  # The latency is measured up to the kernel timestamp of the input event
+
+    calibration = load_calibration(gpio_backend)
+    if calibration is not None:
+        metadata['calibrationFloor'] = calibration['median_us']  # Latency measured without any device latency in µs
+        metadata['calibrationJitter'] = calibration['std_us']
+    return metadata
+
+
+# The calibration of the given GPIO backend, or None. The floor of the simulator says nothing about the optocoupler of a
+# real LagBox, so a calibration is only used for the backend it was measured with
+def load_calibration(gpio_backend):
+    try:
+        with open(Constants.CALIBRATION_FILE, 'r') as file:
+            calibration = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return calibration if calibration.get('gpio') == gpio_backend else None
+
+
+def parse_arguments():
+    # Single-dash options like the C tool. -d, -delay and -json are accepted for compatibility
+    parser = argparse.ArgumentParser(description='LagBox auto mode using kernel event timestamps')
+    parser.add_argument('-m', type=int, default=Constants.MODE_AUTO, help='mode (only 3 = auto mode is supported)')
+    parser.add_argument('-tmin', type=int, default=100, help='minimum delay in µs')
+    parser.add_argument('-tmax', type=int, default=10000, help='maximum delay in µs')
+    parser.add_argument('-n', type=int, default=100, help='number of test iterations')
+    parser.add_argument('-b', type=int, required=True, help='button code')
+    parser.add_argument('-d', type=int, default=0, help='device type (ignored)')
+    parser.add_argument('-delay', type=int, default=0, help='ignored')
+    parser.add_argument('-event', type=int, required=True, help='number of the input event node')
+    parser.add_argument('-name', default=None, help='device name for the log file')
+    parser.add_argument('-json', type=int, default=1, help='ignored, the progress is always written as JSON')
+    parser.add_argument('-gpio', default=Constants.GPIO_BACKEND, choices=sorted(GPIO_BACKENDS.keys()),
+                        help='GPIO backend used to trigger the button')
+    parser.add_argument('-pin', type=int, default=Constants.GPIO_PIN_ID, help='BCM number of the optocoupler pin')
+    parser.add_argument('-triggers', default=None, help='table of the trigger times shared with parallel '
+                                                        'measurements (see TriggerTable)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.m != Constants.MODE_AUTO:
+        print_record({'type': 'error', 'message': 'Only auto mode (-m 3) is supported'})
+        sys.exit(1)
+    if args.tmin <= 0 or args.tmax <= 0 or args.n <= 0:
+        print_record({'type': 'error', 'message': 'Invalid params'})
+        sys.exit(1)
+
+    try:
+        input_device = InputDevice(os.path.join(KeyScanner.Constants.INPUT_DEVICE_DIRECTORY,
+                                                'event' + str(args.event)))
+    except OSError as e:
+        print_record({'type': 'error', 'message': 'Device not found: ' + str(e)})
+        sys.exit(1)
+
+    try:
+        # A real-time priority keeps other processes from delaying the wake-up (needs root)
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(os.sched_get_priority_min(os.SCHED_FIFO)))
+    except (OSError, AttributeError):
+        pass
+
+    device_name = args.name if args.name is not None else input_device.get_name()
+    gpio = GPIO_BACKENDS[args.gpio](args.pin)
+    trigger_table = TriggerTable(args.triggers) if args.triggers is not None else None
+    engine = MeasurementEngine(gpio, input_device, args.b, trigger_table)
+    delays = create_delay_list(args.tmin, args.tmax, args.n)
+    # Like the C tool, the GUI sends SIGUSR1 to end the measurement early
+    signal.signal(signal.SIGUSR1, lambda signum, frame: engine.request_stop())
+
+    def on_sample(sample):
+        print_record({'type': 'sample', 'i': sample.counter + 1, 'n': args.n, 'latency_us': sample.get_latency(),
+                      'delay_us': sample.delay_time, 'trigger_ns': sample.trigger_time,
+                      'event_ns': sample.event_time, 'wake_ns': sample.wake_time})
+
+    try:
+        samples = engine.run(delays, on_sample)
+    except (OSError, TimeoutError) as e:
+        print_record({'type': 'error', 'message': str(e)})
+        sys.exit(1)
+    finally:
+        gpio.close()
+        input_device.close()
+        if trigger_table is not None:
+            trigger_table.close()
+
+    # The filtered name is used for the file name and the header, like in the C tool
+    device_name = filter_name(device_name)
+    path = get_log_path(device_name)
+    try:
+        write_log(path, create_metadata(device_name, args.b, args.tmin, args.tmax, args.n, args.gpio,
+                                        len(samples) < args.n), samples)
+    except OSError as e:
+        print_record({'type': 'error', 'message': 'Error writing log file: ' + str(e)})
+        sys.exit(1)
+
+    print_record({'type': 'log', 'path': path})
+    print_record({'type': 'done', 'device': device_name})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Measures several devices at the same time. Every device has its own optocoupler pin, event node and button, and is
+# measured by its own MeasurementEngine.py process, which writes its own log as usual. The jobs are read from an .ini
+# file with one section per device:
+#
+#   [Logitech G203]
+#   event = 3
+#   button = 272
+#   pin = 7
+#   iterations = 1000  (optional, like -n; also tmin and tmax)
+#   socket = /tmp/lagbox-simulator-1.sock  (optional, Simulator.py socket for -gpio simulator)
+#
+# Up to --parallel jobs run at once, the others wait in the queue. Jobs that use the same pin or event node never run
+# at the same time. The running jobs share a table of their trigger times (see MeasurementEngine.TriggerTable), so the
+# buttons of different devices are never triggered within the same USB frame.
+#
+# With --compare, every job is measured twice: alone and then in parallel with the others, and the latencies of both
+# runs are compared to show whether measuring in parallel affects the results.
+#
+# usage: python MeasurementScheduler.py jobs.ini [--parallel N] [--compare] [--gpio rpi|simulator]
+
+import argparse
+import configparser
+import os
+import selectors
+import signal
+import sys
+import time
+from subprocess import Popen, PIPE, DEVNULL
+
+import MeasurementEngine
+import ProgressProtocol
+
+
+class Constants:
+    ENGINE_COMMAND = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'MeasurementEngine.py')]
+    DEFAULT_ITERATIONS = 1000
+    DEFAULT_MIN_DELAY = 100  # in µs, like the GUI
+    DEFAULT_MAX_DELAY = 10000
+    PROGRESS_INTERVAL = 1.0  # Time between two progress reports in s
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    CONFIDENCE_Z = 1.96  # For the 95% confidence interval of the difference of the means
+
+
+class Job:
+
+    def __init__(self, name, event, button, pin, iterations=Constants.DEFAULT_ITERATIONS,
+                 min_delay=Constants.DEFAULT_MIN_DELAY, max_delay=Constants.DEFAULT_MAX_DELAY, socket=None):
+        self.name = name  # Device name, used for the log like -name
+        self.event = event  # Number of the event node (/dev/input/eventXX)
+        self.button = button
+        self.pin = pin
+        self.iterations = iterations
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.socket = socket
+        self.reset()
+
+    # Forget the results of a previous run, so the job can be run again
+    def reset(self):
+        self.status = Constants.STATUS_QUEUED
+        self.process = None
+        self.decoder = None
+        self.completed = 0
+        self.latencies = []  # in µs
+        self.log_path = None
+        self.error = None
+
+    def get_command(self, gpio_backend, trigger_table_path=None):
+        command = Constants.ENGINE_COMMAND + [
+            '-m', str(MeasurementEngine.Constants.MODE_AUTO),
+            '-tmin', str(self.min_delay), '-tmax', str(self.max_delay),
+            '-b', str(self.button),
+            '-event', str(self.event),
+            '-n', str(self.iterations),
+            '-name', self.name,
+            '-json', '1',
+            '-gpio', gpio_backend,
+            '-pin', str(self.pin)
+        ]
+        if trigger_table_path is not None:
+            command += ['-triggers', trigger_table_path]
+        return command
+
+
+def load_jobs(file_path):
+    config = configparser.ConfigParser()
+    if len(config.read(file_path)) == 0:
+        raise ValueError('Job file missing: ' + file_path)
+
+    jobs = []
+    for name in config.sections():
+        section = config[name]
+        try:
+            jobs.append(Job(name, section.getint('event'), section.getint('button'), section.getint('pin'),
+                            section.getint('iterations', Constants.DEFAULT_ITERATIONS),
+                            section.getint('tmin', Constants.DEFAULT_MIN_DELAY),
+                            section.getint('tmax', Constants.DEFAULT_MAX_DELAY), section.get('socket')))
+        except (TypeError, ValueError):
+            raise ValueError('Job ' + name + ' needs integer values for event, button and pin')
+
+    if len(jobs) == 0:
+        raise ValueError('No jobs in ' + file_path)
+    return jobs
+
+
+class MeasurementScheduler:
+
+    def __init__(self, jobs, max_parallel, gpio_backend=MeasurementEngine.Constants.GPIO_BACKEND, on_progress=None):
+        self.jobs = jobs
+        self.max_parallel = max_parallel
+        self.gpio_backend = gpio_backend
+        self.on_progress = on_progress  # Called with the list of jobs at most every PROGRESS_INTERVAL s
+        self.selector = None
+        self.last_progress = 0.0
+        self.trigger_table_path = None  # Shared by the running measurements, created when the first job starts
+
+    def get_running(self):
+        return [job for job in self.jobs if job.status == Constants.STATUS_RUNNING]
+
+    # A queued job can start if fewer than max_parallel jobs run and its pin and event node are not in use
+    def can_start(self, job, running):
+        return len(running) < self.max_parallel and \
+            all(other.pin != job.pin and other.event != job.event for other in running)
+
+    def start(self, job, running):
+        if self.max_parallel > 1 and self.trigger_table_path is None:
+            self.trigger_table_path = MeasurementEngine.TriggerTable.create()
+
+        environment = dict(os.environ)
+        if job.socket is not None:
+            environment['LAGBOX_SIMULATOR_SOCKET'] = job.socket
+
+        job.status = Constants.STATUS_RUNNING
+        job.decoder = ProgressProtocol.ProgressDecoder()
+        try:
+            # In its own session, Ctrl+C only reaches the scheduler, which then stops the measurements cleanly
+            job.process = Popen(job.get_command(self.gpio_backend, self.trigger_table_path), stdin=DEVNULL, stdout=PIPE,
+                                env=environment, close_fds=True, start_new_session=True)
+        except OSError as e:
+            self.finish(job, str(e))
+            return
+        self.selector.register(job.process.stdout, selectors.EVENT_READ, job)
+
+    def on_record(self, job, record):
+        if record['type'] == ProgressProtocol.Constants.TYPE_SAMPLE:
+            job.completed = record['i']
+            job.latencies.append(record['latency_us'])
+        elif record['type'] == ProgressProtocol.Constants.TYPE_LOG:
+            job.log_path = record['path']
+        elif record['type'] == ProgressProtocol.Constants.TYPE_ERROR:
+            job.error = record['message']
+
+    def finish(self, job, error=None):
+        if job.process is not None:
+            self.selector.unregister(job.process.stdout)
+            job.process.stdout.close()
+            job.process.wait()
+            if error is None and job.error is None and job.log_path is None:
+                error = 'Measurement stopped unexpectedly (exit code ' + str(job.process.returncode) + ')'
+
+        job.error = error or job.error
+        job.status = Constants.STATUS_FAILED if job.error is not None else Constants.STATUS_DONE
+
+    def report_progress(self, force=False):
+        if self.on_progress is None:
+            return
+        if force or time.monotonic() - self.last_progress >= Constants.PROGRESS_INTERVAL:
+            self.last_progress = time.monotonic()
+            self.on_progress(self.jobs)
+
+    # Run all queued jobs. Returns when all are done or failed. Can be called again after stop() to wait for the
+    # running jobs
+    def run(self):
+        self.selector = selectors.DefaultSelector()
+        for job in self.get_running():
+            if job.process is not None:
+                self.selector.register(job.process.stdout, selectors.EVENT_READ, job)
+        try:
+            while True:
+                running = self.get_running()
+                for job in self.jobs:
+                    if job.status == Constants.STATUS_QUEUED and self.can_start(job, running):
+                        self.start(job, running)
+                        running = self.get_running()
+
+                if len(running) == 0:
+                    break
+
+                for key, _ in self.selector.select(Constants.PROGRESS_INTERVAL):
+                    job = key.data
+                    data = os.read(key.fd, ProgressProtocol.Constants.READ_SIZE)
+                    records = job.decoder.feed(data) if len(data) > 0 else job.decoder.finish()
+                    for record in records:
+                        self.on_record(job, record)
+                    if len(data) == 0:
+                        self.finish(job)
+                self.report_progress()
+        finally:
+            self.selector.close()
+        self.report_progress(True)
+
+    # Remove the trigger table after all measurements have ended
+    def close(self):
+        if self.trigger_table_path is not None:
+            try:
+                os.remove(self.trigger_table_path)
+            except OSError:
+                pass
+            self.trigger_table_path = None
+
+    # Let all running measurements finish their current sample and write their logs (like early stopping in the GUI)
+    def stop(self):
+        for job in self.get_running():
+            if job.process is not None and job.process.poll() is None:
+                job.process.send_signal(signal.SIGUSR1)
+        for job in self.jobs:
+            if job.status == Constants.STATUS_QUEUED:
+                job.status = Constants.STATUS_FAILED
+                job.error = 'Stopped before it was started'
+
+
+def print_progress(jobs):
+    print('  '.join('%s: %s %d/%d' % (job.name, job.status, job.completed, job.iterations) for job in jobs))
+    sys.stdout.flush()
+
+
+def print_results(jobs):
+    for job in jobs:
+        if job.status == Constants.STATUS_DONE:
+            print('%-30s %6d measurements  log: %s' % (job.name, len(job.latencies), job.log_path))
+        else:
+            print('%-30s failed: %s' % (job.name, job.error))
+
+
+# Compare the latencies of a job measured alone with those measured in parallel.
+# The difference of the means is tested with the 95% confidence interval of Welch
+def compare_latencies(alone, parallel):
+    import numpy as np
+
+    alone = np.asarray(alone, dtype=np.float64) / 1000
+    parallel = np.asarray(parallel, dtype=np.float64) / 1000
+    difference = np.mean(parallel) - np.mean(alone)
+    half_width = Constants.CONFIDENCE_Z * (np.var(alone, ddof=1) / len(alone) +
+                                           np.var(parallel, ddof=1) / len(parallel)) ** 0.5
+    return {
+        'aloneMean': float(np.mean(alone)), 'parallelMean': float(np.mean(parallel)),
+        'aloneMedian': float(np.median(alone)), 'parallelMedian': float(np.median(parallel)),
+        'aloneP95': float(np.percentile(alone, 95)), 'parallelP95': float(np.percentile(parallel, 95)),
+        'difference': float(difference), 'differenceLow': float(difference - half_width),
+        'differenceHigh': float(difference + half_width),
+        'significant': bool(abs(difference) > half_width)
+    }
+
+
+def print_comparison(name, comparison):
+    print('%-30s mean %.3f -> %.3f ms  median %.3f -> %.3f ms  p95 %.3f -> %.3f ms' % (
+        name, comparison['aloneMean'], comparison['parallelMean'], comparison['aloneMedian'],
+        comparison['parallelMedian'], comparison['aloneP95'], comparison['parallelP95']))
+    print('%-30s difference of means %+.3f ms [%+.3f, %+.3f] -> %s' % (
+        '', comparison['difference'], comparison['differenceLow'], comparison['differenceHigh'],
+        'parallel measuring changes the latency' if comparison['significant'] else 'no significant difference'))
+
+
+def run_jobs(jobs, max_parallel, gpio_backend):
+    for job in jobs:
+        job.reset()
+    scheduler = MeasurementScheduler(jobs, max_parallel, gpio_backend, print_progress)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        print('Stopping, the logs of the running measurements are written...')
+        scheduler.stop()
+        scheduler.run()
+    finally:
+        scheduler.close()
+    print_results(jobs)
+    return {job.name: list(job.latencies) for job in jobs if job.status == Constants.STATUS_DONE}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure several devices at the same time')
+    parser.add_argument('jobs', help='.ini file with one section per device')
+    parser.add_argument('--parallel', type=int, default=None, help='maximum number of parallel measurements '
+                                                                   '(default: all jobs)')
+    parser.add_argument('--compare', action='store_true',
+                        help='measure every job alone first and compare with the parallel measurement')
+    parser.add_argument('--gpio', default=MeasurementEngine.Constants.GPIO_BACKEND,
+                        choices=sorted(MeasurementEngine.GPIO_BACKENDS.keys()))
+    args = parser.parse_args()
+
+    try:
+        jobs = load_jobs(args.jobs)
+    except ValueError as e:
+        sys.exit(str(e))
+    if len(set(job.name for job in jobs)) != len(jobs):
+        sys.exit('Every job needs its own name, otherwise their logs could get the same file name')
+    max_parallel = max(1, args.parallel if args.parallel is not None else len(jobs))
+
+    alone = {}
+    if args.compare:
+        print('Measuring every device alone')
+        alone = run_jobs(jobs, 1, args.gpio)
+        print('Measuring', min(max_parallel, len(jobs)), 'devices in parallel')
+
+    parallel = run_jobs(jobs, max_parallel, args.gpio)
+
+    if args.compare:
+        print('Alone -> parallel:')
+        for name in parallel:
+            if name in alone and len(alone[name]) > 1 and len(parallel[name]) > 1:
+                print_comparison(name, compare_latencies(alone[name], parallel[name]))
+
+
+if __name__ == '__main__':
+    main()
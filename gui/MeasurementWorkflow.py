@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The steps of a LagBox measurement that do not depend on the GUI: building the command of the measurement tool,
+# running it while following its progress, enriching the header of the log with information about the device and
+# naming the file of its plot. Used by the wizard (latency_gui.py) and by the headless CampaignRunner.py, so both
+# produce the same logs.
+
+import signal
+import sys
+from datetime import datetime
+from subprocess import Popen, PIPE, STDOUT
+
+import LatencyStats  # Statistics that are updated live during the measurement
+import LogFile  # Updates the metadata in the header of the log
+import ProgressProtocol  # Decodes the progress reported by inputLatencyMeasureTool
+import Tracing
+
+
+class Constants:
+    DEVICE_TYPE_IDS = {'Gamepad': 1, 'Mouse': 2, 'Keyboard': 3}
+    AUTO_DETECTED_SUFFIX = ' (auto-detected)'  # Appended to the device type by DeviceInventory.detect_device_type
+
+    # (0 = stepper mode, 1 = stepper latency test mode, 2 = stepper reset mode,
+    # 3 = auto mode, 4 = pressure sensor test mode)
+    MODE = 3
+    NUM_TEST_ITERATIONS = 1000  # Maximum number of measurements (also with early stopping)
+    MIN_DELAY = 100  # Delay before the button is pressed in µs (-tmin and -tmax)
+    MAX_DELAY = 10000
+
+    # Program that conducts the measurement: the C tool or MeasurementEngine.py (uses kernel event timestamps).
+    # Both accept the same arguments and report the progress in the same format
+    MEASUREMENT_TOOLS = {'c': ['../bin/inputLatencyMeasureTool'],
+                         'python': [sys.executable, 'MeasurementEngine.py']}
+
+    PLOT_SUFFIX = '.png'
+
+
+class MeasurementError(Exception):
+    pass
+
+
+# The arguments are passed without a shell, so the device name does not need to be escaped
+def build_command(tool, device_id, button_code, device_type, device_name, iterations=Constants.NUM_TEST_ITERATIONS,
+                  min_delay=Constants.MIN_DELAY, max_delay=Constants.MAX_DELAY, gpio_backend=None):
+    command = Constants.MEASUREMENT_TOOLS[tool] + [
+        '-m', str(Constants.MODE),
+        '-tmin', str(min_delay), '-tmax', str(max_delay),
+        '-b', str(button_code),
+        '-d', str(device_type),
+        '-event', str(device_id).replace('event', ''),
+        '-n', str(iterations),
+        '-name', device_name,
+        '-json', '1'
+    ]
+    if tool == 'python' and gpio_backend is not None:
+        command += ['-gpio', gpio_backend]
+    return command
+
+
+# ID of a device type like 'Mouse' or 'Mouse (auto-detected)'. None if the type is unknown
+def get_device_type_id(device_type):
+    if device_type is None:
+        return None
+    return Constants.DEVICE_TYPE_IDS.get(device_type.replace(Constants.AUTO_DETECTED_SUFFIX, ''))
+
+
+# Find a device of DeviceInventory.scan() by its name or its event node (like event3)
+def find_device(devices, name=None, device_id=None):
+    for device in devices:
+        if (device_id is None or device.device_id == device_id) and (name is None or device.name == name):
+            return device
+    return None
+
+
+# Information about the device under test that is added to the header of the log after the measurement
+def create_device_metadata(vendor_id, product_id, b_interval, device_type, ean, device_speed):
+    return {
+        'vendorId': vendor_id,
+        'productId': product_id,
+        'date': datetime.today().strftime('%d-%m-%Y'),
+        'bInterval': str(b_interval) if b_interval is not None else '',
+        'deviceType': str(device_type),
+        'EAN': ean,
+        'deviceSpeed': device_speed
+    }
+
+
+# Information about the persons who conducted the measurement, added before the log is shared
+def create_personal_metadata(authors, email, public, notes):
+    return {
+        'author': authors,
+        'email': email,
+        'public': str(public),
+        'notes': notes.replace("\n", " ")
+    }
+
+
+def get_plot_path(log_path, extension=Constants.PLOT_SUFFIX):
+    return log_path.replace('.csv', extension)
+
+
+# Runs the measurement tool and follows its progress. on_update is called with the latest sample at most once per
+# frame, on_stop_requested with the reason when the stop rule ends the measurement early.
+class Measurement:
+
+    def __init__(self, command, stop_rule=None, on_update=None, on_stop_requested=None, start_new_session=False,
+                 histogram=None, on_started=None):
+        self.command = command
+        self.live_stats = LatencyStats.OnlineStats()  # Fed with every measurement the tool reports
+        self.histogram = histogram  # LatencyStats.StreamingHistogram that is fed as well, or None
+        self.stop_rule = stop_rule  # LatencyStats.PrecisionStopRule or None to always run all iterations
+        self.on_update = on_update
+        self.on_stop_requested = on_stop_requested
+        self.on_started = on_started  # Called once the tool is running, e.g. to stop it if that was requested before
+        self.start_new_session = start_new_session  # The tool does not receive the Ctrl+C of the terminal
+        self.stop_reason = None
+        self.process = None
+        self.log_path = None
+        self.error = None
+        self.is_done = False
+
+    # Run the tool until it is done. Returns the path of the log or raises MeasurementError
+    def run(self):
+        print(' '.join(self.command))
+
+        with Tracing.tracer.span('tool') as span:
+            try:
+                self.process = Popen(self.command, stdin=PIPE, stdout=PIPE, stderr=STDOUT, close_fds=True,
+                                     start_new_session=self.start_new_session)
+            except OSError as e:
+                raise MeasurementError(str(e))
+            if self.on_started is not None:
+                self.on_started()
+
+            reader = ProgressProtocol.ProgressReader(self.process.stdout.fileno())
+            reader.run(self.on_record, self.on_sample)
+            self.process.wait()
+            span.set('samples', self.live_stats.n)
+
+        if self.error is not None:
+            raise MeasurementError(self.error)
+        if not self.is_done:
+            raise MeasurementError('Measurement stopped unexpectedly (exit code ' + str(self.process.returncode) + ')')
+        if self.log_path is None:
+            raise MeasurementError('The measurement tool did not report a log file')
+
+        # The tool only records that it was stopped early, the reason is known here
+        if self.stop_reason is not None:
+            try:
+                LogFile.update_metadata(self.log_path, {'stopReason': self.stop_reason})
+            except (OSError, ValueError) as e:
+                print('Could not save the reason for stopping early:', e)
+        return self.log_path
+
+    # Called for every record of the tool
+    def on_record(self, record):
+        if record['type'] == ProgressProtocol.Constants.TYPE_SAMPLE:
+            self.live_stats.add(record['latency_us'] / 1000)
+            if self.histogram is not None:
+                self.histogram.add(record['latency_us'] / 1000)
+            if self.stop_rule is not None and self.stop_reason is None:
+                self.check_stop_rule(record['latency_us'] / 1000)
+        elif record['type'] == ProgressProtocol.Constants.TYPE_LOG:
+            self.log_path = record['path']
+        elif record['type'] == ProgressProtocol.Constants.TYPE_ERROR:
+            self.is_done = True
+            self.error = record['message']
+        elif record['type'] == ProgressProtocol.Constants.TYPE_DONE:
+            self.is_done = True
+        else:
+            print(record['line'])
+
+    # Ask the tool to stop once the stop rule is satisfied
+    def check_stop_rule(self, latency):
+        self.stop_rule.add(latency)
+        reason = self.stop_rule.check()
+        if reason is None:
+            return
+
+        if not self.stop():
+            return  # The tool has already finished, so it did not stop early
+        self.stop_reason = reason
+        if self.on_stop_requested is not None:
+            self.on_stop_requested(reason)
+
+    # Ask the tool to stop after the current measurement (SIGUSR1). The tool then writes the log with the measurements
+    # so far and reports it as usual. Returns False if the tool is not running
+    def stop(self):
+        if self.process is None or self.process.poll() is not None:
+            return False
+        try:
+            self.process.send_signal(signal.SIGUSR1)
+        except OSError:
+            return False  # The tool has already finished
+        return True
+
+    # Stop because the operator does not want to continue (e.g. the device is not pressed reliably). The reason is
+    # saved in the log like that of the stop rule. Returns False if the tool is not running
+    def abort(self, reason):
+        if self.process is None or self.process.poll() is not None:
+            return False  # Finished already, the log is complete
+        self.stop_reason = reason
+        return self.stop()
+
+    def on_sample(self, sample):
+        if self.on_update is not None:
+            self.on_update(sample)
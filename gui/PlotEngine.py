@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Renders the plot of a LagBox measurement. The kind of plot depends on the number of measurements, because the layout
+# of a swarm plot gets very slow for a large number of points:
+#   swarm     - every measurement as a point without overlaps (small n)
+#   strip     - every measurement as a point with random jitter (medium n)
+#   histogram - histogram, smoothed density and ECDF from pre-binned data (large n)
+#
+# PlotRenderer runs the rendering in a separate process, so the GUI does not block while a plot is created.
+# numpy, matplotlib and seaborn are only imported when a plot is rendered, so importing this module is cheap.
+#
+# Rendered plots are cached in .plot_cache next to the log, keyed by a hash of the latencies, the kind of plot, the
+# resolution and the format. Re-opening or re-analysing a log copies the cached plot instead of drawing it again, also
+# when only the metadata in the header of the log has changed. The preview for the 800x480 display is rendered at
+# screen resolution first and the publication plots (PNG at 300 DPI and SVG) afterwards.
+
+import importlib.util
+import multiprocessing
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import LatencyStats  # Hash of the latencies
+
+
+class Constants:
+    PLOT_X_MIN = 0  # Minimum x value of the plot
+    PLOT_WIDTH = 9
+    PLOT_HEIGHT = 2
+    PLOT_OUTPUT_DPI = 300
+    PLOT_FONTSIZE = 16
+
+    MODE_SWARM = 'swarm'
+    MODE_STRIP = 'strip'
+    MODE_HISTOGRAM = 'histogram'
+    MODES = [MODE_SWARM, MODE_STRIP, MODE_HISTOGRAM]
+
+    MAX_POINTS_SWARM = 500  # Above this number of measurements, a strip plot is used
+    MAX_POINTS_STRIP = 5000  # Above this number of measurements, a histogram is used
+
+    HISTOGRAM_BINS = 200
+    DENSITY_SMOOTHING_BINS = 2  # Standard deviation (in bins) of the gaussian kernel used for the density
+
+    PREVIEW_DPI = 90  # Same figure and fonts as the full plot, but it fits into the label of page four (750x220 pixels)
+    PUBLICATION_EXTENSIONS = ['.png', '.svg']
+
+    CACHE_DIRECTORY_NAME = '.plot_cache'
+    CACHE_VERSION = 1  # Part of every cache key. Needs to be increased when the look of the plots is changed
+    CACHE_MAX_FILES = 500  # The least recently used plots are removed above this number
+
+
+# Choose the kind of plot for the given number of measurements
+def choose_mode(num_points):
+    if num_points <= Constants.MAX_POINTS_SWARM:
+        return Constants.MODE_SWARM
+    if num_points <= Constants.MAX_POINTS_STRIP:
+        return Constants.MODE_STRIP
+    return Constants.MODE_HISTOGRAM
+
+
+# Histogram of the latencies as (counts, bin edges), plus a smoothed density (like a KDE evaluated at the bin centers)
+def bin_latencies(latencies, bins=Constants.HISTOGRAM_BINS):
+    import numpy as np
+
+    counts, edges = np.histogram(latencies, bins=bins, range=(Constants.PLOT_X_MIN, np.max(latencies) * 1.1))
+
+    radius = int(4 * Constants.DENSITY_SMOOTHING_BINS)
+    kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / Constants.DENSITY_SMOOTHING_BINS) ** 2)
+    density = np.convolve(counts, kernel / kernel.sum(), mode='same')
+
+    return counts, edges, density
+
+
+def draw_points(latencies, mode):
+    import seaborn as sns
+
+    # TODO: If we could guarantee here that at least seaborn version 0.9 is installed, we should add "dodge=True"
+    if mode == Constants.MODE_SWARM:
+        sns.swarmplot(x=latencies, hue=None, palette="colorblind", marker="H", orient="h", alpha=1, zorder=0)
+    else:
+        sns.stripplot(x=latencies, color='#0173b2', marker="H", orient="h", jitter=0.3, size=3, alpha=0.5, zorder=0)
+
+
+def draw_histogram(latencies):
+    import numpy as np
+    from matplotlib import pyplot as plt
+
+    counts, edges, density = bin_latencies(latencies)
+    centers = (edges[:-1] + edges[1:]) / 2
+
+    axes = plt.gca()
+    # The data is already binned, so every bin is drawn as a single weighted value
+    axes.hist(centers, bins=edges, weights=counts, color='#0173b2', alpha=0.6)
+    axes.plot(centers, density, color='#de8f05', linewidth=1.5)
+    axes.set_yticks([])
+
+    ecdf_axes = axes.twinx()
+    ecdf_axes.plot(edges[1:], np.cumsum(counts) / len(latencies), color='#029e73', linewidth=1.5)
+    ecdf_axes.set_ylim(0, 1.05)
+    ecdf_axes.set_yticks([0, 0.5, 1])
+    ecdf_axes.grid(False)
+
+
+# Render the plot of the latencies (in ms) to output_path. Runs in the calling process.
+# Returns the mode that was used or None if matplotlib or seaborn are missing.
+def render(output_path, latencies, mode=None, dpi=Constants.PLOT_OUTPUT_DPI):
+    import numpy as np
+
+    try:
+        import matplotlib
+        matplotlib.use('Agg')  # Rendering to a file does not need a GUI backend
+        from matplotlib import pyplot as plt
+        import seaborn as sns
+    except ImportError:
+        print('Pyplot and/or Seaborn not installed')
+        return None
+
+    latencies = np.asarray(latencies, dtype=np.float64)
+    if mode is None:
+        mode = choose_mode(len(latencies))
+
+    plt.figure(figsize=[Constants.PLOT_WIDTH, Constants.PLOT_HEIGHT])
+    sns.set(font_scale=1.5)
+
+    if mode == Constants.MODE_HISTOGRAM:
+        draw_histogram(latencies)
+    else:
+        draw_points(latencies, mode)
+
+    plt.xlabel("latency (ms)")
+    plt.xlim(Constants.PLOT_X_MIN, np.max(latencies) * 1.1)  # Leave 10% empty space on the right
+
+    plt.savefig(output_path, dpi=dpi, bbox_inches="tight")
+    plt.close('all')  # Free the figure, otherwise every plot stays in memory
+
+    return mode
+
+
+def get_cache_directory(output_path):
+    return os.path.join(os.path.dirname(os.path.abspath(output_path)), Constants.CACHE_DIRECTORY_NAME)
+
+
+def get_cache_key(latencies, mode, dpi, extension):
+    return '%s_v%d_%s_%d%s' % (LatencyStats.hash_latencies(latencies), Constants.CACHE_VERSION, mode, dpi, extension)
+
+
+# Remove the least recently used plots (a cache hit updates the modification time) if there are too many
+def trim_cache(cache_directory, max_files=Constants.CACHE_MAX_FILES):
+    try:
+        entries = [entry for entry in os.scandir(cache_directory) if entry.is_file() and
+                   not entry.name.startswith('.')]
+        if len(entries) <= max_files:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - max_files]:
+            os.remove(entry.path)
+    except OSError as e:
+        print('Could not clean up the plot cache:', e)
+
+
+# Path of the plot in the cache. It is rendered first if it is not cached yet. Returns None if matplotlib or seaborn
+# are missing
+def get_cached_plot(cache_directory, latencies, mode=None, dpi=Constants.PLOT_OUTPUT_DPI, extension='.png'):
+    if mode is None:
+        mode = choose_mode(len(latencies))
+    cache_path = os.path.join(cache_directory, get_cache_key(latencies, mode, dpi, extension))
+
+    if os.path.exists(cache_path):
+        os.utime(cache_path)
+        return cache_path
+
+    os.makedirs(cache_directory, exist_ok=True)
+    # Rendered to a temporary file first, so a cancelled render never leaves a broken plot in the cache
+    temp_path = os.path.join(cache_directory, '.' + str(os.getpid()) + '_' + os.path.basename(cache_path))
+    try:
+        if render(temp_path, latencies, mode, dpi) is None:
+            return None
+        os.replace(temp_path, cache_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    trim_cache(cache_directory)
+    return cache_path
+
+
+# Like render(), but the plot is only drawn if it is not in the cache next to output_path yet
+def render_cached(output_path, latencies, mode=None, dpi=Constants.PLOT_OUTPUT_DPI):
+    if mode is None:
+        mode = choose_mode(len(latencies))
+    cache_path = get_cached_plot(get_cache_directory(output_path), latencies, mode, dpi,
+                                 os.path.splitext(output_path)[1])
+    if cache_path is None:
+        return None
+    shutil.copyfile(cache_path, output_path)
+    return mode
+
+
+# Preview of the plot at the resolution of the display. It stays in the cache next to the log, which is the path
+# returned (None if matplotlib or seaborn are missing)
+def render_preview(log_path, latencies, mode=None):
+    return get_cached_plot(get_cache_directory(log_path), latencies, mode, Constants.PREVIEW_DPI)
+
+
+# Import the plotting modules, so the first plot in a worker process does not have to wait for them
+def import_modules():
+    try:
+        import numpy
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib import pyplot
+        import seaborn
+        return True
+    except ImportError:
+        return False
+
+
+# A spawned worker imports the main module of the parent again (as __mp_main__) before it runs anything. When the main
+# module is heavy, e.g. latency_gui.py with PyQt5, all modules of the GUI and RPi.GPIO, call this before the first plot
+# is submitted, so the workers import this module instead
+def use_as_worker_main():
+    sys.modules['__main__'].__spec__ = importlib.util.find_spec(__name__)
+
+
+# Renders plots in a separate worker process. The methods return a concurrent.futures.Future with the result of
+# render_cached() or render_preview(). There is only one worker, so the plots are rendered in the order they are
+# submitted
+class PlotRenderer:
+
+    def __init__(self):
+        self.executor = None
+
+    def get_executor(self):
+        if self.executor is None:
+            # A new interpreter is spawned instead of forking, because forking a process with running Qt threads is
+            # not safe
+            self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        return self.executor
+
+    # Start the worker process and load the plotting modules in the background
+    def warm_up(self):
+        return self.get_executor().submit(import_modules)
+
+    def submit(self, output_path, latencies, mode=None, dpi=Constants.PLOT_OUTPUT_DPI):
+        return self.get_executor().submit(render_cached, output_path, latencies, mode, dpi)
+
+    def submit_preview(self, log_path, latencies, mode=None):
+        return self.get_executor().submit(render_preview, log_path, latencies, mode)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
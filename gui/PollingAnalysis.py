@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Estimates the USB polling of the device under test from the delayTime column of a log.
+# The button is triggered delayTime µs after its release was reported, and that report arrived with a poll of the
+# host. So the trigger falls at phase (delayTime + offset) mod P of the polling period P, and the time until the next
+# poll decreases with the delay like a sawtooth:
+#   latency = fixed + ((phase - delayTime) mod P)
+# where fixed is the latency of device and host without the wait for the poll.
+#
+# The period is found with a periodogram of the latencies over the delay axis: the latencies are summed into bins of
+# the delay and transformed with an FFT. Around its strongest peak, period and phase of the sawtooth are fitted on the
+# same bins, so every step only works on the bins and not on the single measurements.
+#
+# usage: python PollingAnalysis.py <log.csv> [--plot]
+
+import argparse
+import os
+import sys
+
+import BatchAnalysis  # Polling rate from the file name
+import LogFile
+
+
+class Constants:
+    BIN_WIDTH = 10  # Resolution of the delay axis in µs
+    MIN_PERIOD = 100  # Shortest polling period that is searched for in µs (8 kHz polling is 125 µs)
+    MAX_PERIOD = 32000  # Longest polling period that is searched for in µs
+    MIN_CYCLES = 1  # The delays need to cover at least this many periods
+    FFT_PADDING = 4  # Zero padding of the FFT for a finer grid of the periodogram
+    REFINE_STEPS = 64  # Number of periods tried around the peak of the periodogram when fitting the sawtooth
+    PHASE_STEPS = 128  # Number of phases tried per period when fitting the sawtooth
+
+    PLOT_SUFFIX = '_polling.png'
+    PLOT_WIDTH = 9
+    PLOT_HEIGHT = 5
+    PLOT_OUTPUT_DPI = 150
+    MAX_SCATTER_POINTS = 5000  # Above this number of measurements, the folded plot is drawn as hexbin
+
+    HIGH_SPEED = 480  # in Mbit/s. From this speed on, bInterval is the exponent of a number of microframes
+    MICROFRAME_LENGTH = 0.125  # in ms
+    MAX_B_INTERVAL_EXPONENT = 16
+
+
+# Sum the latencies (minus their mean) into bins of the delay. Returns the centers of the bins that contain
+# measurements in µs, their number of measurements and their sum of residuals
+def bin_by_delay(delays, latencies, bin_width=Constants.BIN_WIDTH):
+    import numpy as np
+
+    indices = ((delays - delays.min()) // bin_width).astype(np.int64)
+    counts = np.bincount(indices)
+    sums = np.bincount(indices, weights=latencies - latencies.mean())
+    occupied = counts > 0
+    centers = delays.min() + (np.arange(len(counts)) + 0.5) * bin_width
+    return centers[occupied], counts[occupied], sums[occupied]
+
+
+# Longest polling period that can be estimated from the range of the delays in µs
+def get_max_period(delays):
+    return min(Constants.MAX_PERIOD, (delays.max() - delays.min()) / Constants.MIN_CYCLES)
+
+
+# Periodogram of the latencies over the delay axis. Returns the periods (in µs) and their power, longest period first
+def periodogram(delays, latencies, bin_width=Constants.BIN_WIDTH):
+    import numpy as np
+
+    indices = ((delays - delays.min()) // bin_width).astype(np.int64)
+    sums = np.bincount(indices, weights=latencies - latencies.mean())
+
+    size = len(sums) * Constants.FFT_PADDING
+    power = np.abs(np.fft.rfft(sums, size)) ** 2 / len(latencies)
+    frequencies = np.fft.rfftfreq(size, bin_width)  # Cycles per µs
+
+    with np.errstate(divide='ignore'):
+        periods = 1 / frequencies
+    valid = (periods >= max(Constants.MIN_PERIOD, 2 * bin_width)) & (periods <= get_max_period(delays))
+    return periods[valid], power[valid]
+
+
+# Squared error of latency = fixed + ((phase - delay) mod period) on the bins for every phase of a grid.
+# The residuals are already centered, so with fixed = mean(latency - wait) the error is (up to a constant)
+# sum(count * wait²) - 2 * sum(wait * sums) - n * (mean of wait)², which only needs the sums per bin
+def sawtooth_errors(centers, counts, sums, period, phases):
+    import numpy as np
+
+    waits = np.mod(phases[:, None] - centers[None, :], period)  # Polling wait of every bin for every phase
+    num_samples = counts.sum()
+    mean_waits = waits @ counts / num_samples
+    return waits ** 2 @ counts - 2 * (waits @ sums) - num_samples * mean_waits ** 2
+
+
+# Fit the sawtooth for the periods between the neighbouring frequencies of the peak in the periodogram (without the
+# zero padding). Returns period and phase with the smallest error. If the delays only cover a few periods, the peak of
+# the periodogram is too coarse to be used as the period directly
+def fit_sawtooth(centers, counts, sums, peak_period, span, max_period):
+    import numpy as np
+
+    step = 1 / span
+    frequencies = np.linspace(max(1 / peak_period - step, 1 / max_period), 1 / peak_period + step,
+                              Constants.REFINE_STEPS)
+    best = (float('inf'), peak_period, 0.0)
+    for period in 1 / frequencies:
+        phases = np.arange(Constants.PHASE_STEPS) * period / Constants.PHASE_STEPS
+        errors = sawtooth_errors(centers, counts, sums, period, phases)
+        i = np.argmin(errors)
+        if errors[i] < best[0]:
+            best = (errors[i], float(period), float(phases[i]))
+    return best[1], best[2]
+
+
+# Polling interval of an interrupt endpoint in ms. At low and full speed (1.5M, 12M), bInterval is the interval in
+# frames of 1 ms. At high speed and above (480M, 5000M, ...), it is an exponent: 2^(bInterval - 1) microframes of
+# 125 µs. Returns None if the speed is unknown, because bInterval alone does not tell the interval
+def get_polling_interval(b_interval, device_speed):
+    try:
+        speed = float(str(device_speed).rstrip('M'))
+    except ValueError:
+        return None
+    if b_interval is None or b_interval <= 0:
+        return None
+    if speed < Constants.HIGH_SPEED:
+        return float(b_interval)
+    return 2 ** (min(b_interval, Constants.MAX_B_INTERVAL_EXPONENT) - 1) * Constants.MICROFRAME_LENGTH
+
+
+# Polling period that is expected from the file name (usbhid.mousepoll) or the bInterval and speed in the header in
+# µs (see get_polling_interval). None if neither is known
+def get_expected_period(log):
+    polling_rate = BatchAnalysis.parse_file_name(log.file_path)['pollingRate']
+    if isinstance(polling_rate, int) and polling_rate > 0:
+        return polling_rate * 1000
+    try:
+        b_interval = int(log.metadata.get('bInterval', ''))
+    except ValueError:
+        return None
+    interval = get_polling_interval(b_interval, log.metadata.get('deviceSpeed', ''))
+    return interval * 1000 if interval is not None else None
+
+
+# Split the latencies of a log into the wait for the poll and the fixed latency of device and host.
+# Returns a dict with all values in µs, or None if the delays of the log do not cover enough polling periods
+def analyse(log):
+    import numpy as np
+
+    delays = np.asarray(log.delay_time, dtype=np.float64)
+    latencies = np.asarray(log.latency, dtype=np.float64)
+    if len(latencies) < 2:
+        return None
+
+    periods, power = periodogram(delays, latencies)
+    if len(periods) == 0:
+        return None
+
+    centers, counts, sums = bin_by_delay(delays, latencies)
+    peak = np.argmax(power)
+    period, phase = fit_sawtooth(centers, counts, sums, periods[peak], delays.max() - delays.min(),
+                                 get_max_period(delays))
+
+    waits = np.mod(phase - delays, period)
+    fixed = latencies - waits
+
+    return {
+        'n': len(latencies),
+        'period': float(period),
+        'expectedPeriod': get_expected_period(log),
+        'phase': phase,
+        'peakRatio': float(power[peak] / np.mean(power)),  # How far the peak stands out of the periodogram
+        'meanWait': float(np.mean(waits)),
+        'fixedMean': float(np.mean(fixed)),
+        'fixedMedian': float(np.median(fixed)),
+        'fixedStd': float(np.std(fixed)),
+        'explainedVariance': float(1 - np.var(fixed) / np.var(latencies)) if np.var(latencies) > 0 else 0.0,
+        'periods': periods,
+        'power': power
+    }
+
+
+# Periodogram and the latencies folded with the estimated period, together with the fitted sawtooth
+def render(output_path, log, result, dpi=Constants.PLOT_OUTPUT_DPI):
+    import numpy as np
+
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib import pyplot as plt
+    except ImportError:
+        print('Pyplot not installed')
+        return False
+
+    period = result['period']
+    folded = np.mod(np.asarray(log.delay_time, dtype=np.float64) - result['phase'], period) / 1000
+    latencies = log.latencies_ms()
+
+    figure, (spectrum_axes, folded_axes) = plt.subplots(2, 1, figsize=[Constants.PLOT_WIDTH, Constants.PLOT_HEIGHT])
+
+    spectrum_axes.plot(result['periods'] / 1000, result['power'], color='#0173b2', linewidth=1)
+    spectrum_axes.axvline(period / 1000, color='#de8f05', linestyle='--', linewidth=1)
+    spectrum_axes.set_xscale('log')
+    spectrum_axes.set_xlabel('period (ms)')
+    spectrum_axes.set_yticks([])
+
+    if len(latencies) > Constants.MAX_SCATTER_POINTS:
+        folded_axes.hexbin(folded, latencies, gridsize=80, cmap='Blues', mincnt=1)
+    else:
+        folded_axes.scatter(folded, latencies, s=3, alpha=0.5, color='#0173b2')
+
+    # The sawtooth starts at the fixed latency plus a full period right after the phase and drops to it
+    phase_grid = np.linspace(0, period, 200, endpoint=False)
+    folded_axes.plot(phase_grid / 1000, (result['fixedMean'] + period - phase_grid) / 1000, color='#de8f05',
+                     linewidth=1.5)
+    folded_axes.set_xlabel('delay mod polling period (ms)')
+    folded_axes.set_ylabel('latency (ms)')
+
+    figure.tight_layout()
+    figure.savefig(output_path, dpi=dpi)
+    plt.close('all')
+    return True
+
+
+def print_result(result):
+    expected = result['expectedPeriod']
+    print('Polling period: %.3f ms (expected: %s)' % (result['period'] / 1000,
+                                                      '%.3f ms' % (expected / 1000) if expected else 'unknown'))
+    print('Peak/mean power: %.1f' % result['peakRatio'])
+    print('Mean polling wait: %.3f ms' % (result['meanWait'] / 1000))
+    print('Fixed latency: mean %.3f ms, median %.3f ms, sd %.3f ms' % (result['fixedMean'] / 1000,
+                                                                       result['fixedMedian'] / 1000,
+                                                                       result['fixedStd'] / 1000))
+    print('Variance explained by polling: %.1f %%' % (result['explainedVariance'] * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Estimate the USB polling of a LagBox log from its delays')
+    parser.add_argument('log', help='path of the .csv log')
+    parser.add_argument('--plot', action='store_true', help='create a periodogram and folded plot next to the log')
+    args = parser.parse_args()
+
+    try:
+        log = LogFile.load_log(args.log)
+    except OSError:
+        sys.exit('File missing: ' + args.log)
+
+    result = analyse(log)
+    if result is None:
+        sys.exit('The delays of the log do not cover enough polling periods')
+    print_result(result)
+
+    if args.plot:
+        output_path = os.path.splitext(args.log)[0] + Constants.PLOT_SUFFIX
+        if render(output_path, log, result):
+            print('Plot saved to', output_path)
+
+
+if __name__ == '__main__':
+    main()
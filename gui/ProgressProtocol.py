@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Decodes the progress that inputLatencyMeasureTool writes to stdout.
+# With -json 1, the tool writes one JSON record per line:
+#   {"type": "sample", "i": 1, "n": 1000, "latency_us": 3412, "delay_us": 5012}  after every measurement
+#   {"type": "log", "path": "../log/AUTO_mouse_1ms_1.csv"}                        after the log has been written
+#   {"type": "error", "message": "Device not found"}                              if the measurement failed
+#   {"type": "done", "device": "mouse"}                                           at the end
+# The text output of older versions of the tool ("i,n,latency in ms", log path, device name, "done") is decoded into
+# the same records. Lines that are neither are returned as records of type "text".
+#
+# Samples can arrive much faster than the display is refreshed, so ProgressReader hands over every record, but only
+# the latest sample once per frame for updating the GUI.
+
+import json
+import os
+import selectors
+import time
+
+
+class Constants:
+    TYPE_SAMPLE = 'sample'
+    TYPE_LOG = 'log'
+    TYPE_ERROR = 'error'
+    TYPE_DONE = 'done'
+    TYPE_TEXT = 'text'
+
+    FRAME_INTERVAL = 1 / 30  # Minimum time between two GUI updates in s
+    READ_SIZE = 65536
+
+
+# Convert a line of the text output into a record
+def decode_text_line(line):
+    parts = line.split(',')
+    if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit():
+        try:
+            return {'type': Constants.TYPE_SAMPLE, 'i': int(parts[0]), 'n': int(parts[1]),
+                    'latency_us': round(float(parts[2]) * 1000), 'delay_us': None}
+        except ValueError:
+            pass
+
+    if line == 'done':
+        return {'type': Constants.TYPE_DONE, 'device': None}
+    if line.startswith('cancelled'):
+        return {'type': Constants.TYPE_ERROR, 'message': line.partition(':')[2].strip()}
+    if '/log/' in line and line.endswith('.csv'):
+        return {'type': Constants.TYPE_LOG, 'path': line}
+    return {'type': Constants.TYPE_TEXT, 'line': line}
+
+
+def decode_line(line):
+    if line.startswith('{'):
+        try:
+            record = json.loads(line)
+            if isinstance(record, dict) and 'type' in record:
+                return record
+        except ValueError:
+            pass
+    return decode_text_line(line)
+
+
+# Splits the raw bytes of the stream into lines and decodes them. Incomplete lines are kept until the rest arrives
+class ProgressDecoder:
+
+    def __init__(self):
+        self.buffer = b''
+
+    # Returns the records of all lines completed by data
+    def feed(self, data):
+        lines = (self.buffer + data).split(b'\n')
+        self.buffer = lines.pop()
+        return [decode_line(line.decode('utf-8', errors='replace').strip()) for line in lines if len(line.strip()) > 0]
+
+    # Returns the record of an unterminated last line at the end of the stream
+    def finish(self):
+        data = self.buffer
+        self.buffer = b''
+        if len(data.strip()) == 0:
+            return []
+        return [decode_line(data.decode('utf-8', errors='replace').strip())]
+
+
+class ProgressReader:
+
+    def __init__(self, file_descriptor, frame_interval=Constants.FRAME_INTERVAL):
+        self.file_descriptor = file_descriptor
+        self.frame_interval = frame_interval
+        self.decoder = ProgressDecoder()
+        self.pending_sample = None  # Latest sample that has not been handed to on_update yet
+        self.last_update = 0.0
+
+    def flush(self, on_update):
+        if self.pending_sample is not None:
+            on_update(self.pending_sample)
+            self.pending_sample = None
+            self.last_update = time.monotonic()
+
+    # Read the stream until it ends. on_record is called for every record, on_update with the latest sample at most
+    # once per frame. The last sample is always handed to on_update before any record that is not a sample.
+    def run(self, on_record, on_update):
+        selector = selectors.DefaultSelector()
+        selector.register(self.file_descriptor, selectors.EVENT_READ)
+
+        try:
+            while True:
+                timeout = None
+                if self.pending_sample is not None:
+                    timeout = max(0.0, self.last_update + self.frame_interval - time.monotonic())
+
+                if len(selector.select(timeout)) == 0:
+                    self.flush(on_update)  # No new data during the rest of the frame
+                    continue
+
+                data = os.read(self.file_descriptor, Constants.READ_SIZE)
+                records = self.decoder.feed(data) if len(data) > 0 else self.decoder.finish()
+
+                for record in records:
+                    if record['type'] == Constants.TYPE_SAMPLE:
+                        self.pending_sample = record
+                    else:
+                        self.flush(on_update)
+                    on_record(record)
+
+                if len(data) == 0:
+                    self.flush(on_update)
+                    return  # End of the stream
+
+                if self.pending_sample is not None and time.monotonic() - self.last_update >= self.frame_interval:
+                    self.flush(on_update)
+        finally:
+            selector.close()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Local SQLite index of all measurements, so questions across many runs ("all mice with 1000 Hz polling and a median
+# below 5 ms") do not need to parse every log again. The index has two tables:
+#   runs     one row per log: path, size and modification time of the log, the header metadata (the common keys as
+#            columns, all keys as JSON), polling rate and interval and the summary statistics of LatencyStats (in ms)
+#   samples  one row per measurement of every log (counter, latency and delayTime in µs like in the log)
+# The GUI and CampaignRunner.py add every new log, and "import" adds all logs of a directory that are new or have
+# changed since they were indexed.
+#
+# usage: python ResultsIndex.py import [log directory (default: ../log)] [--workers N]
+#        python ResultsIndex.py query [--type Mouse] [--hz 1000] [--max median 5] [--min n 1000] ...
+#        python ResultsIndex.py samples <id of the run>
+
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import BatchAnalysis  # Finding the logs of a directory and the polling rate in their file names
+import LatencyStats
+import LogFile
+import MeasurementWorkflow  # Device type IDs
+import PollingAnalysis  # Polling interval from bInterval and the speed of the device
+
+
+class Constants:
+    INDEX_PATH = '../log/results.sqlite'
+    LOG_DIRECTORY = '../log'
+
+    # Columns of the runs table besides id and the statistics, with their SQL type
+    RUN_COLUMNS = [('path', 'TEXT NOT NULL UNIQUE'), ('file', 'TEXT'), ('mtime', 'REAL'), ('size', 'INTEGER'),
+                   ('mode', 'TEXT'), ('device', 'TEXT'), ('button', 'INTEGER'), ('pollingRate', 'INTEGER'),
+                   ('vendorId', 'TEXT'), ('productId', 'TEXT'), ('bInterval', 'INTEGER'),
+                   ('pollingInterval', 'REAL'), ('deviceType', 'INTEGER'), ('deviceSpeed', 'TEXT'), ('date', 'TEXT'),
+                   ('EAN', 'TEXT'), ('stoppedEarly', 'INTEGER'), ('metadata', 'TEXT'), ('indexed', 'REAL')]
+    STAT_COLUMNS = LatencyStats.Constants.SUMMARY_FIELDS
+    QUERY_COLUMNS = ['id', 'file', 'device', 'deviceType', 'pollingInterval', 'vendorId', 'productId'] + \
+        STAT_COLUMNS  # Columns returned by a query by default. Converting every column of many rows takes the most time
+
+    INSERT_BATCH_SIZE = 64  # Number of logs that are written in one transaction by the importer
+    SCHEMA_VERSION = 1  # Stored as user_version
+    FLOAT_TOLERANCE = 1e-6  # REAL columns like pollingInterval (1000 / hz) match a value within this tolerance
+
+    # Values of --type: the name of a device type or its number
+    DEVICE_TYPE_CHOICES = list(MeasurementWorkflow.Constants.DEVICE_TYPE_IDS.keys()) + \
+        [str(type_id) for type_id in MeasurementWorkflow.Constants.DEVICE_TYPE_IDS.values()]
+
+
+def get_schema():
+    columns = ['id INTEGER PRIMARY KEY'] + [name + ' ' + sql_type for name, sql_type in Constants.RUN_COLUMNS] + \
+        [name + (' INTEGER' if name == 'n' else ' REAL') for name in Constants.STAT_COLUMNS]
+    return [
+        'CREATE TABLE IF NOT EXISTS runs (' + ', '.join(columns) + ')',
+        'CREATE TABLE IF NOT EXISTS samples (runId INTEGER NOT NULL REFERENCES runs(id), counter INTEGER, '
+        'latency INTEGER, delayTime INTEGER)',
+        'CREATE INDEX IF NOT EXISTS samples_run ON samples (runId)',
+        'CREATE INDEX IF NOT EXISTS runs_type_polling ON runs (deviceType, pollingInterval, median)',
+        'CREATE INDEX IF NOT EXISTS runs_vendor_product ON runs (vendorId, productId)'
+    ]
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ID of a device type given as name (like 'Mouse') or number
+def get_device_type_id(device_type):
+    if str(device_type).isdigit():
+        return int(device_type)
+    return MeasurementWorkflow.get_device_type_id(str(device_type).capitalize())
+
+
+# Polling interval in ms: the usbhid.mousepoll of the file name or the bInterval and speed of the header (see
+# PollingAnalysis.get_polling_interval). None (NULL) if neither the file name nor the speed of the device is known
+def get_polling_interval(polling_rate, b_interval, device_speed):
+    if polling_rate is not None and polling_rate > 0:
+        return float(polling_rate)
+    return PollingAnalysis.get_polling_interval(b_interval, device_speed)
+
+
+# Read a log and create its row of the runs table. Returns the row and the columns of the samples. Runs in a worker
+# process of the importer
+def read_run(file_path):
+    file_path = os.path.abspath(file_path)
+    file_stat = os.stat(file_path)
+    log = LogFile.load_log(file_path)
+    metadata = log.metadata
+
+    name = BatchAnalysis.parse_file_name(file_path)
+    polling_rate = name['pollingRate'] if isinstance(name['pollingRate'], int) else None
+    b_interval = to_int(metadata.get('bInterval'))
+
+    row = {
+        'path': file_path, 'file': os.path.basename(file_path), 'mtime': file_stat.st_mtime,
+        'size': file_stat.st_size, 'mode': os.path.basename(file_path).partition('_')[0],
+        'device': metadata.get('Device', name['device']), 'button': to_int(metadata.get('Button')),
+        'pollingRate': polling_rate, 'vendorId': metadata.get('vendorId', '').lower(),
+        'productId': metadata.get('productId', '').lower(), 'bInterval': b_interval,
+        'pollingInterval': get_polling_interval(polling_rate, b_interval, metadata.get('deviceSpeed', '')),
+        'deviceType': to_int(metadata.get('deviceType')), 'deviceSpeed': metadata.get('deviceSpeed', ''),
+        'date': metadata.get('date', ''), 'EAN': metadata.get('EAN', ''),
+        'stoppedEarly': to_int(metadata.get('stoppedEarly')), 'metadata': json.dumps(metadata),
+        'indexed': time.time()
+    }
+    summary = LatencyStats.summarize(log.latencies_ms())
+    row.update({field: summary.get(field) for field in Constants.STAT_COLUMNS})
+
+    # Plain lists can be sent back from the worker and inserted without converting every numpy value
+    return row, log.counter.tolist(), log.latency.tolist(), log.delay_time.tolist()
+
+
+class ResultsIndex:
+
+    def __init__(self, index_path=Constants.INDEX_PATH):
+        directory = os.path.dirname(index_path)
+        if len(directory) > 0:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(index_path)
+        self.connection.row_factory = sqlite3.Row
+        # With a write-ahead log, queries are not blocked while the GUI or the importer adds logs
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            for statement in get_schema():
+                self.connection.execute(statement)
+            if self.connection.execute('PRAGMA user_version').fetchone()[0] == 0:
+                self.connection.execute('PRAGMA user_version = %d' % Constants.SCHEMA_VERSION)
+
+    def close(self):
+        self.connection.close()
+
+    # Size and modification time of all indexed logs by their path
+    def get_indexed(self):
+        return {row['path']: (row['mtime'], row['size'])
+                for row in self.connection.execute('SELECT path, mtime, size FROM runs')}
+
+    def remove(self, file_path):
+        for row in self.connection.execute('SELECT id FROM runs WHERE path = ?', (file_path,)).fetchall():
+            self.connection.execute('DELETE FROM samples WHERE runId = ?', (row['id'],))
+            self.connection.execute('DELETE FROM runs WHERE id = ?', (row['id'],))
+
+    # Add a run (see read_run) or replace the older version of the same log. Needs to be called in a transaction
+    def insert(self, row, counter, latency, delay_time):
+        self.remove(row['path'])
+        names = list(row.keys())
+        cursor = self.connection.execute('INSERT INTO runs (' + ', '.join(names) + ') VALUES (' +
+                                         ', '.join('?' * len(names)) + ')', [row[name] for name in names])
+        self.connection.executemany('INSERT INTO samples (runId, counter, latency, delayTime) VALUES (?, ?, ?, ?)',
+                                    zip(itertools.repeat(cursor.lastrowid), counter, latency, delay_time))
+        return cursor.lastrowid
+
+    def add_log(self, file_path):
+        run = read_run(file_path)
+        with self.connection:
+            return self.insert(*run)
+
+    # Index all logs of a directory that are new or have changed, and forget the logs that have been deleted.
+    # The logs are read in a process pool, the rows are written in batches. Returns the number of indexed logs
+    def import_directory(self, directory=Constants.LOG_DIRECTORY, workers=None):
+        directory = os.path.abspath(directory)
+        paths = BatchAnalysis.find_logs(directory)
+        indexed = self.get_indexed()
+        outdated_paths = []
+        for path in paths:
+            file_stat = os.stat(path)
+            if indexed.get(path) != (file_stat.st_mtime, file_stat.st_size):
+                outdated_paths.append(path)
+        print('Found', len(paths), 'logs,', len(outdated_paths), 'need to be indexed')
+
+        with self.connection:
+            for path in set(indexed.keys()) - set(paths):
+                if os.path.dirname(path) == directory:
+                    self.remove(path)
+
+        num_indexed = 0
+        if len(outdated_paths) > 0:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # Submitted batch by batch, so only the samples of one batch are held in memory at once
+                for start in range(0, len(outdated_paths), Constants.INSERT_BATCH_SIZE):
+                    batch = outdated_paths[start:start + Constants.INSERT_BATCH_SIZE]
+                    futures = {path: executor.submit(read_run, path) for path in batch}
+                    with self.connection:
+                        for path, future in futures.items():
+                            try:
+                                self.insert(*future.result())
+                                num_indexed += 1
+                            except (OSError, ValueError) as error:
+                                print('Could not index', path + ':', error)
+        return num_indexed
+
+    # Runs matching all filters, ordered by a column. equal holds columns and values that need to match (e.g.
+    # {'deviceType': 2, 'pollingInterval': 1.0}, floats within FLOAT_TOLERANCE), maxima and minima hold upper and lower
+    # bounds (e.g. {'median': 5.0}). device is matched case-insensitively as part of the device name
+    def query(self, equal=None, maxima=None, minima=None, device=None, order_by='median', limit=None,
+              selected_columns=Constants.QUERY_COLUMNS):
+        columns = set(name for name, _ in Constants.RUN_COLUMNS) | set(Constants.STAT_COLUMNS) | {'id'}
+        if not set(selected_columns) <= columns:
+            raise ValueError('Unknown column: ' + ', '.join(set(selected_columns) - columns))
+        conditions = []
+        values = []
+        for filters, operator in [(equal, '='), (maxima, '<='), (minima, '>=')]:
+            for name, value in (filters or {}).items():
+                if name not in columns:
+                    raise ValueError('Unknown column: ' + name)
+                if operator == '=' and isinstance(value, float):
+                    # A range instead of abs(), so the index on pollingInterval is still used
+                    conditions.append(name + ' BETWEEN ? AND ?')
+                    values += [value - Constants.FLOAT_TOLERANCE, value + Constants.FLOAT_TOLERANCE]
+                else:
+                    conditions.append(name + ' ' + operator + ' ?')
+                    values.append(value)
+        if device is not None:
+            conditions.append('device LIKE ?')
+            values.append('%' + device + '%')
+        if order_by not in columns:
+            raise ValueError('Unknown column: ' + order_by)
+
+        sql = 'SELECT ' + ', '.join(selected_columns) + ' FROM runs'
+        if len(conditions) > 0:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY ' + order_by
+        if limit is not None:
+            sql += ' LIMIT ' + str(int(limit))
+        return [dict(row) for row in self.connection.execute(sql, values)]
+
+    # Latencies of a run in ms
+    def get_latencies(self, run_id):
+        import numpy as np
+
+        rows = self.connection.execute('SELECT latency FROM samples WHERE runId = ? ORDER BY counter', (run_id,))
+        return np.fromiter((row[0] for row in rows), dtype=np.float64) / 1000
+
+
+# Add a single log to the index, e.g. right after it has been measured. Errors are printed, as the log itself is
+# not affected by them. Returns True if the log has been indexed
+def index_log(file_path, index_path=Constants.INDEX_PATH):
+    try:
+        index = ResultsIndex(index_path)
+        try:
+            index.add_log(file_path)
+        finally:
+            index.close()
+        return True
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print('Could not add', file_path, 'to the results index:', e)
+        return False
+
+
+def print_runs(runs):
+    print(';'.join(Constants.QUERY_COLUMNS))
+    for run in runs:
+        print(';'.join('%.3f' % run[name] if isinstance(run[name], float) else
+                       str(run[name] if run[name] is not None else '') for name in Constants.QUERY_COLUMNS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite index of all LagBox measurements')
+    parser.add_argument('--index', default=Constants.INDEX_PATH, help='path of the index')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help='index all new or changed logs of a directory')
+    import_parser.add_argument('directory', nargs='?', default=Constants.LOG_DIRECTORY)
+    import_parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+
+    query_parser = commands.add_parser('query', help='list the runs matching all filters')
+    query_parser.add_argument('--type', type=str.capitalize, choices=Constants.DEVICE_TYPE_CHOICES,
+                              help='device type (Gamepad, Mouse, Keyboard or its number)')
+    query_parser.add_argument('--hz', type=float, help='polling rate in Hz (file name or bInterval)')
+    query_parser.add_argument('--vendor', help='vendor ID (hex)')
+    query_parser.add_argument('--product', help='product ID (hex)')
+    query_parser.add_argument('--device', help='part of the device name')
+    query_parser.add_argument('--max', nargs=2, action='append', default=[], metavar=('COLUMN', 'VALUE'),
+                              help='upper bound of a column, e.g. --max median 5 (repeatable)')
+    query_parser.add_argument('--min', nargs=2, action='append', default=[], metavar=('COLUMN', 'VALUE'),
+                              help='lower bound of a column, e.g. --min n 1000 (repeatable)')
+    query_parser.add_argument('--order', default='median', help='column to sort by')
+    query_parser.add_argument('--limit', type=int, default=None)
+
+    samples_parser = commands.add_parser('samples', help='print the latencies of a run in ms')
+    samples_parser.add_argument('run_id', type=int)
+    args = parser.parse_args()
+
+    index = ResultsIndex(args.index)
+    try:
+        if args.command == 'import':
+            if not os.path.isdir(args.directory):
+                sys.exit('Directory missing: ' + args.directory)
+            start = time.perf_counter()
+            num_indexed = index.import_directory(args.directory, args.workers)
+            print(num_indexed, 'logs indexed in %.1f s' % (time.perf_counter() - start))
+
+        elif args.command == 'query':
+            equal = {}
+            if args.type is not None:
+                equal['deviceType'] = get_device_type_id(args.type)
+            if args.hz is not None:
+                equal['pollingInterval'] = 1000 / args.hz
+            if args.vendor is not None:
+                equal['vendorId'] = args.vendor.lower()
+            if args.product is not None:
+                equal['productId'] = args.product.lower()
+            try:
+                start = time.perf_counter()
+                runs = index.query(equal, {name: float(value) for name, value in args.max},
+                                   {name: float(value) for name, value in args.min}, args.device, args.order,
+                                   args.limit)
+            except ValueError as e:
+                sys.exit(str(e))
+            print_runs(runs)
+            print(len(runs), 'runs in %.1f ms' % ((time.perf_counter() - start) * 1000), file=sys.stderr)
+
+        elif args.command == 'samples':
+            for latency in index.get_latencies(args.run_id):
+                print('%.3f' % latency)
+    finally:
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
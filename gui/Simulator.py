@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Hardware-free stand-in for the LagBox: a virtual USB mouse (created via /dev/uinput) whose left button is "pressed"
+# by a simulated optocoupler. Setting the simulated GPIO pin presses the button after a latency drawn from a
+# configurable distribution, clearing it releases the button again. While the pin is not used, the button is clicked
+# regularly, so the button detection of the GUI can be tested as well.
+#
+# The simulator runs as its own process that owns the virtual device. The measurement (MeasurementEngine.py with
+# -gpio simulator) sets the pin by sending a datagram to the simulator's socket.
+#
+# usage: python Simulator.py [--latency uniform:1:9] [--idle-click-interval 2] [--socket PATH]  (needs /dev/uinput)
+#
+# Latency distributions (all values in ms):
+#   const:X           always X
+#   uniform:A:B       uniformly distributed between A and B
+#   normal:MEAN:SD    normally distributed (negative values are clipped to 0)
+#   polling:BASE:P    BASE plus a uniformly distributed wait for the next USB poll of a device polled every P ms
+
+import argparse
+import fcntl
+import heapq
+import os
+import random
+import selectors
+import socket
+import struct
+import sys
+import time
+
+
+class Constants:
+    UINPUT_PATH = '/dev/uinput'
+    SOCKET_PATH = os.environ.get('LAGBOX_SIMULATOR_SOCKET', '/tmp/lagbox-simulator.sock')
+    DEFAULT_LATENCY = 'uniform:1:9'
+    IDLE_CLICK_INTERVAL = 2.0  # in s, 0 disables the idle clicks
+    IDLE_CLICK_DURATION = 0.05  # Time between press and release of an idle click in s
+
+    DEVICE_NAME = b'LagBox Simulator Mouse'
+    DEVICE_PHYS = b'usb-lagbox-simulator/input0'  # Contains "usb", so DeviceInventory lists the device
+    BUS_USB = 0x03
+    VENDOR_ID = 0x1d6b
+    PRODUCT_ID = 0x0104
+
+    # linux/input-event-codes.h
+    EV_SYN = 0x00
+    EV_KEY = 0x01
+    EV_REL = 0x02
+    SYN_REPORT = 0
+    REL_X = 0x00
+    REL_Y = 0x01
+    BTN_LEFT = 0x110
+    BTN_RIGHT = 0x111
+
+    # linux/uinput.h
+    UI_DEV_CREATE = 0x5501  # _IO('U', 1)
+    UI_DEV_DESTROY = 0x5502  # _IO('U', 2)
+    UI_SET_EVBIT = 0x40045564  # _IOW('U', 100, int)
+    UI_SET_KEYBIT = 0x40045565  # _IOW('U', 101, int)
+    UI_SET_RELBIT = 0x40045566  # _IOW('U', 102, int)
+    UI_SET_PHYS = (1 << 30) | (struct.calcsize('P') << 16) | (ord('U') << 8) | 108  # _IOW('U', 108, char *)
+    USER_DEV_FORMAT = '80sHHHHI256i'  # struct uinput_user_dev
+    EVENT_FORMAT = 'llHHi'  # struct input_event
+
+    PIN_HIGH = b'1'
+    PIN_LOW = b'0'
+
+
+# Create a function that returns a random latency in s from a distribution like "uniform:1:9" (see above)
+def parse_latency_distribution(spec):
+    name, _, parameters = spec.partition(':')
+    try:
+        values = [float(value) / 1000 for value in parameters.split(':')] if len(parameters) > 0 else []
+    except ValueError:
+        raise ValueError('Invalid latency distribution: ' + spec)
+
+    if name == 'const' and len(values) == 1:
+        return lambda: values[0]
+    if name == 'uniform' and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if name == 'normal' and len(values) == 2:
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if name == 'polling' and len(values) == 2:
+        return lambda: values[0] + random.uniform(0, values[1])
+    raise ValueError('Invalid latency distribution: ' + spec)
+
+
+# A virtual mouse created via uinput. Only the left button is used
+class VirtualMouse:
+
+    def __init__(self, uinput_path=Constants.UINPUT_PATH):
+        self.file_descriptor = os.open(uinput_path, os.O_WRONLY | os.O_NONBLOCK)
+
+        fcntl.ioctl(self.file_descriptor, Constants.UI_SET_EVBIT, Constants.EV_KEY)
+        fcntl.ioctl(self.file_descriptor, Constants.UI_SET_EVBIT, Constants.EV_REL)
+        fcntl.ioctl(self.file_descriptor, Constants.UI_SET_EVBIT, Constants.EV_SYN)
+        for button in [Constants.BTN_LEFT, Constants.BTN_RIGHT]:
+            fcntl.ioctl(self.file_descriptor, Constants.UI_SET_KEYBIT, button)
+        for axis in [Constants.REL_X, Constants.REL_Y]:
+            fcntl.ioctl(self.file_descriptor, Constants.UI_SET_RELBIT, axis)
+        fcntl.ioctl(self.file_descriptor, Constants.UI_SET_PHYS, Constants.DEVICE_PHYS + b'\0')
+
+        os.write(self.file_descriptor, struct.pack(Constants.USER_DEV_FORMAT, Constants.DEVICE_NAME, Constants.BUS_USB,
+                                                   Constants.VENDOR_ID, Constants.PRODUCT_ID, 1, 0, *([0] * 256)))
+        fcntl.ioctl(self.file_descriptor, Constants.UI_DEV_CREATE)
+
+    def set_button(self, pressed):
+        os.write(self.file_descriptor,
+                 struct.pack(Constants.EVENT_FORMAT, 0, 0, Constants.EV_KEY, Constants.BTN_LEFT, int(pressed)) +
+                 struct.pack(Constants.EVENT_FORMAT, 0, 0, Constants.EV_SYN, Constants.SYN_REPORT, 0))
+
+    def close(self):
+        fcntl.ioctl(self.file_descriptor, Constants.UI_DEV_DESTROY)
+        os.close(self.file_descriptor)
+
+
+class SimulatorServer:
+
+    def __init__(self, latency, socket_path=Constants.SOCKET_PATH, idle_click_interval=Constants.IDLE_CLICK_INTERVAL):
+        self.latency = latency  # Function returning the latency of the next button change in s
+        self.socket_path = socket_path
+        self.idle_click_interval = idle_click_interval
+        self.mouse = VirtualMouse()
+        self.scheduled = []  # Heap of (time, button state) of the button changes that are due
+        self.last_pin_change = time.monotonic()
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(socket_path)
+
+    # Press or release the button after the simulated latency. Without latency, it is changed right away
+    def on_pin_changed(self, high):
+        self.last_pin_change = time.monotonic()
+        latency = self.latency()
+        if latency <= 0:
+            self.mouse.set_button(high)
+        else:
+            heapq.heappush(self.scheduled, (self.last_pin_change + latency, high))
+
+    def get_timeout(self):
+        if len(self.scheduled) > 0:
+            return max(0.0, self.scheduled[0][0] - time.monotonic())
+        if self.idle_click_interval > 0:
+            return max(0.0, self.last_pin_change + self.idle_click_interval - time.monotonic())
+        return None
+
+    def run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.socket, selectors.EVENT_READ)
+
+        while True:
+            if len(selector.select(self.get_timeout())) > 0:
+                message = self.socket.recv(16)
+                if message in (Constants.PIN_HIGH, Constants.PIN_LOW):
+                    self.on_pin_changed(message == Constants.PIN_HIGH)
+
+            now = time.monotonic()
+            while len(self.scheduled) > 0 and self.scheduled[0][0] <= now:
+                self.mouse.set_button(heapq.heappop(self.scheduled)[1])
+
+            if len(self.scheduled) == 0 and self.idle_click_interval > 0 and \
+                    now - self.last_pin_change >= self.idle_click_interval:
+                # Nobody is measuring, so click the button for the button detection
+                self.mouse.set_button(True)
+                time.sleep(Constants.IDLE_CLICK_DURATION)
+                self.mouse.set_button(False)
+                self.last_pin_change = time.monotonic()
+
+    def close(self):
+        self.socket.close()
+        os.remove(self.socket_path)
+        self.mouse.close()
+
+
+# GPIO backend for MeasurementEngine (-gpio simulator) that sets the pin of a running SimulatorServer
+class SimulatedGpioBackend:
+
+    def __init__(self, pin, socket_path=Constants.SOCKET_PATH):
+        self.pin = pin  # Not used, the simulator has only one pin
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            self.socket.connect(socket_path)
+        except OSError as e:
+            self.socket.close()
+            raise OSError('Simulator is not running (start it with: python Simulator.py): ' + str(e))
+
+    def set_output(self, high):
+        self.socket.send(Constants.PIN_HIGH if high else Constants.PIN_LOW)
+
+    def close(self):
+        self.socket.send(Constants.PIN_LOW)
+        self.socket.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated LagBox with a virtual USB mouse')
+    parser.add_argument('--latency', default=Constants.DEFAULT_LATENCY, help='latency distribution in ms')
+    parser.add_argument('--idle-click-interval', type=float, default=Constants.IDLE_CLICK_INTERVAL,
+                        help='time between clicks while the pin is not used in s (0 = off)')
+    parser.add_argument('--socket', default=Constants.SOCKET_PATH, help='path of the socket for the pin changes')
+    args = parser.parse_args()
+
+    try:
+        server = SimulatorServer(parse_latency_distribution(args.latency), args.socket, args.idle_click_interval)
+    except ValueError as e:
+        sys.exit(str(e))
+    except OSError as e:
+        sys.exit('Could not create the virtual device (is the uinput module loaded and writable?): ' + str(e))
+
+    print('Simulating', Constants.DEVICE_NAME.decode('utf-8'), 'with latency', args.latency, 'on', args.socket)
+    sys.stdout.flush()
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
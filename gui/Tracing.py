@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Timing of the phases of a measurement run (device scan, bInterval probing, the measurement tool, parsing the log,
+# plot, metadata, upload). Phases are wrapped in spans, which can be nested:
+#
+#   with Tracing.tracer.span('parse'):
+#       ...
+#
+# Phases that run in a worker (like the plot in PlotEngine's process) are added with record() when their future is
+# done. Tracing is off unless LAGBOX_TRACE=1 is set. Then span() returns a shared object that does nothing, so the
+# spans can stay in the code.
+#
+# When tracing is on, every run is written next to its log as <log>_trace.json in the Trace Event Format (can be
+# opened in chrome://tracing or ui.perfetto.dev) and the durations are written to a Prometheus textfile
+# (LAGBOX_PROMETHEUS_FILE, default ../log/lagbox.prom) for the textfile collector of node_exporter.
+# With LAGBOX_PROFILE=<phase>, the spans of that phase are profiled with cProfile and saved as <log>_<phase>.prof
+# (view with python -m pstats or snakeviz). cProfile only sees the thread that entered the span.
+
+import json
+import os
+import threading
+import time
+
+import LogFile
+
+
+class Constants:
+    ENABLED = os.environ.get('LAGBOX_TRACE', '0') == '1'
+    PROFILED_PHASE = os.environ.get('LAGBOX_PROFILE')  # Name of the phase to profile or None
+    PROMETHEUS_FILE = os.environ.get('LAGBOX_PROMETHEUS_FILE', '../log/lagbox.prom')
+
+    TRACE_SUFFIX = '_trace.json'
+    PROFILE_SUFFIX = '.prof'
+    METRIC_PREFIX = 'lagbox_'
+
+
+# Returned by span() when tracing is off
+class NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, key, value):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes  # Shown in the trace, e.g. the number of devices found
+        self.start = None  # time.perf_counter() in s
+        self.end = None
+        self.depth = 0  # Number of enclosing spans in the same thread
+        self.thread_id = None
+        self.profile = None  # cProfile.Profile while this span is profiled
+
+    def __enter__(self):
+        self.tracer.enter(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        self.tracer.exit(self)
+        return False
+
+    # Add an attribute that is only known at the end of the span
+    def set(self, key, value):
+        self.attributes[key] = value
+
+
+class Tracer:
+
+    def __init__(self, enabled=Constants.ENABLED, profiled_phase=Constants.PROFILED_PHASE,
+                 prometheus_path=Constants.PROMETHEUS_FILE):
+        self.enabled = enabled
+        self.profiled_phase = profiled_phase
+        self.prometheus_path = prometheus_path
+        self.lock = threading.Lock()
+        self.local = threading.local()  # Stack of the open spans of every thread
+        self.origin = time.perf_counter()  # Start of the timestamps in the traces
+        self.totals = {}  # Seconds and number of spans of every phase since the start of the process
+        self.num_runs = 0
+        self.profile = None  # cProfile.Profile of the profiled phase of the current run
+        self.num_profiled_spans = 0  # Open spans that are being profiled. The profile is only saved if there are none
+        self.reset()
+
+    # Start a new run. Spans of the previous run that have not been written are dropped
+    def reset(self):
+        with self.lock:
+            self.spans = []  # All finished spans of the current run
+            self.log_path = None
+            self.profile = None
+            self.run_start = time.time()
+
+    def span(self, name, **attributes):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attributes)
+
+    def get_stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def enter(self, span):
+        stack = self.get_stack()
+        span.depth = len(stack)
+        span.thread_id = threading.get_native_id()
+        stack.append(span)
+        if span.name == self.profiled_phase:
+            self.start_profile(span)
+
+    def exit(self, span):
+        if span.profile is not None:
+            span.profile.disable()
+            with self.lock:
+                self.num_profiled_spans -= 1
+        self.get_stack().pop()
+        self.add(span)
+
+    def start_profile(self, span):
+        import cProfile
+
+        with self.lock:
+            if self.num_profiled_spans > 0:
+                return  # The span is nested in another span of the same phase, which is already profiled
+            if self.profile is None:
+                self.profile = cProfile.Profile()
+            try:
+                self.profile.enable()
+            except ValueError:
+                return  # Another profiler is active
+            span.profile = self.profile
+            self.num_profiled_spans += 1
+
+    # Add a phase that was timed elsewhere, e.g. from the done callback of a future. start and end are
+    # time.perf_counter() values
+    def record(self, name, start, end=None, **attributes):
+        if not self.enabled:
+            return
+        span = Span(self, name, attributes)
+        span.start = start
+        span.end = end if end is not None else time.perf_counter()
+        span.thread_id = threading.get_native_id()
+        self.add(span)
+
+    def add(self, span):
+        with self.lock:
+            self.spans.append(span)
+            seconds, count = self.totals.get(span.name, (0.0, 0))
+            self.totals[span.name] = (seconds + span.end - span.start, count + 1)
+        if span.depth == 0:
+            self.write()
+
+    # The log of the run is known. Everything traced so far is written, and again whenever another phase finishes
+    def set_log_path(self, log_path):
+        if not self.enabled:
+            return
+        with self.lock:
+            is_new_run = self.log_path is None
+            self.log_path = log_path
+            if is_new_run:
+                self.num_runs += 1
+        self.write()
+
+    def get_trace(self):
+        # Metadata events name the threads (e.g. the QThread of the measurement)
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread.native_id,
+                   'args': {'name': thread.name}} for thread in threading.enumerate()]
+        for span in self.spans:
+            events.append({'name': span.name, 'ph': 'X', 'pid': os.getpid(), 'tid': span.thread_id,
+                           'ts': round((span.start - self.origin) * 1e6), 'dur': round((span.end - span.start) * 1e6),
+                           'args': span.attributes})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'log': self.log_path, 'start': self.run_start, 'phases': self.get_run_durations()}}
+
+    # Total duration of every phase in the current run in s
+    def get_run_durations(self):
+        durations = {}
+        for span in self.spans:
+            durations[span.name] = durations.get(span.name, 0.0) + span.end - span.start
+        return durations
+
+    def get_prometheus_text(self):
+        prefix = Constants.METRIC_PREFIX
+        lines = ['# HELP ' + prefix + 'phase_duration_seconds Duration of the phase in the latest run',
+                 '# TYPE ' + prefix + 'phase_duration_seconds gauge']
+        for name, seconds in sorted(self.get_run_durations().items()):
+            lines.append('%sphase_duration_seconds{phase="%s"} %.6f' % (prefix, name, seconds))
+        lines += ['# HELP ' + prefix + 'phase_seconds_total Time spent in the phase since the start',
+                  '# TYPE ' + prefix + 'phase_seconds_total counter']
+        for name, (seconds, _) in sorted(self.totals.items()):
+            lines.append('%sphase_seconds_total{phase="%s"} %.6f' % (prefix, name, seconds))
+        lines += ['# HELP ' + prefix + 'phase_count_total Number of times the phase ran since the start',
+                  '# TYPE ' + prefix + 'phase_count_total counter']
+        for name, (_, count) in sorted(self.totals.items()):
+            lines.append('%sphase_count_total{phase="%s"} %d' % (prefix, name, count))
+        lines += ['# HELP ' + prefix + 'runs_total Number of traced runs since the start',
+                  '# TYPE ' + prefix + 'runs_total counter',
+                  '%sruns_total %d' % (prefix, self.num_runs),
+                  '# HELP ' + prefix + 'last_run_timestamp_seconds Start of the latest run',
+                  '# TYPE ' + prefix + 'last_run_timestamp_seconds gauge',
+                  '%slast_run_timestamp_seconds %.3f' % (prefix, self.run_start)]
+        return '\n'.join(lines) + '\n'
+
+    # Write the trace (and the profile) of the current run next to its log and update the Prometheus textfile.
+    # Both are replaced atomically, so the collector never reads half a file
+    def write(self):
+        with self.lock:
+            if self.log_path is None:
+                return
+            base_path = os.path.splitext(self.log_path)[0]
+            trace = json.dumps(self.get_trace(), indent=1).encode('utf-8')
+            metrics = self.get_prometheus_text().encode('utf-8')
+            profile = self.profile if self.num_profiled_spans == 0 else None
+
+            try:
+                LogFile.write_atomically(base_path + Constants.TRACE_SUFFIX, lambda file: file.write(trace))
+                if self.prometheus_path is not None:
+                    LogFile.write_atomically(self.prometheus_path, lambda file: file.write(metrics))
+                if profile is not None:
+                    profile.dump_stats(base_path + '_' + self.profiled_phase + Constants.PROFILE_SUFFIX)
+            except OSError as e:
+                print('Could not write the trace:', e)
+
+
+tracer = Tracer()  # Used by all modules of the process
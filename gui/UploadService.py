@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Uploads LagBox logs to the server in the background.
+# Every upload is first stored in an on-disk queue (a copy of the log named by its SHA-256 hash and a .json file with
+# the form fields), so pending uploads survive a restart and can be sent later in bulk. Logs whose hash has already
+# been uploaded are never sent again. Uploads run in a single worker thread with a pooled HTTP session, timeouts and
+# exponential backoff, so the GUI never waits for the network. Uploads that the server rejects are moved out of the
+# queue into its rejected/ directory, so they are not sent again and again. The connection test runs in a thread of
+# its own with a short timeout, so it does not wait behind uploads that are being retried.
+#
+# usage: python UploadService.py [--url URL] [--queue DIRECTORY]  (sends all pending uploads)
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import LogFile
+
+
+class Constants:
+    SERVER_URL = 'https://hci.ur.de/projects/latency/upload'
+    FORM_ID = 'projects:latency:upload'
+    QUEUE_DIRECTORY = '../log/.upload_queue'
+    UPLOADED_FILE_NAME = 'uploaded.txt'  # Hashes of all logs that were uploaded successfully (one per line)
+    REJECTED_DIRECTORY_NAME = 'rejected'  # Entries (.json and .csv) that the server rejected, kept for inspection
+
+    CONNECT_TIMEOUT = 5  # in s
+    READ_TIMEOUT = 30  # in s
+    CHECK_TIMEOUT = 3  # Connect and read timeout of the connection test in s
+    MAX_ATTEMPTS = 5  # Attempts per upload before it is left in the queue for the next run
+    BACKOFF_BASE = 1  # Delay before the second attempt in s. Doubled after every failed attempt
+    BACKOFF_MAX = 60  # in s
+
+    # Status codes that are caused by a temporary problem of the server. Uploads are retried after these
+    RETRY_STATUS_CODES = [408, 429, 500, 502, 503, 504]
+
+    HASH_CHUNK_SIZE = 1048576
+
+
+# Raised for an upload that can not succeed by retrying it (e.g. the server rejects the form)
+class UploadRejectedError(Exception):
+    pass
+
+
+def hash_file(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(Constants.HASH_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+# The multipart form expected by the upload page of the server (a DokuWiki bureaucracy form)
+def build_form(entry, file):
+    return {
+        'bureaucracy[0]': (entry['file'], file),
+        'bureaucracy[1]': (None, entry['authors']),
+        'bureaucracy[2]': (None, entry['email']),
+        'bureaucracy[3]': (None, str(entry['public'])),
+        'bureaucracy[4]': (None, 'Comments'),
+        'bureaucracy[$$id]': (None, '1'),
+        'id': (None, Constants.FORM_ID)
+    }
+
+
+# Delay before the next attempt after attempt failed attempts: exponential with a random jitter, so multiple LagBoxes
+# do not retry at the same moment
+def get_backoff_delay(attempt):
+    delay = min(Constants.BACKOFF_BASE * 2 ** (attempt - 1), Constants.BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class UploadService:
+
+    def __init__(self, server_url=Constants.SERVER_URL, queue_directory=Constants.QUEUE_DIRECTORY):
+        self.server_url = server_url
+        self.queue_directory = queue_directory
+        self.executor = None
+        self.check_executor = None  # Runs the connection tests
+        self.session = None
+        self.stop_event = threading.Event()  # Interrupts the backoff delays on shutdown
+        self.lock = threading.Lock()  # Protects the queue directory
+
+    def get_executor(self):
+        if self.executor is None:
+            # A single thread, so uploads are sent one after another and never twice at the same time
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        return self.executor
+
+    def get_check_executor(self):
+        if self.check_executor is None:
+            self.check_executor = ThreadPoolExecutor(max_workers=1)
+        return self.check_executor
+
+    # requests is only imported in the worker thread, because it is slow to import
+    def get_session(self):
+        if self.session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            self.session = requests.Session()
+            self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        return self.session
+
+    def get_uploaded_hashes(self):
+        try:
+            with open(os.path.join(self.queue_directory, Constants.UPLOADED_FILE_NAME), 'r') as file:
+                return set(line.strip() for line in file if len(line.strip()) > 0)
+        except OSError:
+            return set()
+
+    # All entries of the queue, oldest first
+    def get_pending(self):
+        return self.read_entries(self.queue_directory)
+
+    # Entries that the server rejected, oldest first. Their 'rejected' field has the reason
+    def get_rejected(self):
+        return self.read_entries(os.path.join(self.queue_directory, Constants.REJECTED_DIRECTORY_NAME))
+
+    def read_entries(self, directory):
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return []
+
+        entries = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, name), 'r') as file:
+                    entries.append(json.load(file))
+            except (OSError, ValueError) as e:
+                print('Broken entry in upload queue:', name, e)
+        return sorted(entries, key=lambda entry: entry['queued'])
+
+    # Add a log to the queue. The log is copied, so later changes to it do not affect the upload.
+    # Returns the hash of the log and False if it has already been uploaded, is already queued or was rejected.
+    def enqueue(self, file_path, authors, email, public):
+        file_hash = hash_file(file_path)
+
+        with self.lock:
+            entry_path = os.path.join(self.queue_directory, file_hash + '.json')
+            rejected_path = os.path.join(self.queue_directory, Constants.REJECTED_DIRECTORY_NAME, file_hash + '.json')
+            if file_hash in self.get_uploaded_hashes() or os.path.exists(entry_path) or os.path.exists(rejected_path):
+                return file_hash, False
+
+            os.makedirs(self.queue_directory, exist_ok=True)
+            shutil.copyfile(file_path, os.path.join(self.queue_directory, file_hash + '.csv'))
+
+            entry = {'sha256': file_hash, 'file': file_path, 'authors': authors, 'email': email, 'public': public,
+                     'queued': time.time()}
+            content = json.dumps(entry).encode('utf-8')
+            # The entry is written last and atomically, so an entry always has its copy of the log
+            LogFile.write_atomically(entry_path, lambda file: file.write(content))
+
+        return file_hash, True
+
+    def mark_uploaded(self, file_hash):
+        with self.lock:
+            with open(os.path.join(self.queue_directory, Constants.UPLOADED_FILE_NAME), 'a') as file:
+                file.write(file_hash + '\n')
+            os.remove(os.path.join(self.queue_directory, file_hash + '.json'))
+            os.remove(os.path.join(self.queue_directory, file_hash + '.csv'))
+
+    # Move an entry out of the queue. The log is moved first, so an entry in the queue always has its copy of the log
+    def mark_rejected(self, entry, reason):
+        rejected_directory = os.path.join(self.queue_directory, Constants.REJECTED_DIRECTORY_NAME)
+        file_hash = entry['sha256']
+        with self.lock:
+            os.makedirs(rejected_directory, exist_ok=True)
+            os.replace(os.path.join(self.queue_directory, file_hash + '.csv'),
+                       os.path.join(rejected_directory, file_hash + '.csv'))
+            content = json.dumps(dict(entry, rejected=reason)).encode('utf-8')
+            LogFile.write_atomically(os.path.join(rejected_directory, file_hash + '.json'),
+                                     lambda file: file.write(content))
+            os.remove(os.path.join(self.queue_directory, file_hash + '.json'))
+
+    # Send a single entry of the queue. Raises UploadRejectedError if retrying does not help and the exception of
+    # requests if the server could not be reached
+    def send(self, entry):
+        session = self.get_session()
+        with open(os.path.join(self.queue_directory, entry['sha256'] + '.csv'), 'rb') as file:
+            response = session.post(self.server_url, files=build_form(entry, file),
+                                    timeout=(Constants.CONNECT_TIMEOUT, Constants.READ_TIMEOUT))
+
+        if response.status_code >= 400 and response.status_code not in Constants.RETRY_STATUS_CODES:
+            raise UploadRejectedError(str(response.status_code) + ' ' + response.reason)
+        response.raise_for_status()
+
+    # Send one entry with exponential backoff. Returns True if it was uploaded. Rejected entries leave the queue
+    def send_with_retries(self, entry):
+        import requests
+
+        for attempt in range(1, Constants.MAX_ATTEMPTS + 1):
+            try:
+                self.send(entry)
+                self.mark_uploaded(entry['sha256'])
+                print('Uploaded', entry['file'])
+                return True
+            except UploadRejectedError as e:
+                print('Upload of', entry['file'], 'rejected:', e)
+                self.mark_rejected(entry, str(e))
+                return False
+            except requests.exceptions.RequestException as e:
+                print('Upload of', entry['file'], 'failed (attempt ' + str(attempt) + '):', e)
+
+            if attempt < Constants.MAX_ATTEMPTS and self.stop_event.wait(get_backoff_delay(attempt)):
+                break  # Shutting down, the entry stays in the queue
+        return False
+
+    # Send all pending uploads. Runs in the worker thread. Returns the number of uploaded and remaining logs
+    def upload_pending_entries(self):
+        num_uploaded = 0
+        for entry in self.get_pending():
+            if self.stop_event.is_set():
+                break
+            if self.send_with_retries(entry):
+                num_uploaded += 1
+        return num_uploaded, len(self.get_pending())
+
+    # Returns True if the server can be reached. Uses its own connection, because the session belongs to the worker
+    # thread of the uploads
+    def is_server_reachable(self):
+        import requests
+
+        try:
+            response = requests.get(self.server_url, timeout=Constants.CHECK_TIMEOUT)
+            response.raise_for_status()
+            return True
+        except requests.exceptions.RequestException:
+            return False
+
+    # Send all pending uploads in the background. The future returns the number of uploaded and remaining logs
+    def upload_pending(self):
+        return self.get_executor().submit(self.upload_pending_entries)
+
+    # Check in the background if the server can be reached. The future returns True or False
+    def check_connection(self):
+        return self.get_check_executor().submit(self.is_server_reachable)
+
+    # Pending uploads that are still running are stopped. They are kept in the queue and sent on the next start
+    def shutdown(self):
+        self.stop_event.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        if self.check_executor is not None:
+            self.check_executor.shutdown(wait=False)
+            self.check_executor = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send all pending uploads of LagBox logs')
+    parser.add_argument('--url', default=Constants.SERVER_URL, help='URL of the upload page')
+    parser.add_argument('--queue', default=Constants.QUEUE_DIRECTORY, help='directory of the upload queue')
+    args = parser.parse_args()
+
+    service = UploadService(args.url, args.queue)
+    num_uploaded, num_remaining = service.upload_pending().result()
+    service.shutdown()
+
+    print(num_uploaded, 'logs uploaded,', num_remaining, 'remaining in the queue')
+    num_rejected = len(service.get_rejected())
+    if num_rejected > 0:
+        print(num_rejected, 'logs rejected by the server, see',
+              os.path.join(args.queue, Constants.REJECTED_DIRECTORY_NAME))
+    if num_remaining > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
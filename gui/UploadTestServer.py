@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Local stand-in for the upload page of the server. Accepts the bureaucracy[...] multipart form sent by UploadService
+# and stores every received log together with its form fields. Failures of a flaky network can be simulated.
+#
+# usage: python UploadTestServer.py [--port 8000] [--output directory] [--fail-rate 0.5] [--delay seconds]
+# Then send the pending uploads to it: python UploadService.py --url http://localhost:8000/
+
+import argparse
+import email.parser
+import email.policy
+import json
+import os
+import random
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+
+class Constants:
+    PORT = 8000
+    OUTPUT_DIRECTORY = 'received_uploads'
+    REQUIRED_FIELDS = ['bureaucracy[0]', 'bureaucracy[1]', 'bureaucracy[2]', 'bureaucracy[3]', 'id']
+
+
+# Split a multipart/form-data body into {field name: (file name or None, content as bytes)}
+def parse_form(content_type, body):
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        fields[name] = (part.get_filename(), part.get_payload(decode=True))
+    return fields
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+
+    # Set by main()
+    output_directory = Constants.OUTPUT_DIRECTORY
+    fail_rate = 0.0
+    delay = 0.0
+
+    def send_text(self, status, text):
+        content = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    # Used by the connection test of the GUI
+    def do_GET(self):
+        self.send_text(200, 'LagBox upload test server\n')
+
+    def do_POST(self):
+        time.sleep(self.delay)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if random.random() < self.fail_rate:
+            self.send_text(503, 'Simulated failure\n')
+            return
+
+        fields = parse_form(self.headers.get('Content-Type', ''), body)
+        missing_fields = [name for name in Constants.REQUIRED_FIELDS if name not in fields]
+        if len(missing_fields) > 0:
+            self.send_text(400, 'Missing fields: ' + ', '.join(missing_fields) + '\n')
+            return
+
+        file_name, content = fields['bureaucracy[0]']
+        output_path = os.path.join(self.output_directory, str(int(time.time() * 1000)) + '_' +
+                                   os.path.basename(file_name or 'upload.csv'))
+        with open(output_path, 'wb') as file:
+            file.write(content)
+        with open(output_path + '.json', 'w') as file:
+            json.dump({name: value.decode('utf-8') for name, (_, value) in fields.items()
+                       if name != 'bureaucracy[0]'}, file, indent=1)
+
+        print('Received', file_name, '(' + str(len(content)) + ' bytes)')
+        self.send_text(200, 'OK\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the LagBox upload server')
+    parser.add_argument('--port', type=int, default=Constants.PORT)
+    parser.add_argument('--output', default=Constants.OUTPUT_DIRECTORY, help='directory for the received logs')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of uploads answered with 503')
+    parser.add_argument('--delay', type=float, default=0.0, help='delay before answering an upload in s')
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    UploadHandler.output_directory = args.output
+    UploadHandler.fail_rate = args.fail_rate
+    UploadHandler.delay = args.delay
+
+    server = HTTPServer(('localhost', args.port), UploadHandler)
+    print('Listening on http://localhost:' + str(args.port) + '/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
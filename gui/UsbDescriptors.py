@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Reads the polling interval (bInterval) of a USB input device from the binary descriptors in sysfs
+# (/sys/bus/usb/devices/*/descriptors) instead of calling lsusb. Results are cached for the whole session.
+
+import os
+import re
+
+
+class Constants:
+    SYSFS_ROOT = '/sys'
+    USB_DEVICES_DIRECTORY = 'bus/usb/devices'
+
+    DESCRIPTOR_TYPE_CONFIGURATION = 2
+    DESCRIPTOR_TYPE_INTERFACE = 4
+    DESCRIPTOR_TYPE_ENDPOINT = 5
+
+    INTERFACE_CLASS_HID = 3
+    ENDPOINT_DIRECTION_IN = 0x80
+    ENDPOINT_TYPE_MASK = 0x03
+    ENDPOINT_TYPE_INTERRUPT = 0x03
+
+    # Name of a USB interface in sysfs: <usb device>:<configuration>.<interface>, e.g. 1-1.2:1.0
+    INTERFACE_NAME_PATTERN = re.compile(r'^(?P<device>[\d\-.]+):(?P<configuration>\d+)\.(?P<interface>\d+)$')
+
+
+# An endpoint descriptor together with the interface it belongs to
+class Endpoint:
+
+    def __init__(self, configuration, interface_number, alternate_setting, interface_class, address, attributes,
+                 interval):
+        self.configuration = configuration
+        self.interface_number = interface_number
+        self.alternate_setting = alternate_setting
+        self.interface_class = interface_class
+        self.address = address
+        self.attributes = attributes
+        self.interval = interval  # bInterval as stored in the descriptor (like reported by lsusb)
+
+    def is_interrupt_in(self):
+        return (self.address & Constants.ENDPOINT_DIRECTION_IN) != 0 and \
+            (self.attributes & Constants.ENDPOINT_TYPE_MASK) == Constants.ENDPOINT_TYPE_INTERRUPT
+
+
+# Parse the raw descriptors of a USB device (device descriptor followed by the configuration descriptors) and
+# return all endpoints together with the interface they belong to
+def parse_endpoints(data):
+    endpoints = []
+    configuration = interface_number = alternate_setting = interface_class = None
+    offset = 0
+
+    while offset + 2 <= len(data):
+        length = data[offset]
+        descriptor_type = data[offset + 1]
+        if length < 2 or offset + length > len(data):
+            break  # Broken descriptor, the rest can not be parsed
+
+        if descriptor_type == Constants.DESCRIPTOR_TYPE_CONFIGURATION and length >= 6:
+            configuration = data[offset + 5]
+        elif descriptor_type == Constants.DESCRIPTOR_TYPE_INTERFACE and length >= 6:
+            interface_number = data[offset + 2]
+            alternate_setting = data[offset + 3]
+            interface_class = data[offset + 5]
+        elif descriptor_type == Constants.DESCRIPTOR_TYPE_ENDPOINT and length >= 7 and interface_number is not None:
+            endpoints.append(Endpoint(configuration, interface_number, alternate_setting, interface_class,
+                                      data[offset + 2], data[offset + 3], data[offset + 6]))
+
+        offset += length
+
+    return endpoints
+
+
+# Choose the endpoint whose bInterval defines the polling of the input device: the interrupt-IN endpoint of the HID
+# interface under test. If the interface is not known, the first HID interface is used.
+def select_endpoint(endpoints, configuration=None, interface_number=None):
+    candidates = [endpoint for endpoint in endpoints
+                  if endpoint.is_interrupt_in() and endpoint.alternate_setting == 0 and
+                  (configuration is None or endpoint.configuration == configuration)]
+
+    if interface_number is not None:
+        for endpoint in candidates:
+            if endpoint.interface_number == interface_number:
+                return endpoint
+
+    for endpoint in candidates:
+        if endpoint.interface_class == Constants.INTERFACE_CLASS_HID:
+            return endpoint
+
+    return candidates[0] if len(candidates) > 0 else None
+
+
+class UsbDescriptorReader:
+
+    def __init__(self, sysfs_root=Constants.SYSFS_ROOT):
+        self.sysfs_root = sysfs_root
+        self.intervals = {}  # bInterval by (vendor id, product id, interface)
+
+    def read_attribute(self, usb_device_path, name):
+        try:
+            with open(os.path.join(usb_device_path, name), 'r') as file:
+                return file.readline().strip()
+        except OSError:
+            return None
+
+    # Find the sysfs directory of a USB device by vendor and product id
+    def find_usb_device(self, vendor_id, product_id):
+        directory = os.path.join(self.sysfs_root, Constants.USB_DEVICES_DIRECTORY)
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            return None
+
+        for name in names:
+            path = os.path.join(directory, name)
+            if self.read_attribute(path, 'idVendor') == vendor_id.lower() and \
+                    self.read_attribute(path, 'idProduct') == product_id.lower():
+                return path
+        return None
+
+    # Find the USB device and the interface in the sysfs path of an input device
+    # (e.g. .../usb1/1-1/1-1.2/1-1.2:1.0/0003:046D:C077.0001/input/input3)
+    def find_interface(self, input_sysfs_path):
+        parts = input_sysfs_path.strip('/').split('/')
+        for i in range(len(parts) - 1, 0, -1):
+            match = Constants.INTERFACE_NAME_PATTERN.match(parts[i])
+            if match is not None:
+                usb_device_path = os.path.join(self.sysfs_root, *parts[:i])
+                return usb_device_path, int(match.group('configuration')), int(match.group('interface'))
+        return None, None, None
+
+    # bInterval of the interrupt-IN endpoint of an input device. The sysfs path of the input device (see
+    # DeviceInventory.Device) is used to select the interface under test. Returns None if it can not be determined.
+    def get_binterval(self, vendor_id, product_id, input_sysfs_path=''):
+        usb_device_path, configuration, interface_number = self.find_interface(input_sysfs_path)
+        key = (vendor_id.lower(), product_id.lower(), interface_number)
+        if key in self.intervals:
+            return self.intervals[key]
+
+        if usb_device_path is None:
+            usb_device_path = self.find_usb_device(vendor_id, product_id)
+        if usb_device_path is None:
+            return None
+
+        try:
+            with open(os.path.join(usb_device_path, 'descriptors'), 'rb') as file:
+                endpoints = parse_endpoints(file.read())
+        except OSError:
+            return None
+
+        if configuration is None:
+            active_configuration = self.read_attribute(usb_device_path, 'bConfigurationValue')
+            configuration = int(active_configuration) if active_configuration else None
+
+        endpoint = select_endpoint(endpoints, configuration, interface_number)
+        self.intervals[key] = endpoint.interval if endpoint is not None else None
+        return self.intervals[key]
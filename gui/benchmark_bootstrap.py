@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Times LatencyStats.bootstrap_intervals for logs of different sizes and compares its intervals with those of a plain
+# bootstrap that resamples the whole log for every resample (only for the smaller logs, the plain one is too slow).
+# The latencies are drawn from a skewed distribution similar to real measurements.
+#
+# usage: python benchmark_bootstrap.py [number of resamples (default: 10000)]
+
+import sys
+import time
+
+import LatencyStats
+
+
+class Constants:
+    SIZES = [1000, 10000, 100000]
+    MAX_PLAIN_SIZE = 10000  # Larger logs are not bootstrapped with the plain method
+    PLAIN_CHUNK_SIZE = 2 ** 22
+
+
+# Reference: draw the full resample index matrix and calculate every statistic on every resample
+def plain_bootstrap(random, latencies, resamples, confidence):
+    import numpy as np
+
+    n = len(latencies)
+    rows = max(1, Constants.PLAIN_CHUNK_SIZE // n)
+    names = ['mean'] + list(LatencyStats.Constants.BOOTSTRAP_QUANTILES.keys())
+    percentiles = list(LatencyStats.Constants.BOOTSTRAP_QUANTILES.values())
+    distributions = np.empty((len(names), resamples))
+
+    for start in range(0, resamples, rows):
+        stop = min(resamples, start + rows)
+        resampled = latencies[random.integers(0, n, (stop - start, n))]
+        distributions[0, start:stop] = resampled.mean(axis=1)
+        distributions[1:, start:stop] = np.percentile(resampled, percentiles, axis=1)
+
+    bounds = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+    return {name: np.percentile(distribution, bounds) for name, distribution in zip(names, distributions)}
+
+
+def main():
+    import numpy as np
+
+    resamples = int(sys.argv[1]) if len(sys.argv) > 1 else LatencyStats.Constants.BOOTSTRAP_RESAMPLES
+    confidence = LatencyStats.Constants.BOOTSTRAP_CONFIDENCE
+    random = np.random.default_rng(0)
+
+    print('Resamples:', resamples, '(intervals in ms)')
+    print('%8s %10s %10s %-8s %-20s %-20s' % ('samples', 'time (s)', 'plain (s)', '', 'interval', 'plain interval'))
+    for size in Constants.SIZES:
+        latencies = np.round(random.gamma(2.0, 1.5, size) + 2, 3)
+
+        start = time.perf_counter()
+        intervals = LatencyStats.bootstrap_intervals(latencies, resamples, confidence)
+        duration = time.perf_counter() - start
+
+        plain = None
+        plain_duration = float('nan')
+        if size <= Constants.MAX_PLAIN_SIZE:
+            start = time.perf_counter()
+            plain = plain_bootstrap(random, latencies, resamples, confidence)
+            plain_duration = time.perf_counter() - start
+
+        for i, (name, interval) in enumerate(intervals.items()):
+            reference = '%8.3f - %8.3f' % tuple(plain[name]) if plain is not None else ''
+            print('%8s %10s %10s %-8s %8.3f - %8.3f %s' % (size if i == 0 else '', '%.3f' % duration if i == 0 else '',
+                                                            '%.3f' % plain_duration if i == 0 else '', name,
+                                                            interval[0], interval[1], reference))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Measures the floor of MeasurementEngine: the latency it reports when the simulated device has no latency at all.
+# Starts Simulator.py with a constant latency of 0, so the measured latency is only the time from the trigger timestamp
+# through setting the pin and injecting the event until the kernel timestamps it. The spread of these values is the
+# jitter of the measurement itself. The time from the kernel event until the engine wakes up is reported as well.
+# With --save, the result is stored in ../log/calibration.json with the GPIO backend it was measured with and recorded
+# in the header of every following log of that backend (only 'simulator', a real LagBox needs its own calibration).
+#
+# usage: python benchmark_calibration.py [number of samples (default: 1000)] [--save]  (needs /dev/uinput)
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import DeviceInventory
+import LogFile
+import MeasurementEngine
+import Simulator
+
+
+class Constants:
+    SAVE_ARGUMENT = '--save'
+    STARTUP_TIMEOUT = 5.0  # Maximum time for the simulator to create the virtual device in s
+    MIN_DELAY = 100  # Delays before the trigger in µs
+    MAX_DELAY = 1000
+    GPIO_BACKEND = 'simulator'  # Key of MeasurementEngine.GPIO_BACKENDS
+    PERCENTILES = [1, 50, 99]
+
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.05)
+    return None
+
+
+# Event node of the virtual mouse of the simulator
+def find_simulator_device():
+    for device in DeviceInventory.DeviceInventory().scan():
+        if device.name == Simulator.Constants.DEVICE_NAME.decode('utf-8') and \
+                os.path.exists(os.path.join(DeviceInventory.Constants.INPUT_DEVICE_DIRECTORY, device.device_id)):
+            return device.device_id
+    return None
+
+
+def summarize(name, values):
+    import numpy as np
+
+    values = np.asarray(values, dtype=float)
+    percentiles = np.percentile(values, Constants.PERCENTILES)
+    print('%-24s %9.1f %9.1f %9.1f %9.1f %9.1f %9.1f' % ((name, values.mean(), values.std()) + tuple(percentiles) +
+                                                         (values.max(),)))
+    return {'mean_us': float(values.mean()), 'std_us': float(values.std()), 'median_us': float(percentiles[1]),
+            'p99_us': float(percentiles[2]), 'max_us': float(values.max())}
+
+
+def main():
+    num_samples = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1] != Constants.SAVE_ARGUMENT else 1000
+    save = Constants.SAVE_ARGUMENT in sys.argv
+
+    with tempfile.TemporaryDirectory() as directory:
+        socket_path = os.path.join(directory, 'simulator.sock')
+        simulator = subprocess.Popen([sys.executable, 'Simulator.py', '--latency', 'const:0',
+                                      '--idle-click-interval', '0', '--socket', socket_path],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+        try:
+            device_id = wait_for(lambda: os.path.exists(socket_path) and find_simulator_device(),
+                                 Constants.STARTUP_TIMEOUT)
+            if device_id is None:
+                sys.exit('Simulator did not start')
+
+            input_device = MeasurementEngine.InputDevice(
+                os.path.join(DeviceInventory.Constants.INPUT_DEVICE_DIRECTORY, device_id))
+            gpio = MeasurementEngine.GPIO_BACKENDS[Constants.GPIO_BACKEND](MeasurementEngine.Constants.GPIO_PIN_ID,
+                                                                           socket_path)
+            engine = MeasurementEngine.MeasurementEngine(gpio, input_device, Simulator.Constants.BTN_LEFT)
+            delays = MeasurementEngine.create_delay_list(Constants.MIN_DELAY, Constants.MAX_DELAY, num_samples)
+            try:
+                samples = engine.run(delays, lambda sample: None)
+            finally:
+                gpio.close()
+                input_device.close()
+        finally:
+            simulator.terminate()
+            simulator.wait()
+
+    print('Samples:', num_samples, '(all values in µs)')
+    print('%-24s %9s %9s %9s %9s %9s %9s' % ('', 'mean', 'sd', 'p1', 'median', 'p99', 'max'))
+    calibration = summarize('trigger -> kernel event', [sample.get_latency() for sample in samples])
+    wake_up = summarize('kernel event -> wake-up',
+                        [(sample.wake_time - sample.event_time) / 1000 for sample in samples])
+
+    if save:
+        calibration.update({'samples': num_samples, 'wake_median_us': wake_up['median_us'],
+                            'gpio': Constants.GPIO_BACKEND, 'date': datetime.today().strftime('%d-%m-%Y')})
+        content = json.dumps(calibration, indent=1).encode('utf-8')
+        os.makedirs(os.path.dirname(MeasurementEngine.Constants.CALIBRATION_FILE), exist_ok=True)
+        LogFile.write_atomically(MeasurementEngine.Constants.CALIBRATION_FILE, lambda file: file.write(content))
+        print('Calibration saved to', MeasurementEngine.Constants.CALIBRATION_FILE)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Measures the comparison of many devices with synthetic logs: the first comparison (reads all logs and tests all
+# pairs), the same comparison again (everything cached) and the comparison after one more device was measured (one
+# log read, N pairs tested). Also checks U and D of a few pairs against a naive implementation that ranks the pooled
+# samples.
+#
+# usage: python benchmark_device_comparison.py [--devices 200] [--samples 1000]
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+import DeviceComparison
+
+
+# U of a and D of a naive implementation: ranks of the pooled samples (ties get their mean rank) and the ECDFs
+# evaluated at every pooled value
+def naive_compare(a, b):
+    pooled = np.concatenate([a, b])
+    order = np.argsort(pooled, kind='stable')
+    ranks = np.empty(len(pooled))
+    ranks[order] = np.arange(1, len(pooled) + 1)
+    for value in np.unique(pooled):
+        is_tied = pooled == value
+        ranks[is_tied] = ranks[is_tied].mean()
+    u = ranks[:len(a)].sum() - len(a) * (len(a) + 1) / 2
+
+    ecdf_a = np.searchsorted(np.sort(a), pooled, side='right') / len(a)
+    ecdf_b = np.searchsorted(np.sort(b), pooled, side='right') / len(b)
+    return u, np.max(np.abs(ecdf_a - ecdf_b))
+
+
+def write_log(directory, rng, number, num_samples):
+    path = os.path.join(directory, 'AUTO_device%d_1ms_%d.csv' % (number, number))
+    offset = rng.uniform(2000, 8000)
+    with open(path, 'w') as file:
+        file.write('#Device:;device%d\n#Button:;272\n#deviceType:;2\n\ncounter;latency;delayTime\n' % number)
+        for i in range(num_samples):
+            file.write('%d;%d;%d\n' % (i, round(offset + rng.gammavariate(2.0, 500)), rng.randint(100, 10000)))
+    return path
+
+
+def measure(paths, output_prefix):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # The ranking of hundreds of devices
+        DeviceComparison.compare_logs(paths, output_prefix, plot=False)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--samples', type=int, default=1000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [write_log(directory, rng, number, args.samples) for number in range(args.devices + 1)]
+        output_prefix = os.path.join(directory, 'comparison')
+        num_pairs = args.devices * (args.devices - 1) // 2
+
+        print('%d devices with %d samples each (%d pairs)' % (args.devices, args.samples, num_pairs))
+        print('first comparison:      %8.3f s' % measure(paths[:-1], output_prefix))
+        print('again (cached):        %8.3f s' % measure(paths[:-1], output_prefix))
+        print('one more device:       %8.3f s' % measure(paths, output_prefix))
+
+        cache_directory = os.path.join(directory, DeviceComparison.Constants.CACHE_DIRECTORY_NAME)
+        samples = DeviceComparison.load_samples(paths[:4], cache_directory)
+        start = time.perf_counter()
+        results = [DeviceComparison.compare_pair(a, b) for a, b in zip(samples, samples[1:])]
+        sorted_time = (time.perf_counter() - start) / len(results)
+        start = time.perf_counter()
+        naive_results = [naive_compare(a.latencies, b.latencies) for a, b in zip(samples, samples[1:])]
+        naive_time = (time.perf_counter() - start) / len(results)
+        for result, (u, d) in zip(results, naive_results):
+            assert abs(result['u'] - u) < 1e-6 and abs(result['ksD'] - d) < 1e-9, (result, u, d)
+        print('one pair: %.2f ms with the sorted samples, %.2f ms ranking the pooled samples (same U and D)' % (
+            sorted_time * 1000, naive_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
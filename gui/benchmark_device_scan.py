@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Measures the time needed to scan the connected input devices with DeviceInventory on a recorded-style /proc and
+# sysfs tree with many input nodes, and compares it with starting a shell per read like the GUI did before.
+#
+# usage: python benchmark_device_scan.py [number of input nodes (default: 64)]
+
+import os
+import sys
+import tempfile
+import time
+from subprocess import Popen, PIPE, STDOUT
+
+import DeviceInventory
+
+
+class Constants:
+    NUM_RUNS = 20  # The best of NUM_RUNS runs is reported
+
+    # Entry of /proc/bus/input/devices as recorded on a Raspberry Pi with a USB mouse
+    USB_DEVICE_ENTRY = ('I: Bus=0003 Vendor=046d Product=c{number:03x} Version=0111\n'
+                        'N: Name="Logitech USB Mouse {number}"\n'
+                        'P: Phys=usb-3f980000.usb-1.{number}/input0\n'
+                        'S: Sysfs={usb_device}/1-1.{number}:1.0/0003:046D:C{number:03X}.{number:04X}'
+                        '/input/input{number}\n'
+                        'U: Uniq=\n'
+                        'H: Handlers=mouse{number} event{number} \n'
+                        'B: PROP=0\n'
+                        'B: EV=17\n'
+                        'B: KEY=ff0000 0 0 0 0\n'
+                        'B: REL=903\n'
+                        'B: MSC=10\n'
+                        '\n')
+
+    # Entry of a device that is not connected via USB (ignored by the LagBox)
+    OTHER_DEVICE_ENTRY = ('I: Bus=0019 Vendor=0000 Product=0001 Version=0000\n'
+                          'N: Name="Power Button {number}"\n'
+                          'P: Phys=LNXPWRBN/button/input0\n'
+                          'S: Sysfs=/devices/LNXSYSTM:00/LNXPWRBN:00/input/input{number}\n'
+                          'U: Uniq=\n'
+                          'H: Handlers=kbd event{number} \n'
+                          'B: PROP=0\n'
+                          'B: EV=3\n'
+                          '\n')
+
+    USB_DEVICE_PATH = '/devices/platform/soc/3f980000.usb/usb1/1-1/1-1.{number}'
+
+
+# Create a fake /proc/bus/input/devices and sysfs tree in directory. Every fourth node is not a USB device.
+def create_device_tree(directory, num_nodes):
+    sysfs_root = os.path.join(directory, 'sys')
+    entries = []
+
+    for number in range(num_nodes):
+        if number % 4 == 3:
+            entries.append(Constants.OTHER_DEVICE_ENTRY.format(number=number))
+            continue
+
+        usb_device = Constants.USB_DEVICE_PATH.format(number=number)
+        entries.append(Constants.USB_DEVICE_ENTRY.format(number=number, usb_device=usb_device))
+
+        os.makedirs(os.path.join(sysfs_root, usb_device.lstrip('/')))
+        with open(os.path.join(sysfs_root, usb_device.lstrip('/'), 'speed'), 'w') as file:
+            file.write('12\n')
+
+    proc_input_devices = os.path.join(directory, 'devices')
+    with open(proc_input_devices, 'w') as file:
+        file.write(''.join(entries))
+
+    return proc_input_devices, sysfs_root
+
+
+# The approach used before DeviceInventory: one shell for the device list and one more for every device speed
+def scan_with_shell(proc_input_devices, sysfs_root):
+    process = Popen('cat ' + proc_input_devices, shell=True, stdout=PIPE, stderr=STDOUT, close_fds=True)
+    entries = DeviceInventory.parse_input_devices(process.communicate()[0].decode('utf-8'))
+
+    for entry in entries:
+        if 'usb' in entry.get('Phys', ''):
+            usb_device = os.path.dirname(entry['Sysfs'].split(':')[0])
+            process = Popen('cat ' + sysfs_root + usb_device + '/speed', shell=True, stdout=PIPE, stderr=STDOUT,
+                            close_fds=True)
+            process.communicate()
+
+
+def measure(function):
+    best = float('inf')
+    for _ in range(Constants.NUM_RUNS):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+
+    with tempfile.TemporaryDirectory() as directory:
+        proc_input_devices, sysfs_root = create_device_tree(directory, num_nodes)
+
+        devices = DeviceInventory.DeviceInventory(proc_input_devices, sysfs_root).scan()
+        num_usb_nodes = len([number for number in range(num_nodes) if number % 4 != 3])
+        if len(devices) != num_usb_nodes or any(device.device_speed != '12M' for device in devices):
+            sys.exit('Scan returned wrong devices')
+
+        inventory = DeviceInventory.DeviceInventory(proc_input_devices, sysfs_root)
+        inventory.scan()
+
+        time_shell = measure(lambda: scan_with_shell(proc_input_devices, sysfs_root))
+        time_cold = measure(lambda: DeviceInventory.DeviceInventory(proc_input_devices, sysfs_root).scan())
+        time_cached = measure(inventory.scan)
+
+    print('Input nodes:', num_nodes, '(' + str(num_usb_nodes) + ' USB devices)')
+    print('%-28s %10.3f ms' % ('shell per read', time_shell * 1000))
+    print('%-28s %10.3f ms' % ('DeviceInventory (cold)', time_cold * 1000))
+    print('%-28s %10.3f ms' % ('DeviceInventory (cached)', time_cached * 1000))
+
+
+if __name__ == '__main__':
+    main()
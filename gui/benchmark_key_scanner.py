@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Measures the CPU usage while waiting for a button press: the busy loop scan_key_inputs used before (read_one()
+# without sleeping) compared with KeyScanner. Also reports how fast KeyScanner reacts to a button press and to a cancel.
+# FIFOs are used as stand-ins for the event nodes, so no input device is needed. Real event nodes can be passed instead
+# (idle CPU only, nothing is written to them).
+#
+# usage: python benchmark_key_scanner.py [idle time in s (default: 5)] [number of devices (default: 4)] [event nodes]
+
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+import KeyScanner
+
+
+class Constants:
+    KEY_CODE = 272  # BTN_LEFT
+
+
+# The approach used before KeyScanner: poll the device in a loop without waiting (like evdev's read_one())
+def scan_busy(file_descriptor, stop_event):
+    while not stop_event.is_set():
+        try:
+            os.read(file_descriptor, KeyScanner.Constants.EVENT_SIZE)
+        except BlockingIOError:
+            pass
+
+
+# CPU time used by this process during duration seconds while function runs in a thread, in % of one core
+def measure_cpu(function, duration):
+    thread = threading.Thread(target=function)
+    thread.start()
+    time.sleep(0.1)  # Let the thread settle
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    time.sleep(duration)
+    usage = (time.process_time() - cpu_start) / (time.perf_counter() - wall_start) * 100
+    return usage, thread
+
+
+def write_key_press(file_descriptor):
+    os.write(file_descriptor, struct.pack(KeyScanner.Constants.EVENT_FORMAT, 0, 0, KeyScanner.Constants.EV_KEY,
+                                          Constants.KEY_CODE, KeyScanner.Constants.KEY_DOWN))
+
+
+# Create FIFOs as stand-ins for event nodes. They are also opened for writing, so they do not report end-of-file
+def create_fake_devices(directory, num_devices):
+    paths = []
+    writers = []
+    for number in range(num_devices):
+        path = os.path.join(directory, 'event' + str(number))
+        os.mkfifo(path)
+        paths.append(path)
+        writers.append(os.open(path, os.O_RDWR | os.O_NONBLOCK))
+    return paths, writers
+
+
+def run(paths, writers, duration):
+    # Busy loop on the first device, like scan_key_inputs did
+    stop_event = threading.Event()
+    file_descriptor = os.open(paths[0], os.O_RDONLY | os.O_NONBLOCK)
+    usage_busy, thread = measure_cpu(lambda: scan_busy(file_descriptor, stop_event), duration)
+    stop_event.set()
+    thread.join()
+    os.close(file_descriptor)
+
+    # KeyScanner on all devices. The thread ends with a button press (if possible) or a cancel
+    key_scanner = KeyScanner.KeyScanner(paths)
+    result = []
+    usage_select, thread = measure_cpu(lambda: result.append(key_scanner.wait_for_key_press()), duration)
+
+    if len(writers) > 0:
+        start = time.perf_counter()
+        write_key_press(writers[-1])
+        thread.join()
+        print('%-28s %10.3f ms %s' % ('reaction to button press', (time.perf_counter() - start) * 1000, result[0]))
+    else:
+        start = time.perf_counter()
+        key_scanner.cancel()
+        thread.join()
+        print('%-28s %10.3f ms' % ('reaction to cancel', (time.perf_counter() - start) * 1000))
+    key_scanner.close()
+
+    print('%-28s %10.1f %%' % ('busy loop (1 device)', usage_busy))
+    print('%-28s %10.1f %%' % ('KeyScanner (' + str(len(paths)) + ' devices)', usage_select))
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    num_devices = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    print('Idle CPU usage while waiting', duration, 's for a button press (% of one core)')
+    if len(sys.argv) > 3:
+        run(sys.argv[3:], [], duration)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths, writers = create_fake_devices(directory, num_devices)
+        run(paths, writers, duration)
+        for writer in writers:
+            os.close(writer)
+
+
+if __name__ == '__main__':
+    main()
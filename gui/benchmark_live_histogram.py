@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Measures the cost of the live histogram on page three for different kinds of measurements: the time to count one
+# measurement (including the occasional re-binning), the number of re-binnings and the time of a snapshot, which is
+# taken once per frame. For comparison, the time of a histogram of all measurements computed from scratch per frame.
+#
+# usage: python benchmark_live_histogram.py
+
+import time
+
+import numpy as np
+
+import LatencyStats
+
+
+class Constants:
+    SAMPLE_COUNTS = [1000, 100000]
+    NUM_SNAPSHOTS = 1000
+
+
+def create_streams(random, num_samples):
+    half = num_samples // 2
+    return {
+        'unimodal': random.gamma(4, 0.5, num_samples) + 2,
+        'bimodal': np.where(random.random(num_samples) < 0.8, random.normal(3, 0.3, num_samples),
+                            random.normal(6, 0.3, num_samples)),
+        'drift': np.concatenate([random.gamma(4, 0.5, half) + 2, random.gamma(4, 0.5, num_samples - half) + 6]),
+        'outliers': np.where(random.random(num_samples) < 0.005, 500.0, random.gamma(4, 0.5, num_samples) + 2)
+    }
+
+
+def main():
+    random = np.random.default_rng(0)
+    print('%-10s %8s %14s %8s %14s %18s' % ('stream', 'n', 'add (ns)', 'rebins', 'snapshot (µs)',
+                                            'np.histogram (µs)'))
+    for num_samples in Constants.SAMPLE_COUNTS:
+        for name, values in create_streams(random, num_samples).items():
+            values = values.tolist()  # The measurement thread gets Python floats
+            histogram = LatencyStats.StreamingHistogram()
+            start = time.perf_counter()
+            for value in values:
+                histogram.add(value)
+            add_time = (time.perf_counter() - start) / num_samples
+
+            start = time.perf_counter()
+            for _ in range(Constants.NUM_SNAPSHOTS):
+                histogram.snapshot()
+            snapshot_time = (time.perf_counter() - start) / Constants.NUM_SNAPSHOTS
+
+            all_values = np.asarray(values)
+            start = time.perf_counter()
+            for _ in range(Constants.NUM_SNAPSHOTS):
+                np.histogram(all_values, LatencyStats.Constants.HISTOGRAM_BINS)
+            naive_time = (time.perf_counter() - start) / Constants.NUM_SNAPSHOTS
+
+            print('%-10s %8d %14.0f %8d %14.1f %18.1f' % (name, num_samples, add_time * 1e9, histogram.num_rebins,
+                                                          snapshot_time * 1e6, naive_time * 1e6))
+
+
+if __name__ == '__main__':
+    main()
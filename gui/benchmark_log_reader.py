@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compares the old line-by-line parser of DataPlotter with the streaming reader in LogFile.py and with loading the
+# binary companion (.lbx) of the log. File sizes of the .csv log and the companion are reported as well.
+#
+# usage: python benchmark_log_reader.py [max number of rows (default: 10000000)]
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+import LogFile
+
+
+class Constants:
+    ROW_COUNTS = [1000, 10000, 100000, 1000000, 10000000]
+    NUM_RUNS = 3  # The best of NUM_RUNS runs is reported
+
+
+# Write a log with the same layout as logAutoModeData in fileLog.c
+def write_synthetic_log(file_path, num_rows):
+    with open(file_path, 'w') as file:
+        file.write('#Device:;Benchmark Mouse\n#Button:;272\n#minDelay:;100\n#maxDelay:;10000\n')
+        file.write('#iterations:;' + str(num_rows) + '\n')
+        file.write('\ncounter;latency;delayTime\n')
+
+        rows = []
+        for i in range(num_rows):
+            rows.append('%d;%d;%d\n' % (i, random.randint(1000, 20000), random.randint(100, 10000)))
+            if len(rows) == 100000:
+                file.writelines(rows)
+                rows = []
+        file.writelines(rows)
+
+
+# The parser DataPlotter used before LogFile.read_log existed
+def read_log_line_by_line(file_path):
+    current_file = open(file_path, 'r').readlines()
+    measurement_rows = []
+
+    for i in range(len(current_file)):
+        if current_file[i] == 'counter;latency;delayTime\n':
+            measurement_rows = current_file[i + 1:len(current_file)]
+            break
+
+    latencies = []
+    for i in range(len(measurement_rows)):
+        row_values = measurement_rows[i].split(';')
+        latencies.append(float(row_values[1]) / 1000)
+
+    return latencies
+
+
+# Load a log from its binary companion and touch all latencies, so the memory-mapped data is actually read
+def read_companion(file_path):
+    return LogFile.read_companion(file_path).latencies_ms().sum()
+
+
+def measure(function, file_path):
+    best = float('inf')
+    for _ in range(Constants.NUM_RUNS):
+        start = time.perf_counter()
+        function(file_path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    max_rows = int(sys.argv[1]) if len(sys.argv) > 1 else Constants.ROW_COUNTS[-1]
+
+    print('%10s %14s %14s %14s %9s %12s %12s' % ('rows', 'line loop (s)', 'streaming (s)', 'companion (s)',
+                                                  'speed-up', 'csv (MB)', 'lbx (MB)'))
+    with tempfile.TemporaryDirectory() as directory:
+        for num_rows in Constants.ROW_COUNTS:
+            if num_rows > max_rows:
+                break
+
+            file_path = os.path.join(directory, 'AUTO_benchmark_' + str(num_rows) + '.csv')
+            write_synthetic_log(file_path, num_rows)
+
+            time_old = measure(read_log_line_by_line, file_path)
+            time_new = measure(LogFile.read_log, file_path)
+
+            LogFile.write_companion(LogFile.read_log(file_path))
+            time_companion = measure(read_companion, file_path)
+
+            companion_path = LogFile.get_companion_path(file_path)
+            print('%10d %14.4f %14.4f %14.4f %8.1fx %12.2f %12.2f' % (
+                num_rows, time_old, time_new, time_companion, time_old / time_companion,
+                os.path.getsize(file_path) / 1e6, os.path.getsize(companion_path) / 1e6))
+
+            os.remove(file_path)
+            os.remove(companion_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compares the time until page four can show the plot: the full plot at 300 DPI (which the GUI used to scale down),
+# the preview at display resolution, and both again from the cache. Also reports the size of the images in pixels.
+#
+# usage: python benchmark_plot_cache.py
+
+import os
+import struct
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import PlotEngine
+
+
+class Constants:
+    POINT_COUNTS = [300, 3000, 30000]
+
+
+# Width and height of a PNG from its IHDR chunk
+def get_png_size(path):
+    with open(path, 'rb') as file:
+        header = file.read(24)
+    return struct.unpack('>II', header[16:24])
+
+
+def measure(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    random = np.random.default_rng(0)
+    if not PlotEngine.import_modules():
+        sys.exit('Pyplot and/or Seaborn not installed')
+
+    print('%8s %12s %12s %12s %12s %12s %12s' % ('n', 'full (s)', 'size', 'preview (s)', 'size', 'cached (s)',
+                                                 'svg (s)'))
+    with tempfile.TemporaryDirectory() as directory:
+        for num_points in Constants.POINT_COUNTS:
+            log_path = os.path.join(directory, 'AUTO_benchmark_%d_1ms_1.csv' % num_points)
+            latencies = random.gamma(4, 1.5, num_points) + 2
+
+            full_path = log_path.replace('.csv', '.png')
+            full_time, _ = measure(lambda: PlotEngine.render_cached(full_path, latencies))
+            preview_time, preview_path = measure(lambda: PlotEngine.render_preview(log_path, latencies))
+            svg_time, _ = measure(lambda: PlotEngine.render_cached(log_path.replace('.csv', '.svg'), latencies))
+            cached_time, _ = measure(lambda: (PlotEngine.render_preview(log_path, latencies),
+                                              PlotEngine.render_cached(full_path, latencies)))
+
+            print('%8d %12.3f %12s %12.3f %12s %12.4f %12.3f' % (
+                num_points, full_time, '%dx%d' % get_png_size(full_path), preview_time,
+                '%dx%d' % get_png_size(preview_path), cached_time, svg_time))
+
+
+if __name__ == '__main__':
+    main()
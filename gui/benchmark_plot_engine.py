@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Measures the render time of every kind of plot in PlotEngine for a growing number of measurements
+#
+# usage: python benchmark_plot_engine.py [max number of points (default: 100000)]
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import PlotEngine
+
+
+class Constants:
+    POINT_COUNTS = [100, 300, 1000, 3000, 10000, 30000, 100000]
+    MAX_POINTS_SWARM = 3000  # Larger swarm plots take minutes and are skipped
+
+
+def main():
+    max_points = int(sys.argv[1]) if len(sys.argv) > 1 else Constants.POINT_COUNTS[-1]
+    random = np.random.default_rng(0)
+
+    if not PlotEngine.import_modules():
+        sys.exit('Pyplot and/or Seaborn not installed')
+
+    print('%8s' % 'n' + ''.join('%14s' % (mode + ' (s)') for mode in PlotEngine.Constants.MODES) + '%14s' % 'auto')
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, 'benchmark.png')
+
+        for num_points in Constants.POINT_COUNTS:
+            if num_points > max_points:
+                break
+
+            latencies = random.gamma(4, 1.5, num_points) + 2
+            line = '%8d' % num_points
+            for mode in PlotEngine.Constants.MODES:
+                if mode == PlotEngine.Constants.MODE_SWARM and num_points > Constants.MAX_POINTS_SWARM:
+                    line += '%14s' % '-'
+                    continue
+                start = time.perf_counter()
+                PlotEngine.render(output_path, latencies, mode)
+                line += '%14.3f' % (time.perf_counter() - start)
+
+            line += '%14s' % PlotEngine.choose_mode(num_points)
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Runs PollingAnalysis on synthetic logs with a known polling period, phase and fixed latency and reports how well they
+# are recovered and how long the analysis takes. The delays are distributed like createDelayList in the C tool.
+#
+# usage: python benchmark_polling_analysis.py [number of measurements (default: 100000)]
+
+import sys
+import time
+
+import LogFile
+import PollingAnalysis
+
+
+class Constants:
+    MIN_DELAY = 100  # in µs, like -tmin and -tmax of the C tool
+    MAX_DELAY = 10000
+    PERIODS = [125, 1000, 4000, 8000]  # Polling periods of the synthetic devices in µs
+    FIXED_LATENCY = 3000  # Mean fixed latency of the synthetic devices in µs
+    FIXED_JITTER = 300  # Standard deviation of the fixed latency in µs
+
+
+def create_log(random, num_samples, period):
+    import numpy as np
+
+    delays = np.linspace(Constants.MIN_DELAY, Constants.MAX_DELAY, num_samples).astype(np.int64)
+    random.shuffle(delays)
+    phase = random.uniform(0, period)
+    fixed = random.normal(Constants.FIXED_LATENCY, Constants.FIXED_JITTER, num_samples)
+    latencies = np.round(fixed + np.mod(phase - delays, period)).astype(np.int64)
+    log = LogFile.LagBoxLog('AUTO_synthetic_0ms_1.csv', {}, np.arange(num_samples), latencies, delays)
+    return log, phase
+
+
+def main():
+    import numpy as np
+
+    num_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    random = np.random.default_rng(0)
+
+    print('Measurements:', num_samples, '(all values in µs)')
+    print('%8s %10s %8s %10s %10s %10s %10s' % ('period', 'estimated', 'phase', 'estimated', 'fixed', 'explained',
+                                                'time (s)'))
+    for period in Constants.PERIODS:
+        log, phase = create_log(random, num_samples, period)
+
+        start = time.perf_counter()
+        result = PollingAnalysis.analyse(log)
+        duration = time.perf_counter() - start
+
+        print('%8d %10.1f %8.1f %10.1f %10.1f %9.1f%% %10.3f' % (period, result['period'], phase, result['phase'],
+                                                                 result['fixedMean'],
+                                                                 result['explainedVariance'] * 100, duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Feeds a synthetic progress stream (like inputLatencyMeasureTool with -json 1, or the old text output) through a pipe
+# into ProgressProtocol.ProgressReader and checks that every sample is decoded while the GUI is only updated once per
+# frame. Reports the number of GUI updates and the CPU time used for reading.
+#
+# usage: python benchmark_progress_protocol.py [lines per second (default: 10000)] [duration in s (default: 3)]
+
+import os
+import subprocess
+import sys
+import time
+
+import ProgressProtocol
+
+
+class Constants:
+    WRITER_ARGUMENT = '--write'  # Runs the writer of the synthetic stream in this process
+    FORMATS = ['json', 'text']
+    BATCH_INTERVAL = 0.001  # The writer catches up with its schedule every BATCH_INTERVAL s
+
+
+# Runs in the child process: write num_lines samples at the given rate, then the log path and "done"
+def write_stream(output_format, lines_per_second, num_lines):
+    start = time.perf_counter()
+    output = sys.stdout
+    i = 0
+    while i < num_lines:
+        due = min(num_lines, int((time.perf_counter() - start) * lines_per_second) + 1)
+        while i < due:
+            i += 1
+            if output_format == 'json':
+                output.write('{"type":"sample","i":%d,"n":%d,"latency_us":%d,"delay_us":%d}\n' %
+                             (i, num_lines, 1000 + i % 9000, 100 + i % 9900))
+            else:
+                output.write('%d,%d,%f\n' % (i, num_lines, (1000 + i % 9000) / 1000))
+        output.flush()
+        time.sleep(Constants.BATCH_INTERVAL)
+
+    if output_format == 'json':
+        output.write('{"type":"log","path":"../log/AUTO_benchmark_1ms_1.csv"}\n{"type":"done","device":"benchmark"}\n')
+    else:
+        output.write('../log/AUTO_benchmark_1ms_1.csv\nbenchmark\ndone\n')
+    output.flush()
+
+
+def run(output_format, lines_per_second, duration):
+    num_lines = int(lines_per_second * duration)
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), Constants.WRITER_ARGUMENT, output_format,
+                                str(lines_per_second), str(num_lines)], stdout=subprocess.PIPE)
+
+    samples = []
+    updates = []
+    records = []
+
+    def on_record(record):
+        records.append(record['type'])
+        if record['type'] == ProgressProtocol.Constants.TYPE_SAMPLE:
+            samples.append(record['i'])
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    ProgressProtocol.ProgressReader(process.stdout.fileno()).run(on_record, lambda sample: updates.append(sample['i']))
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    process.wait()
+
+    if samples != list(range(1, num_lines + 1)):
+        sys.exit(output_format + ': samples were lost or reordered')
+    if updates[-1] != num_lines or 'log' not in records or records[-1] != 'done':
+        sys.exit(output_format + ': the end of the stream was not reported correctly')
+
+    print('%-6s %10d %10d %12.1f %12.3f %10.1f %%' % (output_format, num_lines, len(updates), len(updates) / wall_time,
+                                                      cpu_time, cpu_time / wall_time * 100))
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == Constants.WRITER_ARGUMENT:
+        write_stream(sys.argv[2], float(sys.argv[3]), int(sys.argv[4]))
+        return
+
+    lines_per_second = float(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    print('%-6s %10s %10s %12s %12s %12s' % ('format', 'samples', 'updates', 'updates/s', 'cpu (s)', 'cpu'))
+    for output_format in Constants.FORMATS:
+        run(output_format, lines_per_second, duration)
+
+
+if __name__ == '__main__':
+    main()
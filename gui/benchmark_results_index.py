@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Fills a ResultsIndex in a temporary directory and times the import and typical queries.
+# A part of the runs is written as real logs and imported from the directory, the rest is inserted directly, so the
+# index reaches tens of thousands of runs in reasonable time.
+#
+# usage: python benchmark_results_index.py [number of runs (default: 20000)] [number of logs (default: 500)]
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+import ResultsIndex
+
+
+class Constants:
+    SAMPLES_PER_LOG = 1000
+    SAMPLES_PER_RUN = 100  # Runs that are inserted directly get fewer samples to keep the benchmark short
+    DEVICE_TYPES = [1, 2, 3]
+    POLLING_RATES = [0, 1, 2, 4, 8]  # usbhid.mousepoll in the file name
+    QUERIES = [
+        ('mice at 1000 Hz, median < 5 ms', {'deviceType': 2, 'pollingInterval': 1.0}, {'median': 5.0}, {}),
+        ('all runs with p99 < 6 ms', {}, {'p99': 6.0}, {}),
+        ('keyboards, at least 1000 samples', {'deviceType': 3}, {}, {'n': 1000}),
+        ('one vendor and product', {'vendorId': '046d', 'productId': 'c084'}, {}, {})
+    ]
+
+
+def create_latencies(rng, num_samples):
+    offset = rng.uniform(2000, 8000)
+    return [round(offset + rng.gammavariate(2.0, 500)) for _ in range(num_samples)]
+
+
+def write_log(directory, rng, number):
+    device_type = rng.choice(Constants.DEVICE_TYPES)
+    path = os.path.join(directory, 'AUTO_device%d_%dms_%d.csv' % (number % 100, rng.choice(Constants.POLLING_RATES),
+                                                                    number))
+    with open(path, 'w') as file:
+        file.write('#Device:;device%d\n#Button:;272\n#vendorId:;046d\n#productId:;c%03x\n#bInterval:;%d\n'
+                   '#deviceType:;%d\n#deviceSpeed:;12M\n\ncounter;latency;delayTime\n' % (
+                       number % 100, number % 200, rng.choice([1, 2, 4, 8, 10]), device_type))
+        for i, latency in enumerate(create_latencies(rng, Constants.SAMPLES_PER_LOG)):
+            file.write('%d;%d;%d\n' % (i, latency, rng.randint(100, 10000)))
+
+
+def insert_runs(index, rng, num_runs):
+    for start in range(0, num_runs, ResultsIndex.Constants.INSERT_BATCH_SIZE):
+        with index.connection:
+            for number in range(start, min(num_runs, start + ResultsIndex.Constants.INSERT_BATCH_SIZE)):
+                latencies = create_latencies(rng, Constants.SAMPLES_PER_RUN)
+                polling_interval = float(rng.choice([1, 2, 4, 8, 10]))
+                row = {'path': '/synthetic/AUTO_run_%d.csv' % number, 'file': 'AUTO_run_%d.csv' % number,
+                       'device': 'device%d' % (number % 500), 'vendorId': '046d', 'productId': 'c%03x' % (number % 300),
+                       'pollingInterval': polling_interval, 'deviceType': rng.choice(Constants.DEVICE_TYPES)}
+                row.update(ResultsIndex.LatencyStats.summarize([latency / 1000 for latency in latencies]))
+                index.insert(row, list(range(len(latencies))), latencies, [0] * len(latencies))
+
+
+def main():
+    num_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    num_logs = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for number in range(num_logs):
+            write_log(directory, rng, number)
+
+        index = ResultsIndex.ResultsIndex(os.path.join(directory, 'results.sqlite'))
+        try:
+            start = time.perf_counter()
+            index.import_directory(directory)
+            print('Import of %d logs with %d samples: %.2f s' % (num_logs, Constants.SAMPLES_PER_LOG,
+                                                                 time.perf_counter() - start))
+
+            start = time.perf_counter()
+            index.import_directory(directory)
+            print('Second import (nothing changed): %.3f s' % (time.perf_counter() - start))
+
+            start = time.perf_counter()
+            insert_runs(index, rng, max(0, num_runs - num_logs))
+            print('Insert of %d runs with %d samples: %.2f s' % (max(0, num_runs - num_logs),
+                                                                 Constants.SAMPLES_PER_RUN,
+                                                                 time.perf_counter() - start))
+
+            for name, equal, maxima, minima in Constants.QUERIES:
+                start = time.perf_counter()
+                runs = index.query(equal, maxima, minima)
+                print('%-40s %6d runs %8.2f ms' % (name, len(runs), (time.perf_counter() - start) * 1000))
+
+            start = time.perf_counter()
+            latencies = index.get_latencies(runs[0]['id'] if len(runs) > 0 else 1)
+            print('%-40s %6d samples %5.2f ms' % ('latencies of one run', len(latencies),
+                                                 (time.perf_counter() - start) * 1000))
+        finally:
+            index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Measures the cold start of the LagBox GUI: the import time of every heavy module and the time until the first window
+# of latency_gui.py is shown. Every measurement runs in a fresh interpreter, so nothing is cached between them.
+#
+# usage: python benchmark_startup.py [number of runs (default: 3)]
+
+import os
+import subprocess
+import sys
+import time
+
+
+class Constants:
+    MODULES = ['PyQt5.QtWidgets', 'evdev', 'requests', 'numpy', 'matplotlib.pyplot', 'seaborn', 'LogFile',
+               'LatencyStats', 'PlotEngine', 'DataPlotter', 'latency_gui']
+    FIRST_WINDOW_ARGUMENT = '--first-window'  # Runs the measurement of the time to the first window in this process
+
+
+def run_python(code):
+    output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        return float(output.stdout.decode('utf-8').strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return None
+
+
+# Time needed to import a module (including all modules it imports itself) in a fresh interpreter
+def measure_import(module):
+    return run_python('import time\n'
+                      'start = time.perf_counter()\n'
+                      'import ' + module + '\n'
+                      'print(time.perf_counter() - start)')
+
+
+# Time from the start of the interpreter until the first window is shown, measured in a fresh interpreter
+def measure_first_window():
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), Constants.FIRST_WINDOW_ARGUMENT],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if output.returncode != 0:
+        return None
+    return time.perf_counter() - start
+
+
+# Runs in the child process: create the GUI and quit as soon as the event loop has shown the window
+def show_first_window():
+    from PyQt5 import QtWidgets
+    from PyQt5.QtCore import QTimer
+    import latency_gui
+
+    app = QtWidgets.QApplication(sys.argv)
+    gui = latency_gui.LatencyGUI()
+    QTimer.singleShot(0, app.quit)
+    app.exec_()
+    gui.plot_renderer.shutdown()
+
+
+def format_time(seconds):
+    return '%8.3f' % seconds if seconds is not None else '%8s' % 'n/a'
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == Constants.FIRST_WINDOW_ARGUMENT:
+        show_first_window()
+        return
+
+    num_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    print('%-20s %8s' % ('import', 'time (s)'))
+    for module in Constants.MODULES:
+        times = [measure_import(module) for _ in range(num_runs)]
+        times = [t for t in times if t is not None]
+        print('%-20s %s' % (module, format_time(min(times) if len(times) > 0 else None)))
+
+    times = [measure_first_window() for _ in range(num_runs)]
+    times = [t for t in times if t is not None]
+    print('%-20s %s' % ('time to first window', format_time(min(times) if len(times) > 0 else None)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Simulates parallel measurements to check that spacing their triggers does not bias the latencies. Every device polls
+# with a fixed period and phase, and the time from a trigger to the next poll (the polling wait) is part of every
+# measured latency. Its mean for each device is compared between:
+#   none   every device on its own, triggered right after its random delay (the reference)
+#   table  MeasurementEngine.find_trigger_time: the trigger happens after its random delay and is only moved when it is
+#          within a frame of another trigger (what MeasurementEngine does)
+# The reference is not exactly half the polling period: the random delays are not a multiple of the period, so the
+# trigger times are not evenly spread over it. Spacing must not add to this, i.e. table has to match none.
+# Also reports the smallest distance between triggers of different devices, which has to be at least a frame.
+#
+# usage: python benchmark_trigger_spacing.py [--samples 20000]
+
+import argparse
+import heapq
+import random
+
+import MeasurementEngine
+
+
+class Constants:
+    POLLING_PERIODS = [[8, 8], [4, 8], [8, 8, 8, 8], [4, 4, 8, 8]]  # in ms, one list per simulated group of devices
+    DEVICE_LATENCY = 1000000  # Time from the poll to the input event in ns
+    MIN_DELAY = 100000  # Random delay before a trigger in ns, like -tmin and -tmax
+    MAX_DELAY = 10000000
+    MS = 1000000
+
+
+def simulate(rng, periods, method, num_samples):
+    periods = [period * Constants.MS for period in periods]
+    phases = [rng.randrange(period) for period in periods]
+    waits = [[] for _ in periods]
+    recent = []  # (trigger time, device) of the latest triggers
+    requests = [(rng.randrange(Constants.MIN_DELAY, Constants.MAX_DELAY), device) for device in range(len(periods))]
+    heapq.heapify(requests)
+    min_distance = None
+
+    while min(len(device_waits) for device_waits in waits) < num_samples:
+        now, device = heapq.heappop(requests)
+        if method == 'none':
+            trigger_time = now
+        else:
+            trigger_time = MeasurementEngine.find_trigger_time(
+                now, [time for time, _ in recent[-MeasurementEngine.Constants.NUM_RECENT_TRIGGERS:]])
+
+        for other_time, other_device in recent[-MeasurementEngine.Constants.NUM_RECENT_TRIGGERS:]:
+            if other_device != device and method != 'none':
+                distance = abs(trigger_time - other_time)
+                min_distance = distance if min_distance is None else min(min_distance, distance)
+        recent.append((trigger_time, device))
+
+        period = periods[device]
+        poll_time = phases[device] + -(-(trigger_time - phases[device]) // period) * period
+        waits[device].append(poll_time - trigger_time)
+
+        # Event, release (seen at a later poll) and the random delay before the next trigger
+        next_request = poll_time + Constants.DEVICE_LATENCY + period + rng.randrange(Constants.MIN_DELAY,
+                                                                                     Constants.MAX_DELAY)
+        heapq.heappush(requests, (next_request, device))
+
+    means = [sum(device_waits) / len(device_waits) / Constants.MS for device_waits in waits]
+    return means, None if min_distance is None else min_distance / Constants.MS
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=20000, help='samples per device')
+    args = parser.parse_args()
+
+    print('mean polling wait per device in ms')
+    for seed, periods in enumerate(Constants.POLLING_PERIODS):
+        print('polling periods %s ms' % periods)
+        for method in ['none', 'table']:
+            means, min_distance = simulate(random.Random(seed), periods, method, args.samples)  # Same device phases
+            distance = '' if min_distance is None else 'smallest distance between devices %.2f ms' % min_distance
+            print('  %-6s %-28s %s' % (method, ' '.join('%.2f' % mean for mean in means), distance))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,48 +4,67 @@
 from PyQt5 import QtWidgets, uic
 from PyQt5.QtGui import QIcon, QPixmap, QIcon
 from PyQt5.QtWidgets import QApplication, qApp
-from PyQt5.QtCore import QTimer, Qt, QEvent, pyqtSignal, pyqtSlot, QThread
+from PyQt5.QtCore import QTimer, Qt, QEvent, pyqtSignal, pyqtSlot, QThread, QFileSystemWatcher
 
 import sys
-from subprocess import Popen, PIPE, STDOUT
 import struct
-import evdev
 import os
-import csv
-from datetime import datetime
-import requests
+import time
 import threading
 import configparser
-
-import DataPlotter  # Accepts a .csv file of a LagBox measurement and returns a dataplot and statistical data
-
-import RPi.GPIO as GPIO
+import importlib
+
+# requests, numpy and DataPlotter (which accepts a .csv file of a LagBox measurement and returns a dataplot and
+# statistical data) are slow to import. They are loaded in the background after startup (see warm_up_modules)
+import DeviceInventory  # Detects the connected input devices
+import KeyScanner  # Waits for the button press on page two without polling
+import LatencyStats  # Statistics that are updated live during the measurement
+import LogFile  # Updates the metadata in the header of the log
+import MeasurementWorkflow  # Runs the measurement tool and enriches the log, shared with CampaignRunner.py
+import PlotEngine  # Renders the plot of the measurement in a worker process
+import ResultsIndex  # SQLite index of all measurements for queries across runs
+import Tracing  # Times the phases of a run if LAGBOX_TRACE=1 is set
+import UploadService  # Uploads the logs in the background and keeps pending uploads in a queue on disk
+import UsbDescriptors  # Reads the bInterval of the device from its USB descriptors
+
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    GPIO = None  # Not running on a Raspberry Pi. Measurements are simulated (see Simulator.py)
 
 
 class Constants:
     UI_FILE = 'latency_gui_800x480.ui'
     DEVICE_TYPES = ['Gamepad', 'Mouse', 'Keyboard']
-    DEVICE_TYPE_IDS = {'Gamepad': 1, 'Mouse': 2, 'Keyboard': 3}
     WINDOW_TITLE = 'LagBox'
     BUTTON_NEXT_DEFAULT_NAME = 'Next >'
     BUTTON_CANCEL_DEFAULT_NAME = 'Cancel'
 
-    # (0 = stepper mode, 1 = stepper latency test mode, 2 = stepper reset mode,
-    # 3 = auto mode, 4 = pressure sensor test mode)
-    MODE = 3
-    NUM_TEST_ITERATIONS = 1000
+    EARLY_STOP_MIN_SAMPLES = 200  # Minimum number of measurements before the measurement may stop early
     NUM_DISPLAYED_DECIMAL_PLACES = 1  # Number of decimal places displayed of the current measurement in ms
+    ABORT_REASON = 'Aborted by the operator'  # Saved as stopReason in the log of an aborted measurement
+
+    MEASUREMENT_TOOL = 'c'  # Key of MeasurementWorkflow.Constants.MEASUREMENT_TOOLS
+    GPIO_BACKEND = 'rpi'  # Used by MeasurementEngine.py ('rpi' or 'simulator')
 
-    # URL to the server where .csv files of measurement data should get uploaded
-    SERVER_URL = 'https://hci.ur.de/projects/latency/upload'
+    CONNECTION_TEST_INTERVAL = 5000  # Time between two tests of the connection to the upload server in ms
 
     TEXT_INPUT_MAX_CHARS = 64  # Max number of chars of the input fields
 
     GPIO_PIN_ID = 7  # ID of the GPIO Pin where the optocoupler is connected to the Raspberry Pi
 
+    # Time to wait after a change in /dev/input before rescanning the devices. When a device is plugged in, several
+    # nodes are created one after another
+    HOTPLUG_RESCAN_DELAY = 500  # in ms
+
 
 class LatencyGUI(QtWidgets.QWizard):
 
+    plot_finished = pyqtSignal(object)  # Future of the plot rendered by the PlotRenderer
+    modules_checked = pyqtSignal('QString')  # Missing modules found by warm_up_modules (empty if all are installed)
+    connection_checked = pyqtSignal(object)  # Future of the connection test of the UploadService
+    upload_finished = pyqtSignal(object)  # Future of the uploads sent by the UploadService
+
     device_objects = []  # Temporary storage for info about all detected input devices
     device_id = -1  # ID of the currently connected device
     device_type = 2
@@ -55,6 +74,7 @@ class LatencyGUI(QtWidgets.QWizard):
     product_id = ''  # Product ID of the device
     ean_upc = ''  # EAN (European Article Number) / UPC (Universal Product code)
     device_speed = ''
+    device_sysfs_path = ''  # Path of the input device in sysfs. Used to find the USB interface under test
 
     output_file_path = ''  # File path and name of the created .csv file
     stats = ''  # Stats about the data of the current measurement (Mean, Median, Min, Max, Standard Deviation)
@@ -64,18 +84,31 @@ class LatencyGUI(QtWidgets.QWizard):
     email = ''  # Optional field for storing the email adress of the person who conducted the measurement
     additional_notes = ''  # Optional fields for storing additional notes about the current measurement
 
-    # Flag if the system is currently scanning for key inputs (for determining the pressed button)
-    scan_for_key_inputs = True
+    key_scan_thread = None  # Thread waiting for the button press on page two (for determining the pressed button)
     is_measurement_running = False  # Is the LagBox measurement currently running?
+    is_measurement_aborted = False  # Has the operator aborted the running measurement?
+    measurement_thread = None  # Thread running the LagBox measurement
+    connection_test = None  # Future of the connection test that is currently running
 
     def __init__(self):
         super().__init__()
+        if GPIO is None:
+            print('RPi.GPIO not available, using the simulator (start it with: python Simulator.py)')
+            Constants.MEASUREMENT_TOOL = 'python'
+            Constants.GPIO_BACKEND = 'simulator'
+        self.plot_renderer = PlotEngine.PlotRenderer()
+        self.device_inventory = DeviceInventory.DeviceInventory()
+        self.usb_descriptor_reader = UsbDescriptors.UsbDescriptorReader()
+        self.upload_service = UploadService.UploadService()
         self.reset_gpio_pins()
         self.init_ui()
+        self.upload_pending_measurements()
 
     # Make sure that the GPIO pin where the raspberry Pi is connected to the optocoupler is set to LOW on startup
     # Otherwise this could cause unwanted button presses.
     def reset_gpio_pins(self):
+        if GPIO is None:
+            return
         GPIO.setmode(GPIO.BCM)
         GPIO.setup(Constants.GPIO_PIN_ID, GPIO.OUT)
         GPIO.output(Constants.GPIO_PIN_ID, GPIO.LOW)
@@ -91,9 +124,33 @@ class LatencyGUI(QtWidgets.QWizard):
         # The "Back" button needs to be disabled for each page separately
         self.currentIdChanged.connect(self.disable_back)
 
+        self.plot_finished.connect(self.on_plot_finished)
+        self.modules_checked.connect(self.on_modules_checked)
+        self.connection_checked.connect(self.on_connection_checked)
+        self.upload_finished.connect(self.on_upload_finished)
+        self.ui.button_abort_measurement.clicked.connect(self.abort_measurement)
+        self.ui.button_restart_measurement.clicked.connect(self.listen_for_key_inputs)
+
+        # Rescan the connected devices whenever an input device is plugged in or removed
+        self.timer_hotplug_rescan = QTimer(self)
+        self.timer_hotplug_rescan.setSingleShot(True)
+        self.timer_hotplug_rescan.timeout.connect(self.on_input_devices_changed)
+        self.input_device_watcher = QFileSystemWatcher([DeviceInventory.Constants.INPUT_DEVICE_DIRECTORY], self)
+        self.input_device_watcher.directoryChanged.connect(
+            lambda: self.timer_hotplug_rescan.start(Constants.HOTPLUG_RESCAN_DELAY))
+
+        # Tests the connection to the upload server while the upload form (page seven) is shown
+        self.timer_test_connection = QTimer(self)
+        self.timer_test_connection.timeout.connect(self.test_connection)
+
         self.init_ui_page_one()
         self.show()
 
+    # Called when the wizard is closed (finished, cancelled or with the close button of the window)
+    def done(self, result):
+        self.timer_test_connection.stop()
+        QtWidgets.QWizard.done(self, result)
+
     # Disable the "Back Button" on all pages where it is not needed
     def disable_back(self):
         # Only show an back button on page 2 (ID 1)
@@ -129,19 +186,37 @@ class LatencyGUI(QtWidgets.QWizard):
         self.check_installed_modules()
         self.get_connected_devices()
 
-    # Check if all necessary modules for visualizing the data are installed
+    # Check if all necessary modules for visualizing the data are installed.
+    # The check runs in the background, so the window shows up without waiting for the imports.
     def check_installed_modules(self):
-        try:
-            import numpy as np
-            from matplotlib import pyplot as plt
-            import seaborn as sns
-        except ImportError as e:
-            print('Missing modules:', e)
+        thread_warm_up = threading.Thread(target=self.warm_up_modules, daemon=True)
+        thread_warm_up.start()
+
+    # Import all modules that are needed after the measurement while the user is still on page one and two.
+    # matplotlib and seaborn are only needed by the worker process that renders the plots, so they are imported there.
+    def warm_up_modules(self):
+        missing_modules = []
+        for module in ['numpy', 'requests', 'DataPlotter']:
+            try:
+                importlib.import_module(module)
+            except ImportError as e:
+                missing_modules.append(str(e))
+
+        if not self.plot_renderer.warm_up().result():
+            missing_modules.append('matplotlib and/or seaborn')
+
+        self.modules_checked.emit(', '.join(missing_modules))
+
+    @pyqtSlot('QString')
+    def on_modules_checked(self, missing_modules):
+        if len(missing_modules) > 0:
+            print('Missing modules:', missing_modules)
             self.ui.label_hint_missing_modules.setText('Warning: Missing python modules - Visualisaztion of data will '
                                                        'not be possible. Please install numpy, matplotlib and seaborn.')
 
     # When conducting another measurement, all data should get reset
     def reset_all_data(self):
+        Tracing.tracer.reset()  # Every measurement gets its own trace
         self.device_objects = []
         self.device_id = -1
         self.device_type = 2
@@ -150,6 +225,7 @@ class LatencyGUI(QtWidgets.QWizard):
         self.vendor_id = ''
         self.product_id = ''
         self.device_speed = ''
+        self.device_sysfs_path = ''
 
         self.output_file_path = ''
         self.stats = ''
@@ -159,16 +235,18 @@ class LatencyGUI(QtWidgets.QWizard):
         self.email = ''
         self.additional_notes = ''
 
-        self.scan_for_key_inputs = True
+        self.stop_key_scan()
+        self.timer_test_connection.stop()
 
         self.is_measurement_running = False
+        self.is_measurement_aborted = False
+        self.measurement_thread = None
 
     # User interface for page two (Page where the detection of the input button takes place)
     def init_ui_page_two(self):
         self.validate_inputs()
         self.get_device_bInterval()
 
-        self.ui.button_restart_measurement.clicked.connect(self.listen_for_key_inputs)
         try:
             self.ui.button(QtWidgets.QWizard.NextButton).clicked.disconnect(self.init_ui_page_two)
         except TypeError:
@@ -201,42 +279,122 @@ class LatencyGUI(QtWidgets.QWizard):
             self.ui.setButtonText(QtWidgets.QWizard.NextButton, Constants.BUTTON_NEXT_DEFAULT_NAME)
             self.button(QtWidgets.QWizard.NextButton).hide()
 
-            command = '../bin/inputLatencyMeasureTool' + \
-                      ' -m ' + str(Constants.MODE) + \
-                      ' -tmin 100 -tmax 10000' + \
-                      ' -b ' + str(self.button_code) + \
-                      ' -d ' + str(self.device_type) + \
-                      ' -event ' + str(self.device_id).replace('event', '') + \
-                      ' -n ' + str(Constants.NUM_TEST_ITERATIONS) + \
-                      " -name '" + self.device_name + "'"
-
-            thread = LagBoxMeasurement(command)
-            thread.start()
-            thread.finished.connect(self.thread_finished)
-            thread.display_progress.connect(self.display_progress)
-            thread.logpath_arrived.connect(self.on_logpath_arrived)
-
-    @pyqtSlot('QString', 'QString')
-    def display_progress(self, line_id, line):
+            command = MeasurementWorkflow.build_command(Constants.MEASUREMENT_TOOL, self.device_id, self.button_code,
+                                                        self.device_type, self.device_name,
+                                                        MeasurementWorkflow.Constants.NUM_TEST_ITERATIONS,
+                                                        gpio_backend=Constants.GPIO_BACKEND)
+
+            self.ui.label_live_statistics.setText('')
+            self.ui.widget_live_histogram.clear()
+            self.ui.button_abort_measurement.setEnabled(True)
+
+            # With early stopping, the measurement ends as soon as the results are precise enough
+            stop_rule = None
+            if self.ui.checkBox_early_stop.isChecked():
+                stop_rule = LatencyStats.PrecisionStopRule(self.ui.doubleSpinBox_early_stop_target.value(),
+                                                           Constants.EARLY_STOP_MIN_SAMPLES)
+
+            # Keep a reference to the thread, otherwise it could get garbage collected while it is running
+            self.measurement_thread = LagBoxMeasurement(command, stop_rule, LatencyStats.StreamingHistogram())
+            self.measurement_thread.finished.connect(self.thread_finished)
+            self.measurement_thread.display_progress.connect(self.display_progress)
+            self.measurement_thread.statistics_updated.connect(self.display_live_statistics)
+            self.measurement_thread.histogram_updated.connect(self.ui.widget_live_histogram.set_snapshot)
+            self.measurement_thread.logpath_arrived.connect(self.on_logpath_arrived)
+            self.measurement_thread.measurement_failed.connect(self.on_measurement_failed)
+            self.measurement_thread.stop_requested.connect(self.on_stop_requested)
+            self.measurement_thread.start()
+
+    # Show the latest sample. Called at most once per frame, so not every single sample is displayed
+    @pyqtSlot(object)
+    def display_progress(self, sample):
         self.ui.label_press_button_again.setText('')
-        self.ui.progressBar.setValue((int(line_id) / Constants.NUM_TEST_ITERATIONS) * 100)
-        self.ui.label_progress.setText(str(line_id) + '/' + str(Constants.NUM_TEST_ITERATIONS))
-        measured_time = float(line.split(',')[2].replace("\\n'", ''))
+        self.ui.progressBar.setValue(int(sample['i'] / MeasurementWorkflow.Constants.NUM_TEST_ITERATIONS * 100))
+        self.ui.label_progress.setText(str(sample['i']) + '/' + str(MeasurementWorkflow.Constants.NUM_TEST_ITERATIONS))
+        measured_time = sample['latency_us'] / 1000
         self.ui.label_last_measured_time.setText(
             str(round(measured_time, Constants.NUM_DISPLAYED_DECIMAL_PLACES)) + 'ms')
 
-        if int(line_id) == Constants.NUM_TEST_ITERATIONS:
+        if sample['i'] == MeasurementWorkflow.Constants.NUM_TEST_ITERATIONS:
+            self.ui.button_abort_measurement.setEnabled(False)
             self.ui.label_press_button_again.setText('Measurement finished. Analysing and saving data...')
 
+    # Show the statistics of all measurements so far
+    @pyqtSlot(object)
+    def display_live_statistics(self, summary):
+        text = ''
+        for name, label in [('mean', 'Mean'), ('median', 'Median'), ('std', 'SD'), ('min', 'Min'), ('max', 'Max'),
+                            ('p95', 'P95'), ('p99', 'P99')]:
+            text += '<b>' + label + ':</b> ' + str(round(summary[name], Constants.NUM_DISPLAYED_DECIMAL_PLACES)) + \
+                    'ms '
+        self.ui.label_live_statistics.setText(text)
+
     def thread_finished(self):
         print('Thread finished')
 
     @pyqtSlot('QString')
-    def on_logpath_arrived(self, line):
+    def on_measurement_failed(self, message):
+        print('Measurement failed:', message)
+        self.ui.button_abort_measurement.setEnabled(False)
+        if self.is_measurement_aborted:
+            self.restart_wizard()
+            return
+        self.ui.label_press_button_again.setText('Measurement failed: ' + message)
+
+    @pyqtSlot('QString')
+    def on_stop_requested(self, reason):
+        print('Stopping early:', reason)
+        self.ui.button_abort_measurement.setEnabled(False)
+        self.ui.label_press_button_again.setText('Results are precise enough. Analysing and saving data...')
+
+    # The operator stops a bad run (e.g. the device is not triggered reliably) after looking at the histogram. The tool
+    # ends after the current measurement and writes the log as usual, with the reason in its header
+    def abort_measurement(self):
+        answer = QtWidgets.QMessageBox.question(self, Constants.WINDOW_TITLE, 'Abort the measurement? The measurements '
+                                                'so far are kept in the log, but not analysed or uploaded.')
+        if answer != QtWidgets.QMessageBox.Yes or self.measurement_thread is None:
+            return
+
+        self.ui.button_abort_measurement.setEnabled(False)
+        if self.measurement_thread.abort(Constants.ABORT_REASON):
+            self.is_measurement_aborted = True
+            self.ui.label_press_button_again.setText('Aborting after the current measurement...')
+
+    # Start over on page one. The slots of the navigation buttons of page one and two are disconnected, page one
+    # connects its slots again in init_ui_page_one
+    def restart_wizard(self):
+        # The thread emits its last signal right before run() returns. It has to end before reset_all_data drops the
+        # last reference to it, otherwise the QThread is destroyed while it is still running
+        if self.measurement_thread is not None:
+            self.measurement_thread.wait()
+
+        for signal, slot in [(self.button(QtWidgets.QWizard.NextButton).clicked, self.init_ui_page_two),
+                             (self.button(QtWidgets.QWizard.NextButton).clicked, self.init_ui_page_three),
+                             (self.button(QtWidgets.QWizard.BackButton).clicked, self.on_page_two_back_button_pressed),
+                             (self.ui.button_refresh.clicked, self.get_connected_devices),
+                             (self.ui.comboBox_device.currentIndexChanged, self.on_combobox_device_changed)]:
+            try:
+                signal.disconnect(slot)
+            except TypeError:
+                pass
+        self.init_ui_page_one()
+        QtWidgets.QWizard.restart(self)
+
+    # Called when the measurement is done and the log has been written completely
+    @pyqtSlot('QString')
+    def on_logpath_arrived(self, path):
         print('Logpath arrived')
-        self.output_file_path = str(line).replace("b'", '').replace("\\n'", '')
+        self.output_file_path = path
+        Tracing.tracer.set_log_path(path)
+        self.ui.button_abort_measurement.setEnabled(False)
+
+        if self.is_measurement_aborted:
+            print('Measurement aborted, log kept in', path)
+            QtWidgets.QMessageBox.information(self, Constants.WINDOW_TITLE, 'Measurement aborted. The measurements so '
+                                              'far were saved in ' + path)
+            self.restart_wizard()
+            return
 
-        # TODO: Verify here if measurement was successful
         self.ui.button(QtWidgets.QWizard.NextButton).setEnabled(True)
 
         self.create_data_plot()
@@ -249,11 +407,8 @@ class LatencyGUI(QtWidgets.QWizard):
         self.ui.label_path_name.setText(os.path.dirname(os.path.realpath(__file__)).replace('gui', 'log'))
         self.ui.label_statistics.setText(self.stats)
 
-        try:
-            image = QPixmap(self.output_file_path.replace('.csv', '.png')).scaled(1000, 190, Qt.KeepAspectRatio)
-            self.ui.label_image.setPixmap(image)
-        except Exception as e:
-            print('PLOT IMAGE NOT AVAILABLE!', e)
+        # The plot is still rendered in the background. It is displayed as soon as it is finished (on_plot_finished)
+        self.ui.label_image.setText('Creating plot...')
 
         # Save additional Metadata to csv log
         self.save_additional_information_to_csv(False)
@@ -298,12 +453,11 @@ class LatencyGUI(QtWidgets.QWizard):
 
         self.get_saved_name_email()
 
-        timer_test_connection = QTimer(self)
-        timer_test_connection.timeout.connect(self.test_connection)
-        timer_test_connection.start(5000)
+        self.timer_test_connection.start(Constants.CONNECTION_TEST_INTERVAL)
 
     # User interface for page eight (Page where The user is thanked for its participation)
     def init_ui_page_eight(self):
+        self.timer_test_connection.stop()
         self.button(QtWidgets.QWizard.NextButton).hide()
         self.button(QtWidgets.QWizard.CancelButton).hide()
         self.ui.setButtonText(QtWidgets.QWizard.CancelButton, 'Finish')
@@ -311,7 +465,7 @@ class LatencyGUI(QtWidgets.QWizard):
     # When pressing the back button on page two, we want to keep all previously stored information
     # But the text of the navigation buttons needs to be reverted.
     def on_page_two_back_button_pressed(self):
-        self.scan_for_key_inputs = False
+        self.stop_key_scan()
         self.ui.setButtonText(QtWidgets.QWizard.NextButton, Constants.BUTTON_NEXT_DEFAULT_NAME)
 
         try:
@@ -329,16 +483,31 @@ class LatencyGUI(QtWidgets.QWizard):
         self.init_ui_page_eight()
 
     # Before the user is allowed to upload the current measurement, we need to check if a network connection is
-    # available
+    # available. The test runs in the background and the result is displayed by on_connection_checked
     def test_connection(self):
+        if self.connection_test is not None and not self.connection_test.done():
+            return  # The previous test is still waiting for the server
+
         print('Checking connection...')
+        self.connection_test = self.upload_service.check_connection()
+        self.connection_test.add_done_callback(self.connection_checked.emit)
+
+    @pyqtSlot(object)
+    def on_connection_checked(self, future):
+        if QtWidgets.QWizard.currentId(self) != 6:
+            return  # The user has already left the page with the upload form
+
         try:
-            r = requests.get(Constants.SERVER_URL)
-            r.raise_for_status()
+            is_connected = future.result()
+        except Exception as e:
+            print('Connection test failed:', e)
+            is_connected = False
+
+        if is_connected:
             print('Connection test successful!')
             self.ui.button(QtWidgets.QWizard.NextButton).setEnabled(True)
             self.ui.setButtonText(QtWidgets.QWizard.NextButton, 'Upload Results')
-        except:
+        else:
             print('No connection possible...')
             self.ui.setButtonText(QtWidgets.QWizard.NextButton, 'Waiting for network connection...')
             self.ui.button(QtWidgets.QWizard.NextButton).setEnabled(False)
@@ -387,6 +556,20 @@ class LatencyGUI(QtWidgets.QWizard):
         self.ui.comboBox_device.addItems(devices)
         self.ui.comboBox_device_type.setCurrentIndex(0)
 
+    # Update the list of devices after a hotplug event. The selected device and its (possibly edited) name are kept
+    # if the device is still connected
+    def on_input_devices_changed(self):
+        if QtWidgets.QWizard.currentId(self) != 0:
+            return  # The device can only be selected on page one
+
+        selected_device = self.ui.comboBox_device.currentText()
+        device_name = self.ui.lineEdit_device_name.text()
+        device_names = [device.name for device in self.get_connected_devices()]
+
+        if selected_device in device_names:
+            self.ui.comboBox_device.setCurrentIndex(device_names.index(selected_device))
+            self.ui.lineEdit_device_name.setText(device_name)
+
     # If the user selects a different device in the combobox, all variables will get updated with new data
     def on_combobox_device_changed(self):
         # Copy the name of the device into the text field to allow the user to change the displayed name
@@ -400,10 +583,12 @@ class LatencyGUI(QtWidgets.QWizard):
                 self.vendor_id = device.vendor_id
                 self.product_id = device.product_id
                 self.device_speed = device.device_speed
+                self.device_sysfs_path = device.sysfs_path
 
                 break  # No need to continue after correct device is found
 
     # Detect the button a user pressed in order to get the ID of that button
+    # All connected devices are watched, so the button can also be pressed on a device that was not selected on page one
     def listen_for_key_inputs(self):
         if self.ui.button_restart_measurement.isEnabled():
             self.ui.label_pressed_button_id.setText('')
@@ -411,14 +596,52 @@ class LatencyGUI(QtWidgets.QWizard):
             self.ui.button_restart_measurement.setText('Measuring...')
             self.ui.button_restart_measurement.setEnabled(False)
 
-            self.scan_for_key_inputs = True
-            thread_scan_key_inputs = threading.Thread(target=self.scan_key_inputs)
-            thread_scan_key_inputs.start()
+            # The selected device is watched first, so it wins if buttons on multiple devices are pressed at once
+            device_ids = [self.device_id] + [device.device_id for device in self.device_objects
+                                             if device.device_id != self.device_id]
+
+            self.stop_key_scan()
+            self.key_scan_thread = KeyScanThread(device_ids)
+            self.key_scan_thread.key_pressed.connect(self.on_key_pressed)
+            self.key_scan_thread.start()
+
+    # Cancel the detection of the pressed button if it is still running
+    def stop_key_scan(self):
+        if self.key_scan_thread is not None:
+            self.key_scan_thread.cancel()
+            self.key_scan_thread.wait()  # Returns immediately, the KeyScanner reacts to the cancel within microseconds
+            self.key_scan_thread = None
+
+    @pyqtSlot('QString', int)
+    def on_key_pressed(self, device_id, button_code):
+        if self.sender() is not self.key_scan_thread:
+            return  # The detection has been cancelled in the meantime
+
+        if device_id != self.device_id:
+            self.select_device(device_id)
+
+        self.button_code = button_code
+        self.ui.label_pressed_button_id.setText(str(self.button_code))
+        self.ui.button_restart_measurement.setText('Restart Button Detection')
+        self.ui.button_restart_measurement.setEnabled(True)
+        self.ui.button(QtWidgets.QWizard.NextButton).setEnabled(True)
+
+    # Switch to the device the button was pressed on
+    def select_device(self, device_id):
+        for index, device in enumerate(self.device_objects):
+            if device.device_id == device_id:
+                print('Button pressed on a different device:', device.name)
+                self.ui.comboBox_device.setCurrentIndex(index)  # Updates the IDs of the device
+                self.validate_inputs()
+                self.get_device_bInterval()
+                self.ui.label_selected_device.setText(self.device_name)
+                self.ui.label_selected_device_type.setText(str(self.ui.comboBox_device_type.currentText()))
+                return
 
     def validate_inputs(self):
         self.device_name = self.ui.lineEdit_device_name.text()
         # TODO: Remove all non-allowed chars from device name
-        self.device_type = Constants.DEVICE_TYPE_IDS[str(self.ui.comboBox_device_type.currentText()).replace(' (auto-detected)', '')]
+        self.device_type = MeasurementWorkflow.get_device_type_id(str(self.ui.comboBox_device_type.currentText()))
 
         if len(self.device_name) > Constants.TEXT_INPUT_MAX_CHARS:
             self.device_name = self.device_name[:Constants.TEXT_INPUT_MAX_CHARS]
@@ -428,53 +651,25 @@ class LatencyGUI(QtWidgets.QWizard):
 
     # Get a list of all connected devices of the computer
     def get_connected_devices(self):
-        self.device_objects = []  # Reset list
-        lines = []
-
-        command = 'cat /proc/bus/input/devices'  # Get data about all connected devices
-        process = Popen(command, shell=True, stdin=PIPE, stdout=PIPE, stderr=STDOUT, close_fds=True)
-        empty_lines = 0
-        for line in iter(process.stdout.readline, ''):
-            if len(line) is 0:  # Count all empty lines
-                empty_lines += 1
-                if empty_lines > 3:
-                    # In the list of available devices, between two different devices there are always three blank
-                    # lines. After all devices are listed, only blank lines are printed out. Therefore, if more than
-                    # three blank lines are found, we can stop because we know we reached the end.
-                    break
-            else:
-                empty_lines = 0  # Reset the empty line counter
-                lines.append(line.decode("utf-8").replace('\n', ''))
-
-        devices = []
-
-        current_device = []
-        for i in range(len(lines)):
-            if len(lines[i]) > 0:
-                current_device.append(lines[i])
-            else:
-                devices.append(current_device.copy())
-                current_device.clear()
-
-        self.extract_relevant_devices(devices)
-
-    # Extract the bInterval of the device
+        try:
+            with Tracing.tracer.span('device_scan'):
+                self.device_objects = self.device_inventory.scan()
+        except OSError as e:
+            print('Could not read input devices:', e)
+            self.device_objects = []
+
+        self.init_combobox_device([device.name for device in self.device_objects])
+        return self.device_objects
+
+    # Extract the bInterval of the interrupt endpoint of the device under test from its USB descriptors.
+    # The value is cached by the UsbDescriptorReader, so this is cheap to call multiple times.
     def get_device_bInterval(self):
-        lines = []
-
-        command = 'lsusb -vd ' + self.vendor_id + ':' + self.product_id + ' | grep bInterval'
-        process = Popen(command, shell=True, stdin=PIPE, stdout=PIPE, stderr=STDOUT, close_fds=True)
-        for line in iter(process.stdout.readline, ''):
-            if len(line) is 0:
-                break
-            else:
-                if 'bInterval' in str(line):
-                    lines.append(line.decode("utf-8").replace('\n', '').replace('bInterval', '').strip())
-        print('Values for bInterval of device:')
-        print(lines)
-
-        # TODO: Find correct bInterval value if there are multiple
-        return lines[0]
+        with Tracing.tracer.span('binterval'):
+            b_interval = self.usb_descriptor_reader.get_binterval(self.vendor_id, self.product_id,
+                                                                  self.device_sysfs_path)
+        print('bInterval of device:', b_interval)
+
+        return b_interval if b_interval is not None else ''
 
     # if a user chooses to share and upload his/her measurement results, additional data like the users name and
     # email-adress will be saved to the csv file
@@ -493,212 +688,184 @@ class LatencyGUI(QtWidgets.QWizard):
             if len(self.email) > Constants.TEXT_INPUT_MAX_CHARS:
                 self.email = self.email[:Constants.TEXT_INPUT_MAX_CHARS]
 
-        # Update data in existing csv file:
-        # https://stackoverflow.com/questions/14471049/python-2-7-1-how-to-open-edit-and-close-a-csv-file
-
+        # Update the metadata in the header of the existing csv file. The measurements themselves are not touched
         if include_personal_information:
-            changes = {  # a dictionary of changes to make
-                '#author:;': '#author:;' + self.authors,
-                '#email:;': '#email:;' + self.email,
-                '#public:;': '#public:;' + str(self.publish_names),
-                '#notes:;': '#notes:;' + self.additional_notes.replace("\n", " ")
-            }
+            changes = MeasurementWorkflow.create_personal_metadata(self.authors, self.email, self.publish_names,
+                                                                   self.additional_notes)
         else:
-            changes = {  # a dictionary of changes to make
-                '#vendorId:;': '#vendorId:;' + self.vendor_id,
-                '#productId:;': '#productId:;' + self.product_id,
-                '#date:;': '#date:;' + datetime.today().strftime('%d-%m-%Y'),
-                '#bInterval:;': '#bInterval:;' + str(self.get_device_bInterval()),
-                '#deviceType:;': '#deviceType:;' + str(self.device_type),
-                '#EAN:;': '#EAN:;' + self.ui.lineEdit_ean_upc.text(),
-                '#deviceSpeed:;': '#deviceSpeed:;' + self.device_speed
-            }
-
-        new_rows = []  # a holder for our modified rows when we make them
-
-        with open(self.output_file_path, 'r') as f:
-            reader = csv.reader(f)  # pass the file to our csv reader
-            for row in reader:  # iterate over the rows in the file
-                new_row = row  # at first, just copy the row
-                for key, value in changes.items():  # iterate over 'changes' dictionary
-                    new_row = [x.replace(key, value) for x in new_row]  # make the substitutions
-                new_rows.append(new_row)  # add the modified rows
-
-        with open(self.output_file_path, 'w') as f:
-            # Overwrite the old file with the modified rows
-            writer = csv.writer(f)
-            writer.writerows(new_rows)
+            changes = MeasurementWorkflow.create_device_metadata(self.vendor_id, self.product_id,
+                                                                 self.get_device_bInterval(), self.device_type,
+                                                                 self.ui.lineEdit_ean_upc.text(), self.device_speed)
+
+        with Tracing.tracer.span('metadata', personal=include_personal_information):
+            LogFile.update_metadata(self.output_file_path, changes)
+            with Tracing.tracer.span('index'):
+                ResultsIndex.index_log(self.output_file_path)  # Replaces the entry of the log if it was indexed before
 
         # Only upload if function is called by the specific UI Page
         if include_personal_information:
             print('Ready to upload measurement')
             self.upload_measurement()
 
-    # Upload the newly created .csv file of the latest measurement
+    # Upload the newly created .csv file of the latest measurement. The log is added to the upload queue first, so it
+    # is not lost if the upload fails. It is sent again on the next start of the application in that case.
     def upload_measurement(self):
-        files = {
-            'bureaucracy[0]': (self.output_file_path, open(self.output_file_path, 'rb')),
-            'bureaucracy[1]': (None, self.authors),
-            'bureaucracy[2]': (None, self.email),
-            'bureaucracy[3]': (None, str(self.publish_names is True)),  # Convert "True"/"False" to 1 or 0
-            'bureaucracy[4]': (None, 'Comments'),
-            'bureaucracy[$$id]': (None, '1'),  # ???
-            'id': (None, 'projects:latency:upload')
-        }
-
         try:
-            response = requests.post('https://hci.ur.de/projects/latency/upload', files=files)
-            print(response.status_code, response.reason)
-        # https://stackoverflow.com/questions/16511337/correct-way-to-try-except-using-python-requests-module
-        except requests.exceptions.HTTPError as errh:
-            print("Http Error:", errh)
-        except requests.exceptions.ConnectionError as errc:
-            print("Error Connecting:", errc)
-        except requests.exceptions.Timeout as errt:
-            print("Timeout Error:", errt)
-        except requests.exceptions.RequestException as err:
-            print("Request Exception", err)
-
-    # Extract all USB devices connected to the computer and save the details of each device as an object
-    def extract_relevant_devices(self, devices):
-        device_names = []
-        for device in devices:
-            if 'usb' in device[2]:  # Only accept devices if they are listed as usb devices
-                vendor_id = device[0].split(' ')[2].replace('Vendor=', '')
-                product_id = device[0].split(' ')[3].replace('Product=', '')
-                name = device[1].replace('"', '').replace('N: Name=', '')
-                device_id = self.get_device_id(device[5])
-                device_type_auto_detected = self.get_device_type(device[5])
-
-                # The fourth row of the device info (device[3]) contains the device id needed to request info about the
-                # devices speed
-                device_speed = self.get_device_speed(device[3])
-
-                device_already_in_list = False
-                for existing_device in self.device_objects:
-                    if existing_device.name == name:
-                        device_already_in_list = True
-
-                # TODO: under cat /proc/bus/input/devices, a device sometimes appears multiple times.
-                # Select and display only the correct device
-                if not device_already_in_list:
-                    device_names.append(name)
-                    self.device_objects.append(Device(vendor_id, product_id, name, device_id, device_type_auto_detected,
-                                                      device_speed))
-
-        self.init_combobox_device(device_names)
-
-    # Request the device speed of the current USB device
-    def get_device_speed(self, device_data):
-        device_information = device_data.split('/')[1:6]
-        command = 'cat /sys/' + device_information[0] + '/' + device_information[1] + '/' + \
-                  device_information[2] + '/' + device_information[3] + '/' + device_information[4] + '/speed'
-        print(command)
-
-        process = Popen(command, shell=True, stdin=PIPE, stdout=PIPE, stderr=STDOUT, close_fds=True)
-        device_speed = process.stdout.readline().decode("utf-8") + 'M'
-        device_speed = device_speed.replace("\n", " ").replace(' ', '')
-        print('Speed: ' + device_speed)
-
-        return device_speed
-
-
-    # Extract the ID of the device (eventXX) from the device details by searching for the corresponding keyword
-    def get_device_id(self, line):
-        for part in line.split(' '):
-            if 'event' in part:
-                return part
-
-    # Auto-detect the type of the device by searching for the corresponding keywords in the device details
-    def get_device_type(self, line):
-        if 'kbd' in line:
-            return 'Keyboard (auto-detected)'
-        if 'mouse' in line:
-            return 'Mouse (auto-detected)'
-        if 'js' in line:
-            return 'Gamepad (auto-detected)'
-        return None
-
-    # This function will listen for all key inputs of a given device. As soon as the first key-down press is detected,
-    # The detection loop will end.
-    def scan_key_inputs(self):
-        print('Starting Key Detection')
+            file_hash, is_new = self.upload_service.enqueue(self.output_file_path, self.authors, self.email,
+                                                            self.publish_names is True)
+        except OSError as e:
+            print('Could not add measurement to the upload queue:', e)
+            return
+
+        if not is_new:
+            print('Measurement has already been uploaded or is queued:', file_hash)
+        self.upload_pending_measurements()
+
+    # Send all queued uploads (including those of previous sessions) in the background
+    def upload_pending_measurements(self):
+        if len(self.upload_service.get_pending()) > 0:
+            self.upload_started = time.perf_counter()
+            future = self.upload_service.upload_pending()
+            future.add_done_callback(self.upload_finished.emit)
+
+    @pyqtSlot(object)
+    def on_upload_finished(self, future):
         try:
-            device = evdev.InputDevice('/dev/input/' + str(self.device_id))
-
-            while self.scan_for_key_inputs:
-                event = device.read_one()  # Get current event
-                if event is not None:
-                    if event.type == evdev.ecodes.EV_KEY:  # Check if the current event is a button press
-                        key_event = evdev.categorize(event)
-                        if key_event.keystate:  # Check if button is pressed down
-                            self.button_code = key_event.scancode
-                            self.ui.label_pressed_button_id.setText(str(self.button_code))
-                            self.ui.button_restart_measurement.setText('Restart Button Detection')
-                            self.ui.button_restart_measurement.setEnabled(True)
-                            self.ui.button(QtWidgets.QWizard.NextButton).setEnabled(True)
-                            self.scan_for_key_inputs = False
-                            return
-
-        except PermissionError as error:
-            print(error)
+            num_uploaded, num_remaining = future.result()
+            print(num_uploaded, 'measurements uploaded,', num_remaining, 'remaining in the upload queue')
+            Tracing.tracer.record('upload', self.upload_started, uploaded=num_uploaded, remaining=num_remaining)
+        except Exception as e:
+            print('Upload failed:', e)
 
     def create_data_plot(self):
+        import DataPlotter  # Usually already imported by warm_up_modules
+
         self.dataplotter = DataPlotter.DataPlotter()
-        self.stats = self.dataplotter.process_filedata(self.output_file_path)
+        # The summary was calculated while measuring and the confidence intervals in the thread of the measurement. The
+        # log is only read again for the plot and to check that it contains the same measurements
+        with Tracing.tracer.span('analysis'):
+            self.stats = self.dataplotter.process_filedata(self.output_file_path,
+                                                           self.measurement_thread.live_stats.summary(), plot=False,
+                                                           intervals=self.measurement_thread.intervals)
+
+        # Rendering the plot can take a while, so it runs in a worker process and the results are displayed right away.
+        # The preview at display resolution comes first, the publication plots are rendered after it
+        self.plot_started = time.perf_counter()
+        future = self.plot_renderer.submit_preview(self.output_file_path, self.dataplotter.latencies)
+        future.add_done_callback(self.plot_finished.emit)
+        self.publication_futures = [
+            self.plot_renderer.submit(MeasurementWorkflow.get_plot_path(self.output_file_path, extension),
+                                      self.dataplotter.latencies)
+            for extension in PlotEngine.Constants.PUBLICATION_EXTENSIONS]
+        for future in self.publication_futures:
+            future.add_done_callback(self.on_publication_plot_finished)
+
         self.init_ui_page_four()
         self.ui.next()
 
+    @pyqtSlot(object)
+    def on_plot_finished(self, future):
+        Tracing.tracer.record('plot_preview', self.plot_started)
+        try:
+            preview_path = future.result()
+            if preview_path is None:
+                self.ui.label_image.setText('[COULD NOT DISPLAY PLOT]')
+                return
+            # The preview already has about the size of the label, so it usually does not need to be scaled
+            image = QPixmap(preview_path)
+            if image.width() > self.ui.label_image.width() or image.height() > self.ui.label_image.height():
+                image = image.scaled(self.ui.label_image.width(), self.ui.label_image.height(), Qt.KeepAspectRatio,
+                                     Qt.SmoothTransformation)
+            self.ui.label_image.setPixmap(image)
+        except Exception as e:
+            print('PLOT IMAGE NOT AVAILABLE!', e)
+
+    # Called in a thread of the PlotRenderer when a publication plot is done
+    def on_publication_plot_finished(self, future):
+        try:
+            future.result()
+        except Exception as e:
+            print('Could not save the plot:', e)
+        if future is self.publication_futures[-1]:  # The plots are rendered in the order they were submitted
+            Tracing.tracer.record('plot', self.plot_started)
+
+
+# Waits for the first button press on the given devices (event node names like event3) with a KeyScanner
+class KeyScanThread(QThread):
+
+    key_pressed = pyqtSignal('QString', int)  # Event node and code of the pressed button
 
+    def __init__(self, device_ids):
+        super().__init__()
+        self.key_scanner = KeyScanner.KeyScanner([os.path.join(KeyScanner.Constants.INPUT_DEVICE_DIRECTORY, device_id)
+                                                  for device_id in device_ids])
+
+    def cancel(self):
+        self.key_scanner.cancel()
+
+    def run(self):
+        print('Starting Key Detection')
+        try:
+            result = self.key_scanner.wait_for_key_press()
+        finally:
+            self.key_scanner.close()
+        if result is not None:
+            device_path, button_code = result
+            self.key_pressed.emit(os.path.basename(device_path), button_code)
+
+
+# Runs a MeasurementWorkflow.Measurement in the background and reports its progress with signals
 class LagBoxMeasurement(QThread):
 
-    display_progress = pyqtSignal('QString', 'QString')
-    logpath_arrived = pyqtSignal('QString')
-    command = ''
+    display_progress = pyqtSignal(object)  # Latest sample record (see ProgressProtocol), at most once per frame
+    statistics_updated = pyqtSignal(object)  # Summary of LatencyStats.OnlineStats, at most once per frame
+    histogram_updated = pyqtSignal(object)  # Snapshot of LatencyStats.StreamingHistogram, at most once per frame
+    logpath_arrived = pyqtSignal('QString')  # Path of the log, emitted when the measurement is done
+    measurement_failed = pyqtSignal('QString')  # Error message
+    stop_requested = pyqtSignal('QString')  # Reason, emitted when the stop rule ends the measurement early
 
-    def __init__(self, command):
+    def __init__(self, command, stop_rule=None, histogram=None):
         super().__init__()
-        self.command = command
+        self.measurement = MeasurementWorkflow.Measurement(command, stop_rule, self.on_update,
+                                                           self.stop_requested.emit, histogram=histogram)
+        self.live_stats = self.measurement.live_stats
+        self.histogram = histogram
+        self.intervals = None  # Confidence intervals of the finished measurement (see LatencyStats.bootstrap_intervals)
 
-    # https://www.saltycrane.com/blog/2008/09/how-get-stdout-and-stderr-using-python-subprocess-module/
     def run(self):
-        print(self.command)
-
-        process = Popen(self.command, shell=True, stdin=PIPE, stdout=PIPE, stderr=STDOUT, close_fds=True)
-
-        for line in iter(process.stdout.readline, ''):
-            print(line)
-            line_id = str(line).split(',')[0].replace("b'", '')  # Convert line to String and remove the leading "b'"
-            if line_id.isdigit():  # Only count the progress if the line is actually the result of a measurement
-                self.display_progress.emit(line_id, str(line))
-            if 'done' in str(line):
-                break
-            elif 'cancelled' in str(line):
-                sys.exit('Measurement failed')
-            # At the end of the measurement, the filename and path of the created .csv file is returned.
-            # We save that path
-            elif '/log/' in str(line):
-                self.logpath_arrived.emit(str(line))
-            elif len(line) is 0:
-                sys.exit('Found an empty line in stdout. This should not happen')
-
-
-# An object representation of all relevant data about connected USB device
-class Device:
-
-    def __init__(self, vendor_id, product_id, name, device_id, device_type, device_speed):
-        self.vendor_id = vendor_id
-        self.product_id = product_id
-        self.name = name
-        self.device_id = device_id
-        self.device_type = device_type
-        self.device_speed = device_speed
+        try:
+            log_path = self.measurement.run()
+        except MeasurementWorkflow.MeasurementError as e:
+            self.measurement_failed.emit(str(e))
+            return
+
+        # The confidence intervals take too long for the GUI thread on a Raspberry Pi, so they are calculated here
+        with Tracing.tracer.span('bootstrap'):
+            self.intervals = LatencyStats.get_bootstrap_intervals(log_path, LogFile.load_log(log_path).latencies_ms())
+        self.logpath_arrived.emit(log_path)
+
+    # Called with the latest sample at most once per frame
+    def on_update(self, sample):
+        self.display_progress.emit(sample)
+        self.statistics_updated.emit(self.live_stats.summary())
+        if self.histogram is not None:
+            snapshot = self.histogram.snapshot()  # Taken in this thread, where the histogram is fed
+            if snapshot is not None:
+                self.histogram_updated.emit(snapshot)
+
+    # Ask the tool to stop after the current measurement. Returns False if it is not running
+    def abort(self, reason):
+        return self.measurement.abort(reason)
 
 
 def main():
+    PlotEngine.use_as_worker_main()  # The worker processes of the PlotRenderer do not import the GUI
     app = QtWidgets.QApplication(sys.argv)
     latencyGUI = LatencyGUI()
-    sys.exit(app.exec_())
+    exit_code = app.exec_()
+    latencyGUI.plot_renderer.shutdown()
+    latencyGUI.upload_service.shutdown()  # Uploads that are not finished yet stay in the queue
+    sys.exit(exit_code)
 
 
 if __name__ == '__main__':
@@ -1,67 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Lightweight display for the output of inputLatencyMeasureTool, e.g. on a small screen next to the LagBox:
+#
+#   ../bin/inputLatencyMeasureTool -m 3 -n 1000 -b 272 -d 2 | python latency_gui_old.py
 #
-# usage: pipe comma seperated values into this program:
-# current iteration, max iterations, last time (in ms)
+# Shows the progress, the latest latency, the running mean and median and a sparkline of the recent measurements.
+# Text output ("i,n,latency in ms") and JSON records (-json 1) are both understood (see ProgressProtocol.py).
 #
+# stdin is watched by a QSocketNotifier and read without blocking: whenever data arrives, everything that is available
+# is read at once and the display is updated once with the newest measurement, so it never falls behind the tool and
+# the window stays responsive while the tool is waiting. The output of the tool is passed on to stdout.
 
+import os
+import signal
 import sys
-import time
-from PyQt4.QtCore import *
-from PyQt4.QtGui import *
-
-#app
-application = QApplication(sys.argv)
-window = QWidget()
-layout = QVBoxLayout()
-timer = QTimer()
-
-#widgets
-progressbar = QProgressBar()
-label_iteration = QLabel()
-label_time = QLabel()
-
-def initLabels():
-    label_iteration.setFont(QFont("SansSerif", 64))
-    label_iteration.setAlignment(Qt.AlignRight)
-
-    label_time.setFont(QFont("SansSerif", 128))
-    label_time.setAlignment(Qt.AlignRight)
-
-    progressbar.setTextVisible(False)
-
-    layout.addWidget(progressbar)
-    layout.addWidget(label_iteration)
-    layout.addWidget(label_time)
-
-def showWindow():
-    window.setWindowTitle("LagBox")
-    window.setLayout(layout)
-    window.showMaximized()
-    
-def updateLabels(iteration, max_iterations, time):
-    pval = (float(iteration) / float(max_iterations)) * 100.0
-    progressbar.setValue(pval)
-    label_iteration.setText(str(iteration) + "/" + str(max_iterations))
-    label_time.setText(str(time).rstrip() + "ms")
-
-def getValues():
-    try:
-        line = sys.stdin.readline()
-        print line
-        if not line:
+from collections import deque
+
+from PyQt5.QtCore import Qt, QSocketNotifier, QPointF
+from PyQt5.QtGui import QFont, QPainter, QPen, QColor, QPolygonF
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QProgressBar, QLabel, QSizePolicy
+
+import LatencyStats  # Running mean and median
+import ProgressProtocol  # Decodes the output of the tool
+
+
+class Constants:
+    WINDOW_TITLE = 'LagBox'
+    NUM_DISPLAYED_DECIMAL_PLACES = 1
+    SPARKLINE_LENGTH = 100  # Number of recent measurements in the sparkline
+    SPARKLINE_COLOR = '#2a82da'
+
+    # Font sizes in relation to the height of the window, so the display fits any screen
+    ITERATION_FONT_RATIO = 1 / 12
+    LATENCY_FONT_RATIO = 1 / 5
+    STATS_FONT_RATIO = 1 / 18
+    MIN_FONT_SIZE = 8  # in px
+
+
+# Reads a file descriptor without blocking and decodes the progress records
+class StreamReader:
+
+    def __init__(self, file_descriptor, output=None):
+        self.file_descriptor = file_descriptor
+        self.output = output  # Binary stream that gets a copy of everything read, or None
+        self.decoder = ProgressProtocol.ProgressDecoder()
+        self.is_finished = False
+        os.set_blocking(file_descriptor, False)
+
+    # Read everything that is available. Returns the records of all complete lines
+    def read(self):
+        records = []
+        while not self.is_finished:
+            try:
+                data = os.read(self.file_descriptor, ProgressProtocol.Constants.READ_SIZE)
+            except BlockingIOError:
+                break  # Nothing more for now
+            except InterruptedError:
+                continue
+
+            if len(data) == 0:
+                self.is_finished = True  # End of the stream
+                records += self.decoder.finish()
+            else:
+                records += self.decoder.feed(data)
+                self.copy_to_output(data)
+        return records
+
+    def copy_to_output(self, data):
+        if self.output is None:
+            return
+        try:
+            self.output.write(data)
+            self.output.flush()
+        except OSError:
+            self.output = None  # E.g. stdout was closed, the display still works
+
+
+# Line of the recent latencies, scaled to their range
+class Sparkline(QWidget):
+
+    def __init__(self, values, parent=None):
+        super().__init__(parent)
+        self.values = values  # deque that is filled by the owner
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+
+    def paintEvent(self, event):
+        if len(self.values) < 2:
             return
-    except:
-        return
-    iteration, max_iterations, time = line.split(",")
-    updateLabels(iteration, max_iterations, time)
 
+        minimum = min(self.values)
+        value_range = max(self.values) - minimum or 1.0
+        margin = 2.0
+        width = self.width() - 2 * margin
+        height = self.height() - 2 * margin
+        step = width / (Constants.SPARKLINE_LENGTH - 1)
+        offset = margin + width - step * (len(self.values) - 1)  # The newest value is always at the right edge
+
+        points = QPolygonF([QPointF(offset + i * step, margin + height * (1 - (value - minimum) / value_range))
+                            for i, value in enumerate(self.values)])
+
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        pen = QPen(QColor(Constants.SPARKLINE_COLOR))
+        pen.setWidthF(1.5)
+        painter.setPen(pen)
+        painter.drawPolyline(points)
+        painter.setBrush(QColor(Constants.SPARKLINE_COLOR))
+        painter.drawEllipse(points[len(points) - 1], 3, 3)
+        painter.end()
+
+
+class LatencyDisplay(QWidget):
+
+    def __init__(self, file_descriptor):
+        super().__init__()
+        self.stats = LatencyStats.OnlineStats()
+        self.recent = deque(maxlen=Constants.SPARKLINE_LENGTH)
+        self.reader = StreamReader(file_descriptor, sys.stdout.buffer)
+
+        self.progressbar = QProgressBar()
+        self.progressbar.setTextVisible(False)
+        self.label_iteration = QLabel()
+        self.label_iteration.setAlignment(Qt.AlignRight)
+        self.label_latency = QLabel()
+        self.label_latency.setAlignment(Qt.AlignRight)
+        self.label_stats = QLabel()
+        self.label_stats.setAlignment(Qt.AlignRight)
+        self.sparkline = Sparkline(self.recent)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.progressbar)
+        layout.addWidget(self.label_iteration)
+        layout.addWidget(self.label_latency)
+        layout.addWidget(self.label_stats)
+        layout.addWidget(self.sparkline, 1)
+        self.setLayout(layout)
+        self.setWindowTitle(Constants.WINDOW_TITLE)
+
+        self.notifier = QSocketNotifier(file_descriptor, QSocketNotifier.Read, self)
+        self.notifier.activated.connect(self.on_readable)
+
+    # Called by the event loop when stdin has data (or has ended)
+    def on_readable(self):
+        latest_sample = None
+        for record in self.reader.read():
+            if record['type'] == ProgressProtocol.Constants.TYPE_SAMPLE:
+                latency = record['latency_us'] / 1000
+                self.stats.add(latency)
+                self.recent.append(latency)
+                latest_sample = record
+                continue
+
+            if latest_sample is not None:
+                self.show_sample(latest_sample)  # Before the status, which is shown below the statistics
+                latest_sample = None
+            if record['type'] == ProgressProtocol.Constants.TYPE_LOG:
+                self.set_status('Saved to ' + record['path'])
+            elif record['type'] == ProgressProtocol.Constants.TYPE_ERROR:
+                self.set_status('Error: ' + record['message'])
+            elif record['type'] == ProgressProtocol.Constants.TYPE_DONE:
+                self.setWindowTitle(Constants.WINDOW_TITLE + ' - done')
+
+        if latest_sample is not None:
+            self.show_sample(latest_sample)
+
+        if self.reader.is_finished:
+            self.notifier.setEnabled(False)  # Otherwise the notifier fires for the end of the stream again and again
+
+    def show_sample(self, sample):
+        decimals = Constants.NUM_DISPLAYED_DECIMAL_PLACES
+        self.progressbar.setMaximum(max(1, sample['n']))
+        self.progressbar.setValue(min(sample['i'], sample['n']))
+        self.label_iteration.setText('%d/%d' % (sample['i'], sample['n']))
+        self.label_latency.setText('%.*f ms' % (decimals, sample['latency_us'] / 1000))
+        self.label_stats.setText('mean %.*f ms   median %.*f ms' % (decimals, self.stats.mean, decimals,
+                                                                    self.stats.summary()['median']))
+        self.sparkline.update()
+
+    def set_status(self, text):
+        self.label_stats.setText(self.label_stats.text() + '\n' + text if self.label_stats.text() else text)
 
-initLabels()
+    def resizeEvent(self, event):
+        height = self.height()
+        for label, ratio in [(self.label_iteration, Constants.ITERATION_FONT_RATIO),
+                             (self.label_latency, Constants.LATENCY_FONT_RATIO),
+                             (self.label_stats, Constants.STATS_FONT_RATIO)]:
+            font = QFont('SansSerif')
+            font.setPixelSize(max(Constants.MIN_FONT_SIZE, round(height * ratio)))
+            label.setFont(font)
+        super().resizeEvent(event)
 
-#updateLabels(0, 100, 0)
 
-timer.timeout.connect(getValues)
-timer.start(200)
+def main():
+    signal.signal(signal.SIGINT, signal.SIG_DFL)  # Ctrl+C closes the window, Qt would not return to Python for it
+    application = QApplication(sys.argv)
+    display = LatencyDisplay(sys.stdin.fileno())
+    display.showMaximized()
+    sys.exit(application.exec_())
 
-showWindow()
 
-sys.exit(application.exec_())
+if __name__ == '__main__':
+    main()
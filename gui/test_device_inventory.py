@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Tests the scan of DeviceInventory against fixtures in fixtures/<name>:
+#   devices        a copy of /proc/bus/input/devices
+#   sys            the speed files of the USB devices, under their path in sysfs
+#   expected.json  name, vendor and product id, event node, type and speed of every device the scan has to return
+# With --record, a fixture is recorded from the devices connected to this machine (e.g. a LagBox). Its expected.json
+# is filled in from the scan and has to be checked by hand (e.g. against lsusb -v) before it is committed.
+#
+# usage: python -m unittest test_device_inventory
+#        python test_device_inventory.py --record fixtures/<name>
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import unittest
+from datetime import datetime
+
+import DeviceInventory
+
+
+class Constants:
+    FIXTURE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+    RPI3_FIXTURE = 'device_scan_rpi3'
+    PROC_FILE_NAME = 'devices'
+    SYSFS_DIRECTORY_NAME = 'sys'
+    EXPECTED_FILE_NAME = 'expected.json'
+    DEVICE_FIELDS = ['name', 'vendor_id', 'product_id', 'device_id', 'device_type', 'device_speed']
+
+
+def scan_fixture(directory):
+    inventory = DeviceInventory.DeviceInventory(os.path.join(directory, Constants.PROC_FILE_NAME),
+                                                os.path.join(directory, Constants.SYSFS_DIRECTORY_NAME))
+    return [{field: getattr(device, field) for field in Constants.DEVICE_FIELDS} for device in inventory.scan()]
+
+
+def load_expected(directory):
+    with open(os.path.join(directory, Constants.EXPECTED_FILE_NAME), 'r') as file:
+        return json.load(file)['devices']
+
+
+# Copy /proc/bus/input/devices and the speed files of all USB devices along the sysfs paths of the input devices
+def record_fixture(directory):
+    os.makedirs(directory, exist_ok=True)
+    shutil.copyfile(DeviceInventory.Constants.PROC_INPUT_DEVICES, os.path.join(directory, Constants.PROC_FILE_NAME))
+
+    with open(DeviceInventory.Constants.PROC_INPUT_DEVICES, 'r') as file:
+        entries = DeviceInventory.parse_input_devices(file.read())
+    for entry in entries:
+        path = entry.get('Sysfs', '')
+        while path not in ('', '/'):
+            speed_path = os.path.join(DeviceInventory.Constants.SYSFS_ROOT, path.lstrip('/'), 'speed')
+            if os.path.exists(speed_path):
+                target = os.path.join(directory, Constants.SYSFS_DIRECTORY_NAME, path.lstrip('/'))
+                os.makedirs(target, exist_ok=True)
+                shutil.copyfile(speed_path, os.path.join(target, 'speed'))
+            path = os.path.dirname(path)
+
+    expected = {'source': 'Recorded on %s on %s' % (socket.gethostname(), datetime.today().strftime('%d-%m-%Y')),
+                'devices': scan_fixture(directory)}
+    with open(os.path.join(directory, Constants.EXPECTED_FILE_NAME), 'w') as file:
+        json.dump(expected, file, indent=1)
+    return expected['devices']
+
+
+class DeviceScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = os.path.join(Constants.FIXTURE_DIRECTORY, Constants.RPI3_FIXTURE)
+
+    def test_scan_matches_expected_devices(self):
+        self.assertEqual(scan_fixture(self.directory), load_expected(self.directory))
+
+    def test_scan_keeps_usb_devices_only(self):
+        devices = scan_fixture(self.directory)
+        names = [device['name'] for device in devices]
+        self.assertNotIn('vc4-hdmi', names)  # Not connected via USB
+        self.assertEqual(names.count('Razer Razer DeathAdder Chroma'), 1)  # Its keyboard interface has the same name
+        self.assertEqual([device['device_speed'] for device in devices], ['1.5M', '1.5M', '1.5M', '12M'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record', metavar='DIRECTORY', help='record a fixture from the connected devices')
+    args, unittest_args = parser.parse_known_args()
+
+    if args.record is None:
+        unittest.main(argv=[parser.prog] + unittest_args)
+        return
+    for device in record_fixture(args.record):
+        print(device)
+    print('Fixture recorded to', args.record)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,12 @@
 #include "fileLog.h"
 #include "sys/stat.h"
 #include <time.h>
+#include <string.h>
 
 FILE *logFile_automode;
 
+char g_szLogFilePath[256];
+
 int getPollingRate()
 {
 	FILE * cmdlinetxt;
@@ -36,6 +39,8 @@ void writeFileHeader(FILE *file, struct TestParams params)
 	fprintf(file, "#minDelay:;%d\n", params.minDelay);
 	fprintf(file, "#maxDelay:;%d\n", params.maxDelay);
 	fprintf(file, "#iterations:;%d\n", params.iterations);
+	fprintf(file, "#stoppedEarly:;%d\n", params.stoppedEarly);
+	fprintf(file, "#stopReason:;\n");
     
     fprintf(file, "#author:;\n");
     fprintf(file, "#vendorId:;\n");
@@ -80,6 +85,10 @@ void logAutoModeData(struct TestParams params, struct AutoModeData *data, unsign
     memcpy(params.device, filteredName, strlen(filteredName));
 
 	FILE *logFile = openLogFile(filteredName, STR_AUTOMODE);
+	if (logFile == NULL)
+	{
+		return;
+	}
 
     writeFileHeader(logFile, params);
 
@@ -126,14 +135,17 @@ FILE *openLogFile(char *pszFileName, char *mode)
 		sprintf(path, "../log/%s_%s_%dms_%d.csv", mode, filteredName, pollingRate, logfileNumber);
 	}
 
-    printf("%s\n", path);
+	// the path is reported by the caller once the file has been written completely
+	strcpy(g_szLogFilePath, path);
 
 	logFile = fopen(path, "w+");
 	if (logFile == NULL)
 	{
-		printf("Error opening log file\n");
-		return;
+		printError("Error opening log file");
+		g_szLogFilePath[0] = 0;
 	}
+
+	return logFile;
 }
 
 void closeLogFile(FILE *file)
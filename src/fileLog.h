@@ -10,6 +10,9 @@
 
 extern FILE *g_pLogFile;
 
+// path of the log file opened last by openLogFile
+extern char g_szLogFilePath[256];
+
 /*
  * Method:    Writes data of latencies struct to the file (g_pLogFile)
  * Returns:   void
@@ -35,6 +35,7 @@
 #include <stdarg.h>
 #include <pthread.h>
 #include <math.h>
+#include <signal.h>
 
 // Project includes
 #include "inputLatencyMeasureTool.h"
@@ -69,6 +70,11 @@ int *delayList;
 
 int selectedDevice = 0;
 
+int g_outputFormat = OUTPUT_TEXT;
+
+// set by SIGUSR1: the measurement ends after the current sample and the log is written with the samples so far
+volatile sig_atomic_t g_bStopRequested = 0;
+
 long long getCurTime_microseconds(int clk_id)
 {
 	struct timeval gettime_now;
@@ -87,7 +93,13 @@ long long timevalToMicroSeconds(struct timeval *tv)
 	return (long long) tv->tv_sec * 1000000l + (long long)tv->tv_usec;
 }
 
-void autoMode(struct AutoModeData *results, unsigned int iterations)
+void onStopRequested(int signum)
+{
+	g_bStopRequested = 1;
+}
+
+// returns the number of samples that were measured (less than iterations if a stop was requested)
+int autoMode(struct AutoModeData *results, unsigned int iterations)
 {
 	long long dUSBEventTimestamp;
 	long long dStartTime;
@@ -95,7 +107,8 @@ void autoMode(struct AutoModeData *results, unsigned int iterations)
 
 	debug("starting auto mode\n");
 
-	for (int i = 0; i < iterations; i++)
+	int i;
+	for (i = 0; i < iterations && !g_bStopRequested; i++)
 	{
 		debug("iteration %d \n", i);
 		digitalWrite(PIN_AUTO_MODE, LOW);
@@ -103,7 +116,7 @@ void autoMode(struct AutoModeData *results, unsigned int iterations)
 
 		while (1)
 		{
-			if(isButtonReleased(NULL)) break;
+			if(isButtonReleased(NULL) || g_bStopRequested) break;
 			usleep(10);
 		}
 		
@@ -115,6 +128,9 @@ void autoMode(struct AutoModeData *results, unsigned int iterations)
 		// make sure we aren't synced
 		usleep(delayList[i]);
 
+		// the signal interrupts usleep, so the delay of this sample would be wrong
+		if(g_bStopRequested) break;
+
 		dStartTime = getCurTime_microseconds(CLOCK_REALTIME); 
 		digitalWrite(PIN_AUTO_MODE, HIGH);
 
@@ -125,7 +141,7 @@ void autoMode(struct AutoModeData *results, unsigned int iterations)
 				dUSBEventTimestamp = getCurTime_microseconds(CLOCK_REALTIME);
 				diff = (dUSBEventTimestamp - dStartTime); // double
 				debug("-- %f s - %f s  = %f ms \n", dStartTime / 1000000.0, dUSBEventTimestamp / 1000000.0, diff / 1000.0); //print results
-				printf("%d,%d,%f\n", i+1, iterations, diff/1000.0);
+				printSample(i+1, iterations, diff, delayList[i]);
 
 				struct AutoModeData data;
 				data.counter = i;
@@ -149,6 +165,8 @@ void autoMode(struct AutoModeData *results, unsigned int iterations)
 	}
 
 	digitalWrite(PIN_AUTO_MODE, LOW);
+
+	return i;
 }
 
 int checkButtonState(long long* timestamp)
@@ -325,10 +343,91 @@ void debug(const char* format, ...)
 	va_end(args);
 }
 
+// print a string as JSON string literal (with quotes)
+void printJsonString(const char *string)
+{
+	putchar('"');
+	for(const unsigned char *c = (const unsigned char *) string; *c != 0; c++)
+	{
+		if(*c == '"' || *c == '\\') printf("\\%c", *c);
+		else if(*c < 0x20) printf("\\u%04x", *c);
+		else putchar(*c);
+	}
+	putchar('"');
+}
+
+// report a single measurement to the GUI
+void printSample(int counter, int iterations, long long diff, int delayTime)
+{
+	if(g_outputFormat == OUTPUT_JSON)
+	{
+		printf("{\"type\":\"sample\",\"i\":%d,\"n\":%d,\"latency_us\":%lld,\"delay_us\":%d}\n",
+			counter, iterations, diff, delayTime);
+	}
+	else
+	{
+		printf("%d,%d,%f\n", counter, iterations, diff/1000.0);
+	}
+}
+
+// report the path of the log file after it has been written completely
+void printLogPath(const char *path)
+{
+	if(g_outputFormat == OUTPUT_JSON)
+	{
+		printf("{\"type\":\"log\",\"path\":");
+		printJsonString(path);
+		printf("}\n");
+	}
+	else
+	{
+		printf("%s\n", path);
+	}
+}
+
+void printError(const char *message)
+{
+	if(g_outputFormat == OUTPUT_JSON)
+	{
+		printf("{\"type\":\"error\",\"message\":");
+		printJsonString(message);
+		printf("}\n");
+	}
+	else
+	{
+		printf("cancelled: %s\n", message);
+	}
+}
+
+void printDone(const char *device)
+{
+	if(g_outputFormat == OUTPUT_JSON)
+	{
+		printf("{\"type\":\"done\",\"device\":");
+		printJsonString(device);
+		printf("}\n");
+	}
+	else
+	{
+		printf("%s\n", device);
+		printf("done\n");
+	}
+}
+
 int main(int argc, char *argv[])
 {
 	srand(time(NULL));
 
+	// stdout is usually a pipe to the GUI, which needs every line as soon as it is written
+	setvbuf(stdout, NULL, _IOLBF, 0);
+
+	// the GUI sends SIGUSR1 to end a measurement early once its results are precise enough
+	struct sigaction stopAction;
+	memset(&stopAction, 0, sizeof(stopAction));
+	stopAction.sa_handler = onStopRequested;
+	sigemptyset(&stopAction.sa_mask);
+	sigaction(SIGUSR1, &stopAction, NULL);
+
 	wiringPiSetup();
 
 	setupPins();
@@ -387,12 +486,17 @@ int main(int argc, char *argv[])
 				customDeviceNameSet = 1;
 				strcpy(customDeviceName, argv[i+1]);
 			}
+			if(strcmp(argv[i], "-json") == 0)
+			{
+				g_outputFormat = atoi(argv[i+1]) ? OUTPUT_JSON : OUTPUT_TEXT;
+			}
 		}
 	}
 	else
 	{
 		debug("Invalid number of arguments!\n");
 		debug("Cancelling...\n");
+		printError("Invalid number of arguments");
 		return 0;
 	}
 	
@@ -412,6 +516,7 @@ int main(int argc, char *argv[])
 	{
 		debug("Invalid params!\n");
 		debug("Cancelling...\n");
+		printError("Invalid params");
 		return 0;
 	}
 
@@ -458,6 +563,14 @@ int main(int argc, char *argv[])
 
 			start();
 
+			if(g_iInputFD < 0)
+			{
+				printError("Device not found");
+				free(resultData);
+				free(delayList);
+				return 1;
+			}
+
 			params.mode = 3;
 			params.iterations = g_testIterations;
 			params.minDelay = minDelay;
@@ -466,12 +579,21 @@ int main(int argc, char *argv[])
 			else sprintf(params.device, "%s", g_szDeviceName);
 			params.buttonCode = g_iButtonCode;
 
-			autoMode(resultData, g_testIterations);
+			int completedIterations = autoMode(resultData, g_testIterations);
+			params.stoppedEarly = completedIterations < g_testIterations;
 
-			logAutoModeData(params, resultData, g_testIterations);
+			logAutoModeData(params, resultData, completedIterations);
+
+			if(g_szLogFilePath[0] == 0)
+			{
+				// the error has already been reported by openLogFile
+				free(resultData);
+				free(delayList);
+				return 1;
+			}
 
-            printf("%s\n", params.device);
-            printf("done\n");
+			printLogPath(g_szLogFilePath);
+			printDone(params.device);
 
 			free(resultData);
 			free(delayList);
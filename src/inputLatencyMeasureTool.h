@@ -40,6 +40,10 @@ enum INPUT_DEVICES
 
 #define MAX_LOG_DATA 4096
 
+// Format of the progress written to stdout (selected with -json)
+#define OUTPUT_TEXT 0 // "i,n,latency in ms" per sample, then log path, device name and "done"
+#define OUTPUT_JSON 1 // one JSON record per line: sample, log, error and done
+
 
 struct MenuIdRelName
 {
@@ -63,6 +67,7 @@ struct TestParams
     int buttonCode;
     char device[256];
     int waitTime;
+    int stoppedEarly;
 };
 
 struct LogData
@@ -111,7 +116,9 @@ double timevalToSeconds(struct timeval *tv);
 
 long long timevalToMicroSeconds(struct timeval *tv);
 
-void autoMode(struct AutoModeData *results, unsigned int iterations);
+void onStopRequested(int signum);
+
+int autoMode(struct AutoModeData *results, unsigned int iterations);
 
 int checkButtonState(long long* timestamp);
 
@@ -135,6 +142,16 @@ int clearInputEvents();
 
 void debug(const char* format, ...);
 
+void printJsonString(const char *string);
+
+void printSample(int counter, int iterations, long long diff, int delayTime);
+
+void printLogPath(const char *path);
+
+void printError(const char *message);
+
+void printDone(const char *device);
+
 int main(int argc, char *argv[]);
 
 extern int g_bRestartProgram;